@@ -1,16 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query
+from app.metrics import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import Dict, Iterable, List, Optional
 from pydantic import BaseModel
+from datetime import date
+from app.lazy import optional_module
+from app.repository import get_repository
+from app.reports.cache import report_cache
+from app.serialization import list_response
+import csv
+import io
 
 router = APIRouter(prefix="/attendance", tags=["Attendance"])
 
 # Example role-based dependency
-def get_current_user_role():
+async def get_current_user_role():
     # Placeholder: Replace with actual authentication logic
     return "employee"
 
 def require_role(roles: List[str]):
-    def role_checker(role: str = Depends(get_current_user_role)):
+    async def role_checker(role: str = Depends(get_current_user_role)):
         if role not in roles:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient permissions")
     return role_checker
@@ -31,33 +40,58 @@ class AttendanceUpdate(BaseModel):
 class Attendance(AttendanceBase):
     id: int
 
-# In-memory DB placeholder
-attendance_db = {}
+# The compound indexes serve the filtered status counts (summary, trend, KPI).
+# With the memory backend only recent months are kept in memory (app.partitions),
+# as compact rows sharing the repeated employee ids, dates and statuses
+attendance_repo = get_repository("attendance", Attendance, indexes=(
+    "employee_id", "date", "status", ("employee_id", "date", "status"), ("date", "status"),
+), partition_by="date", compact=("employee_id", "date", "status"))
+
+async def attendance_filters(
+    employee_id: Optional[int] = None,
+    department: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    status: Optional[str] = None
+) -> Dict:
+    filters = {}
+    if employee_id is not None:
+        filters["employee_id"] = employee_id
+    if department is not None:
+        # For department, need to join with employees
+        try:
+            from app.employee.routes import employee_repo
+            dept_emp_ids = [e.id for e in await employee_repo.list({"department": department})]
+            if employee_id is None:
+                filters["employee_id"] = {"$in": dept_emp_ids}
+            elif employee_id not in dept_emp_ids:
+                filters["employee_id"] = {"$in": []}
+        except ImportError:
+            pass
+    if status is not None:
+        filters["status"] = status
+    if start_date is not None or end_date is not None:
+        filters["date"] = {}
+        if start_date is not None:
+            filters["date"]["$gte"] = start_date
+        if end_date is not None:
+            filters["date"]["$lte"] = end_date
+    return filters
 
 @router.get("", response_model=List[Attendance])
-def list_attendance(
+async def list_attendance(
     employee_id: Optional[int] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     status: Optional[str] = None,
     role: str = Depends(get_current_user_role)
 ):
-    records = list(attendance_db.values())
-    if employee_id is not None:
-        records = [r for r in records if r.employee_id == employee_id]
-    if status is not None:
-        records = [r for r in records if r.status == status]
-    if start_date is not None:
-        records = [r for r in records if r.date >= start_date]
-    if end_date is not None:
-        records = [r for r in records if r.date <= end_date]
-    return records
+    filters = await attendance_filters(employee_id=employee_id, start_date=start_date, end_date=end_date, status=status)
+    return await list_response(attendance_repo, filters)
 
 @router.post("", response_model=Attendance, status_code=status.HTTP_201_CREATED, dependencies=[Depends(require_role(["admin", "manager"]))])
-def add_attendance(attendance: AttendanceCreate):
-    new_id = len(attendance_db) + 1
-    record = Attendance(id=new_id, **attendance.dict())
-    attendance_db[new_id] = record
+async def add_attendance(attendance: AttendanceCreate):
+    record = await attendance_repo.insert(attendance.dict())
     try:
         from app.notifications.logic import create_notification
         if record.status == "late":
@@ -70,20 +104,18 @@ def add_attendance(attendance: AttendanceCreate):
         pass
     return record
 
-@router.get("/{attendance_id}", response_model=Attendance)
-def get_attendance(attendance_id: int):
-    record = attendance_db.get(attendance_id)
+@router.get("/{attendance_id:int}", response_model=Attendance)
+async def get_attendance(attendance_id: int):
+    record = await attendance_repo.get(attendance_id)
     if not record:
         raise HTTPException(status_code=404, detail="Attendance not found")
     return record
 
-@router.put("/{attendance_id}", response_model=Attendance, dependencies=[Depends(require_role(["admin", "manager"]))])
-def update_attendance(attendance_id: int, update: AttendanceUpdate):
-    record = attendance_db.get(attendance_id)
-    if not record:
+@router.put("/{attendance_id:int}", response_model=Attendance, dependencies=[Depends(require_role(["admin", "manager"]))])
+async def update_attendance(attendance_id: int, update: AttendanceUpdate):
+    updated = await attendance_repo.update(attendance_id, update.dict(exclude_unset=True))
+    if not updated:
         raise HTTPException(status_code=404, detail="Attendance not found")
-    updated = record.copy(update=update.dict(exclude_unset=True))
-    attendance_db[attendance_id] = updated
     try:
         from app.notifications.logic import create_notification
         if update.status == "late":
@@ -96,11 +128,10 @@ def update_attendance(attendance_id: int, update: AttendanceUpdate):
         pass
     return updated
 
-@router.delete("/{attendance_id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(require_role(["admin"]))])
-def delete_attendance(attendance_id: int):
-    if attendance_id not in attendance_db:
+@router.delete("/{attendance_id:int}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(require_role(["admin"]))])
+async def delete_attendance(attendance_id: int):
+    if not await attendance_repo.delete(attendance_id):
         raise HTTPException(status_code=404, detail="Attendance not found")
-    del attendance_db[attendance_id]
     return None
 
 
@@ -122,14 +153,11 @@ class CorrectionRequest(CorrectionRequestBase):
     status: str  # pending, approved, rejected
     manager_notes: Optional[str] = None
 
-# In-memory DB placeholder for correction requests
-correction_request_db = {}
+correction_request_repo = get_repository("attendance_corrections", CorrectionRequest, indexes=("status",))
 
 @router.post("/corrections", response_model=CorrectionRequest, status_code=status.HTTP_201_CREATED, dependencies=[Depends(require_role(["employee"]))])
-def submit_correction_request(request: CorrectionRequestCreate):
-    new_id = len(correction_request_db) + 1
-    record = CorrectionRequest(id=new_id, status="pending", **request.dict())
-    correction_request_db[new_id] = record
+async def submit_correction_request(request: CorrectionRequestCreate):
+    record = await correction_request_repo.insert({"status": "pending", **request.dict()})
     try:
         from app.notifications.logic import create_notification
         create_notification(user_id=1, message=f"Attendance correction requested by employee {record.employee_id} for attendance {record.attendance_id}.", type_="correction_requested", related_attendance=record.attendance_id)
@@ -139,29 +167,24 @@ def submit_correction_request(request: CorrectionRequestCreate):
     return record
 
 @router.get("/corrections", response_model=List[CorrectionRequest], dependencies=[Depends(require_role(["admin", "manager"]))])
-def list_correction_requests():
-    return list(correction_request_db.values())
+async def list_correction_requests():
+    return await correction_request_repo.list()
 
 @router.get("/corrections/{request_id}", response_model=CorrectionRequest)
-def get_correction_request(request_id: int):
-    record = correction_request_db.get(request_id)
+async def get_correction_request(request_id: int):
+    record = await correction_request_repo.get(request_id)
     if not record:
         raise HTTPException(status_code=404, detail="Correction request not found")
     return record
 
 @router.put("/corrections/{request_id}", response_model=CorrectionRequest, dependencies=[Depends(require_role(["admin", "manager"]))])
-def update_correction_request(request_id: int, update: CorrectionRequestUpdate):
-    record = correction_request_db.get(request_id)
-    if not record:
+async def update_correction_request(request_id: int, update: CorrectionRequestUpdate):
+    updated = await correction_request_repo.update(request_id, update.dict(exclude_unset=True))
+    if not updated:
         raise HTTPException(status_code=404, detail="Correction request not found")
-    updated = record.copy(update=update.dict(exclude_unset=True))
     # If status is approved, update the attendance record
     if update.status == "approved":
-        att = attendance_db.get(updated.attendance_id)
-        if att:
-            att = att.copy(update={"status": updated.requested_status})
-            attendance_db[updated.attendance_id] = att
-    correction_request_db[request_id] = updated
+        await attendance_repo.update(updated.attendance_id, {"status": updated.requested_status})
     try:
         from app.notifications.logic import create_notification
         if update.status == "approved":
@@ -173,57 +196,66 @@ def update_correction_request(request_id: int, update: CorrectionRequestUpdate):
     return updated
 
 @router.post("/bulk_upload", status_code=status.HTTP_201_CREATED, dependencies=[Depends(require_role(["admin", "manager"]))])
-def bulk_upload_attendance(file: UploadFile = File(...)):
+async def bulk_upload_attendance(file: UploadFile = File(...)):
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="Only CSV files are supported")
-    content = file.file.read().decode('utf-8')
+    content = (await file.read()).decode('utf-8')
     reader = csv.DictReader(io.StringIO(content))
-    new_records = []
+    rows = []
     for row in reader:
         try:
-            employee_id = int(row['employee_id'])
-            date = row['date']
-            status_ = row['status']
-            notes = row.get('notes')
-            new_id = len(attendance_db) + 1
-            record = Attendance(id=new_id, employee_id=employee_id, date=date, status=status_, notes=notes)
-            attendance_db[new_id] = record
-            new_records.append(record)
+            rows.append(AttendanceCreate(employee_id=int(row['employee_id']), date=row['date'], status=row['status'], notes=row.get('notes')).dict())
         except Exception as e:
             continue  # Optionally collect errors for reporting
+    # One id reservation and one write for the whole file
+    new_records = await attendance_repo.bulk_insert(rows)
     return {"inserted": len(new_records)}
 
 @router.get("/report/export", dependencies=[Depends(require_role(["admin", "manager"]))])
-def export_attendance_report(
+async def export_attendance_report(
     employee_id: Optional[int] = None,
     department: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     format: str = Query("csv", enum=["csv", "excel", "pdf"])
 ):
-    records = list(attendance_db.values())
-    if employee_id is not None:
-        records = [r for r in records if r.employee_id == employee_id]
-    if department is not None:
-        try:
-            from app.employee.routes import employee_db
-            dept_emp_ids = [e.id for e in employee_db.values() if getattr(e, "department", None) == department]
-            records = [r for r in records if r.employee_id in dept_emp_ids]
-        except ImportError:
-            pass
-    if start_date is not None:
-        records = [r for r in records if r.date >= start_date]
-    if end_date is not None:
-        records = [r for r in records if r.date <= end_date]
+    async def compute():
+        filters = await attendance_filters(employee_id, department, start_date, end_date)
+        records = await attendance_repo.list(filters)
+        # Excel and PDF rendering is CPU-bound, keep it off the event loop
+        return await run_in_threadpool(render_attendance_report, records, format)
+    content = await report_cache.get_or_compute(
+        "attendance.export",
+        dict(employee_id=employee_id, department=department, start_date=start_date, end_date=end_date, format=format),
+        report_sources(department),
+        compute,
+    )
+    media_type, filename = REPORT_FORMATS[format]
+    return StreamingResponse(io.BytesIO(content), media_type=media_type, headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+REPORT_FORMATS = {
+    "csv": ("text/csv", "attendance_report.csv"),
+    "excel": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "attendance_report.xlsx"),
+    "pdf": ("application/pdf", "attendance_report.pdf"),
+}
+
+def report_sources(department: Optional[str] = None):
+    # A department filter is resolved through the employee directory
+    if department is None:
+        return [attendance_repo]
+    from app.employee.routes import employee_repo
+    return [attendance_repo, employee_repo]
+
+def render_attendance_report(records: Iterable[Attendance], format: str) -> bytes:
     if format == "csv":
         output = io.StringIO()
         writer = csv.writer(output)
         writer.writerow(["id", "employee_id", "date", "status", "notes"])
         for a in records:
             writer.writerow([a.id, a.employee_id, a.date, a.status, a.notes or ""])
-        output.seek(0)
-        return StreamingResponse(output, media_type="text/csv", headers={"Content-Disposition": "attachment; filename=attendance_report.csv"})
+        return output.getvalue().encode()
     elif format == "excel":
+        openpyxl = optional_module("openpyxl")
         if openpyxl is None:
             raise HTTPException(status_code=500, detail="openpyxl is not installed on the server")
         wb = openpyxl.Workbook()
@@ -233,9 +265,9 @@ def export_attendance_report(
             ws.append([a.id, a.employee_id, a.date, a.status, a.notes or ""])
         output = io.BytesIO()
         wb.save(output)
-        output.seek(0)
-        return StreamingResponse(output, media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", headers={"Content-Disposition": "attachment; filename=attendance_report.xlsx"})
+        return output.getvalue()
     elif format == "pdf":
+        from fpdf import FPDF
         pdf = FPDF()
         pdf.add_page()
         pdf.set_font("Arial", size=12)
@@ -243,60 +275,53 @@ def export_attendance_report(
         pdf.ln(10)
         for a in records:
             pdf.cell(0, 10, txt=f"ID: {a.id}, Emp: {a.employee_id}, Date: {a.date}, Status: {a.status}, Notes: {a.notes or ''}", ln=True)
-        pdf_output = io.BytesIO(pdf.output(dest='S').encode('latin1'))
-        pdf_output.seek(0)
-        return StreamingResponse(pdf_output, media_type="application/pdf", headers={"Content-Disposition": "attachment; filename=attendance_report.pdf"})
+        return pdf.output(dest='S').encode('latin1')
     else:
         raise HTTPException(status_code=400, detail="Invalid format")
 
 @router.get("/kpi/today", dependencies=[Depends(require_role(["admin", "manager"]))])
-def attendance_kpi_today():
+async def attendance_kpi_today():
     today_str = date.today().isoformat()
-    present = 0
-    late = 0
-    absent = 0
-    for a in attendance_db.values():
-        if a.date == today_str:
-            if a.status == "present":
-                present += 1
-            elif a.status == "late":
-                late += 1
-            elif a.status == "absent":
-                absent += 1
-    return {"date": today_str, "present": present, "late": late, "absent": absent}
+    async def compute():
+        counts = await attendance_repo.group_count({"date": today_str}, by=["status"])
+        return {
+            "date": today_str,
+            "present": counts.get(("present",), 0),
+            "late": counts.get(("late",), 0),
+            "absent": counts.get(("absent",), 0),
+        }
+    return await report_cache.get_or_compute("attendance.kpi", {"date": today_str}, [attendance_repo], compute)
+
 
+@router.get("/partitions", dependencies=[Depends(require_role(["admin"]))])
+async def attendance_partitions():
+    stats = getattr(attendance_repo, "stats", None)
+    return stats() if stats else {"partitioned": False}
 
 @router.get("/summary", dependencies=[Depends(require_role(["admin", "manager"]))])
-def attendance_summary(
+async def attendance_summary(
     employee_id: Optional[int] = None,
     department: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None
 ):
-    # For department, need to join with employee_db
-    summary = {"present": 0, "late": 0, "absent": 0, "total": 0}
-    records = list(attendance_db.values())
-    if employee_id is not None:
-        records = [r for r in records if r.employee_id == employee_id]
-    if department is not None:
-        try:
-            from app.employee.routes import employee_db
-            dept_emp_ids = [e.id for e in employee_db.values() if getattr(e, "department", None) == department]
-            records = [r for r in records if r.employee_id in dept_emp_ids]
-        except ImportError:
-            pass
-    if start_date is not None:
-        records = [r for r in records if r.date >= start_date]
-    if end_date is not None:
-        records = [r for r in records if r.date <= end_date]
-    for r in records:
-        summary["total"] += 1
-        if r.status in summary:
-            summary[r.status] += 1
-    return summary
+    async def compute():
+        summary = {"present": 0, "late": 0, "absent": 0, "total": 0}
+        filters = await attendance_filters(employee_id, department, start_date, end_date)
+        for (status_, ), n in (await attendance_repo.group_count(filters, by=["status"])).items():
+            summary["total"] += n
+            if status_ in summary:
+                summary[status_] += n
+        return summary
+    return await report_cache.get_or_compute(
+        "attendance.summary",
+        dict(employee_id=employee_id, department=department, start_date=start_date, end_date=end_date),
+        report_sources(department),
+        compute,
+    )
 
 @router.get("/trend", dependencies=[Depends(require_role(["admin", "manager"]))])
-def attendance_trend(
+async def attendance_trend(
     employee_id: Optional[int] = None,
     department: Optional[str] = None,
     period: str = Query("weekly", enum=["weekly", "monthly"]),
@@ -304,40 +329,29 @@ def attendance_trend(
     end_date: Optional[str] = None
 ):
     # Returns trend data for plotting (e.g., per week/month)
-    records = list(attendance_db.values())
-    if employee_id is not None:
-        records = [r for r in records if r.employee_id == employee_id]
-    if department is not None:
-        try:
-            from app.employee.routes import employee_db
-            dept_emp_ids = [e.id for e in employee_db.values() if getattr(e, "department", None) == department]
-            records = [r for r in records if r.employee_id in dept_emp_ids]
-        except ImportError:
-            pass
-    if start_date is not None:
-        records = [r for r in records if r.date >= start_date]
-    if end_date is not None:
-        records = [r for r in records if r.date <= end_date]
-    # Group by period
-    trend: Dict[str, Dict[str, int]] = {}
-    for r in records:
-        dt = datetime.strptime(r.date, "%Y-%m-%d")
-        if period == "weekly":
-            key = f"{dt.isocalendar()[0]}-W{dt.isocalendar()[1]:02d}"
-        else:
-            key = dt.strftime("%Y-%m")
-        if key not in trend:
-            trend[key] = {"present": 0, "late": 0, "absent": 0, "total": 0}
-        trend[key]["total"] += 1
-        if r.status in trend[key]:
-            trend[key][r.status] += 1
-    # Sort by period key
-    sorted_trend = dict(sorted(trend.items()))
-    return sorted_trend
+    async def compute():
+        filters = await attendance_filters(employee_id, department, start_date, end_date)
+        # Group by period and status in the store
+        counts = await attendance_repo.group_count(filters, by=["status"], period=("date", period))
+        trend: Dict[str, Dict[str, int]] = {}
+        for (key, status_), n in counts.items():
+            if key not in trend:
+                trend[key] = {"present": 0, "late": 0, "absent": 0, "total": 0}
+            trend[key]["total"] += n
+            if status_ in trend[key]:
+                trend[key][status_] += n
+        # Sort by period key
+        return dict(sorted(trend.items()))
+    return await report_cache.get_or_compute(
+        "attendance.trend",
+        dict(employee_id=employee_id, department=department, period=period, start_date=start_date, end_date=end_date),
+        report_sources(department),
+        compute,
+    )
 
 @router.get("/status/{employee_id}", response_model=dict)
-def get_employee_attendance_status(employee_id: int):
-    records = [r for r in attendance_db.values() if r.employee_id == employee_id]
+async def get_employee_attendance_status(employee_id: int):
+    records = await attendance_repo.list({"employee_id": employee_id})
     if not records:
         raise HTTPException(status_code=404, detail="No attendance records found for this employee")
     latest = max(records, key=lambda r: r.date)
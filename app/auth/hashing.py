@@ -0,0 +1,100 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from passlib.context import CryptContext
+
+# bcrypt releases the GIL while hashing, so a thread pool gives real parallelism
+# without the pickling overhead of a process pool.
+PASSWORD_HASH_WORKERS = int(os.getenv("EMS_PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Hashing requests beyond this many (running + queued) are rejected with 503
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("EMS_PASSWORD_HASH_MAX_PENDING", "256"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+class HashingPoolFull(Exception):
+    pass
+
+
+class PasswordHasher:
+    """Runs bcrypt hash/verify on a bounded worker pool off the event loop."""
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pwhash")
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.total_run_seconds = 0.0
+
+    def _run(self, enqueued: float, fn, *args):
+        started = time.perf_counter()
+        wait = started - enqueued
+        with self._lock:
+            self.in_flight += 1
+            self.total_wait_seconds += wait
+            if wait > self.max_wait_seconds:
+                self.max_wait_seconds = wait
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.completed += 1
+                self.total_run_seconds += time.perf_counter() - started
+
+    async def _submit(self, fn, *args):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HashingPoolFull()
+            self.pending += 1
+        try:
+            future = self._executor.submit(self._run, time.perf_counter(), fn, *args)
+        except RuntimeError:
+            # Executor already shut down: undo the reservation
+            with self._lock:
+                self.pending -= 1
+            raise
+        # Released when the job finishes, or when it is cancelled while still
+        # queued (the caller went away) and so never runs
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, future):
+        with self._lock:
+            self.pending -= 1
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._submit(pwd_context.verify, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(pwd_context.hash, password)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self.pending,
+                "queued": self.pending - self.in_flight,
+                "in_flight": self.in_flight,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(1000 * self.total_wait_seconds / self.completed, 3) if self.completed else 0.0,
+                "max_wait_ms": round(1000 * self.max_wait_seconds, 3),
+                "avg_run_ms": round(1000 * self.total_run_seconds / self.completed, 3) if self.completed else 0.0,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
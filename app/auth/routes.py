@@ -1,9 +1,13 @@
 from fastapi import APIRouter, HTTPException, status, Depends, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel, EmailStr, Field
-from passlib.context import CryptContext
+from typing import List, Optional
 from jose import JWTError, jwt
-from app.database import Database
+from pymongo.errors import DuplicateKeyError
+from app.database import Database, get_database
+from app.auth.hashing import password_hasher, HashingPoolFull
+from app.auth.user_cache import user_cache
+from app.auth.throttle import login_throttle, otp_throttle, retry_after_header, throttle_stats
 import os
 import datetime
 import random
@@ -15,15 +19,11 @@ SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
-db = Database.get_db()
-users_collection = db["users"]
-otp_collection = db["otp"]
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
+# For endpoints that also serve anonymous callers
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login", auto_error=False)
 
 class UserCreate(BaseModel):
     username: str
@@ -47,11 +47,18 @@ class ResetPasswordConfirm(BaseModel):
     otp: str
     new_password: str
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+# bcrypt runs on the bounded hashing pool so it never blocks the event loop
+async def verify_password(plain_password, hashed_password):
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except HashingPoolFull:
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    try:
+        return await password_hasher.hash(password)
+    except HashingPoolFull:
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
 
 def create_access_token(data: dict, expires_delta: datetime.timedelta = None):
     to_encode = data.copy()
@@ -59,21 +66,21 @@ def create_access_token(data: dict, expires_delta: datetime.timedelta = None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-async def get_user_by_email(email: str):
-    return await users_collection.find_one({"email": email})
+async def get_user_by_email(db, email: str):
+    return await db["users"].find_one({"email": email})
 
-async def get_user_by_username(username: str):
-    return await users_collection.find_one({"username": username})
+async def get_user_by_username(db, username: str):
+    return await db["users"].find_one({"username": username})
 
-async def authenticate_user(username: str, password: str):
-    user = await get_user_by_username(username)
+async def authenticate_user(db, username: str, password: str):
+    user = await get_user_by_username(db, username)
     if not user:
         return False
-    if not verify_password(password, user["password"]):
+    if not await verify_password(password, user["password"]):
         return False
     return user
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db=Depends(get_database)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -86,25 +93,58 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = await get_user_by_username(username)
+    user = await user_cache.get_or_load(username, lambda name: get_user_by_username(db, name))
     if user is None:
         raise credentials_exception
     return user
 
+async def get_current_user_optional(token: Optional[str] = Depends(optional_oauth2_scheme)) -> Optional[dict]:
+    # The authenticated user, or None without a valid token
+    if token is None:
+        return None
+    try:
+        return await get_current_user(token, get_database())
+    except HTTPException:
+        return None
+
+# Example role-based dependency
+async def get_current_user_role():
+    # Placeholder: Replace with actual authentication logic
+    return "employee"
+
+def require_role(roles: List[str]):
+    async def role_checker(role: str = Depends(get_current_user_role)):
+        if role not in roles:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient permissions")
+    return role_checker
+
 @router.post("/register", response_model=UserOut, status_code=201)
-async def register(user: UserCreate):
-    if await get_user_by_email(user.email):
+async def register(user: UserCreate, db=Depends(get_database)):
+    if await get_user_by_email(db, user.email):
         raise HTTPException(status_code=400, detail="Email already registered")
-    if await get_user_by_username(user.username):
+    if await get_user_by_username(db, user.username):
         raise HTTPException(status_code=400, detail="Username already taken")
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
     doc = {"username": user.username, "email": user.email, "password": hashed_password}
-    result = await users_collection.insert_one(doc)
+    try:
+        result = await db["users"].insert_one(doc)
+    except DuplicateKeyError:
+        # Lost a race with a concurrent registration; the unique indexes caught it
+        raise HTTPException(status_code=400, detail="Username or email already registered")
+    # Drop any negative entry left by tokens probing this username
+    await user_cache.invalidate(user.username)
     return {"id": str(result.inserted_id), "username": user.username, "email": user.email}
 
+def client_ip(request: Request):
+    return request.client.host if request.client else None
+
 @router.post("/login", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = await authenticate_user(form_data.username, form_data.password)
+async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db=Depends(get_database)):
+    # Rejected before any database lookup or bcrypt work
+    retry_after = await login_throttle.check({"username": form_data.username.lower(), "ip": client_ip(request)})
+    if retry_after:
+        raise HTTPException(status_code=429, detail="Too many login attempts", headers=retry_after_header(retry_after))
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
     access_token = create_access_token(data={"sub": user["username"]})
@@ -115,23 +155,28 @@ async def logout():
     return {"message": "Logout endpoint (client should remove token)"}
 
 @router.post("/reset-password")
-async def reset_password(request: ResetPasswordRequest):
-    user = await get_user_by_email(request.email)
+async def reset_password(request: ResetPasswordRequest, db=Depends(get_database)):
+    user = await get_user_by_email(db, request.email)
     if not user:
         return {"message": "If this email is registered, you will receive a reset link."}
     otp = ''.join(random.choices(string.digits, k=6))
-    await otp_collection.insert_one({"email": request.email, "otp": otp, "created": datetime.datetime.utcnow()})
+    await db["otp"].insert_one({"email": request.email, "otp": otp, "created": datetime.datetime.utcnow()})
     # Here, send OTP via email (mocked)
     print(f"Send OTP {otp} to {request.email}")
     return {"message": "If this email is registered, you will receive a reset link."}
 
 @router.post("/reset-password/confirm")
-async def reset_password_confirm(data: ResetPasswordConfirm):
-    otp_doc = await otp_collection.find_one({"email": data.email, "otp": data.otp})
+async def reset_password_confirm(data: ResetPasswordConfirm, request: Request, db=Depends(get_database)):
+    retry_after = await otp_throttle.check({"email": data.email.lower(), "ip": client_ip(request)})
+    if retry_after:
+        raise HTTPException(status_code=429, detail="Too many reset attempts", headers=retry_after_header(retry_after))
+    otp_doc = await db["otp"].find_one({"email": data.email, "otp": data.otp})
     if not otp_doc:
         raise HTTPException(status_code=400, detail="Invalid OTP")
-    await users_collection.update_one({"email": data.email}, {"$set": {"password": get_password_hash(data.new_password)}})
-    await otp_collection.delete_many({"email": data.email})
+    hashed_password = await get_password_hash(data.new_password)
+    await db["users"].update_one({"email": data.email}, {"$set": {"password": hashed_password}})
+    await user_cache.invalidate_email(data.email)
+    await db["otp"].delete_many({"email": data.email})
     return {"message": "Password reset successful"}
 
 @router.get("/me", response_model=UserOut)
@@ -139,10 +184,23 @@ async def get_me(current_user: dict = Depends(get_current_user)):
     return {"id": str(current_user["_id"]), "username": current_user["username"], "email": current_user["email"]}
 
 @router.get("/health", tags=["Health"])
-async def health_check():
+async def health_check(db=Depends(get_database)):
     try:
         # The ping command is cheap and does not require auth.
         await db.command("ping")
-        return {"status": "ok", "message": "MongoDB connection successful"}
+        indexes = await Database.index_report()
+        return {"status": "ok", "message": "MongoDB connection successful", "indexes": indexes, "pool": Database.pool_stats()}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"MongoDB connection failed: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"MongoDB connection failed: {str(e)}")
+
+@router.get("/user-cache/stats", tags=["Health"], dependencies=[Depends(require_role(["admin"]))])
+async def user_cache_stats():
+    return user_cache.stats()
+
+@router.get("/throttle/stats", tags=["Health"], dependencies=[Depends(require_role(["admin"]))])
+async def login_throttle_stats():
+    return throttle_stats(bcrypt_ms=password_hasher.stats()["avg_run_ms"])
+
+@router.get("/hashing/stats", tags=["Health"], dependencies=[Depends(require_role(["admin"]))])
+async def hashing_stats():
+    return password_hasher.stats()
\ No newline at end of file
@@ -0,0 +1,146 @@
+import math
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+class RateLimitBackend(ABC):
+    """Storage for token buckets. Subclass to share state across processes (e.g. Redis)."""
+
+    @abstractmethod
+    async def consume(self, key: str, capacity: float, refill_per_second: float) -> float:
+        """Take one token from the bucket for `key`.
+
+        Returns 0 when the token was granted, otherwise the seconds until one
+        will be available.
+        """
+
+    @abstractmethod
+    async def refund(self, key: str, capacity: float):
+        """Give back a token taken by `consume`."""
+
+    def size(self) -> int:
+        return 0
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """Per-process buckets; the least recently used keys are dropped past max_keys."""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()  # key -> [tokens, updated_at]
+        self.evictions = 0
+
+    async def consume(self, key: str, capacity: float, refill_per_second: float) -> float:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [capacity, now]
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_keys:
+                # A dropped bucket restarts full, which only ever errs towards allowing
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * refill_per_second)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / refill_per_second
+
+    async def refund(self, key: str, capacity: float):
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket[0] = min(capacity, bucket[0] + 1)
+
+    def size(self) -> int:
+        return len(self._buckets)
+
+
+class Throttle:
+    """Token-bucket limiter with one bucket per (scope, key) pair.
+
+    `limits` maps each scope (e.g. "username", "ip") to (burst capacity, refill per second).
+    """
+
+    def __init__(self, name: str, limits: Dict[str, Tuple[float, float]], backend: RateLimitBackend):
+        self.name = name
+        self.limits = limits
+        self.backend = backend
+        self.allowed = 0
+        self.rejected = 0
+        self.throttled: Dict[str, int] = {}
+
+    async def check(self, keys: Dict[str, Optional[str]]) -> float:
+        """Consume a token from every keyed bucket; return the longest wait (0 if allowed).
+
+        A rejected attempt costs nothing: the tokens it took from the other
+        buckets are given back, so requests throttled per address cannot
+        drain the per-account bucket and lock the real user out.
+        """
+        retry_after = 0.0
+        granted = []
+        for scope, key in keys.items():
+            if key is None:
+                continue
+            capacity, refill_per_second = self.limits[scope]
+            bucket = f"{self.name}:{scope}:{key}"
+            wait = await self.backend.consume(bucket, capacity, refill_per_second)
+            if wait > 0:
+                self.throttled[scope] = self.throttled.get(scope, 0) + 1
+                retry_after = max(retry_after, wait)
+            else:
+                granted.append((bucket, capacity))
+        if retry_after == 0:
+            self.allowed += 1
+        else:
+            self.rejected += 1
+            for bucket, capacity in granted:
+                await self.backend.refund(bucket, capacity)
+        return retry_after
+
+    def stats(self) -> dict:
+        return {
+            "limits": {scope: {"burst": c, "refill_per_second": r} for scope, (c, r) in self.limits.items()},
+            "allowed": self.allowed,
+            "throttled": self.rejected,
+            "throttled_by_scope": dict(self.throttled),
+        }
+
+
+def retry_after_header(seconds: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+THROTTLE_MAX_KEYS = int(os.getenv("EMS_THROTTLE_MAX_KEYS", "100000"))
+
+def _limit(prefix: str, burst: str, refill: str) -> Tuple[float, float]:
+    return (float(os.getenv(f"{prefix}_BURST", burst)), float(os.getenv(f"{prefix}_REFILL_PER_SECOND", refill)))
+
+# Per-account limits are tight; per-address limits allow for shared office NATs
+throttle_backend: RateLimitBackend = InMemoryRateLimitBackend(THROTTLE_MAX_KEYS)
+login_throttle = Throttle("login", {
+    "username": _limit("EMS_LOGIN_USER", "10", "0.2"),
+    "ip": _limit("EMS_LOGIN_IP", "100", "2"),
+}, throttle_backend)
+otp_throttle = Throttle("otp", {
+    "email": _limit("EMS_OTP_EMAIL", "5", "0.05"),
+    "ip": _limit("EMS_OTP_IP", "20", "0.2"),
+}, throttle_backend)
+
+
+def throttle_stats(bcrypt_ms: float = 0.0) -> dict:
+    login = login_throttle.stats()
+    otp = otp_throttle.stats()
+    rejected = login["throttled"] + otp["throttled"]
+    return {
+        "login": login,
+        "otp": otp,
+        "tracked_keys": throttle_backend.size(),
+        # Each rejected attempt skips one bcrypt operation
+        "estimated_cpu_ms_shed": round(rejected * bcrypt_ms, 1),
+    }
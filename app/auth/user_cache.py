@@ -0,0 +1,183 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+from app.metrics import run_in_threadpool
+from app.repository import REPOSITORY_BACKEND, SQLITE_BUSY_TIMEOUT_MS, SQLITE_PATH
+
+USER_CACHE_MAX_ENTRIES = int(os.getenv("EMS_USER_CACHE_MAX_ENTRIES", "10000"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("EMS_USER_CACHE_TTL_SECONDS", "60"))
+# Unknown usernames are remembered briefly so bogus tokens don't hammer Mongo
+USER_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("EMS_USER_CACHE_NEGATIVE_TTL_SECONDS", "5"))
+
+
+class SharedGeneration:
+    """Invalidation counter in the SQLite file shared by the workers.
+
+    Each worker caches users on its own; with one of these, an invalidation
+    in any worker bumps the counter, and the others drop their whole cache
+    on their next lookup instead of serving the old user until it expires.
+    """
+
+    NAME = "user_cache:generation"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        # One per thread and process, like SQLiteRepository's
+        if getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, seq INTEGER NOT NULL)")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return self._local.conn
+
+    def read(self) -> int:
+        row = self._connection().execute("SELECT seq FROM counters WHERE name = ?", (self.NAME,)).fetchone()
+        return row[0] if row else 0
+
+    def bump(self) -> int:
+        # May wait for another worker's write lock, so callers run it in the threadpool
+        return self._connection().execute(
+            "INSERT INTO counters (name, seq) VALUES (?, 1) "
+            "ON CONFLICT (name) DO UPDATE SET seq = seq + 1 RETURNING seq", (self.NAME,)).fetchone()[0]
+
+
+class UserCache:
+    """Bounded TTL/LRU cache of user documents keyed by username.
+
+    Only touched from the event loop, so no locking is needed. Without a
+    `generation`, invalidations only reach this process: other workers keep
+    serving a changed or deleted user for up to `ttl` seconds.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, negative_ttl: float,
+                 generation: Optional[SharedGeneration] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.generation = generation
+        self._generation_seen: Optional[int] = None
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # username -> (expires_at, user or None)
+        self._by_id = {}
+        self._by_email = {}
+        # Bumped on every invalidation so a load racing with a write is not cached
+        self._version = 0
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.remote_invalidations = 0
+
+    def _drop(self, username: str):
+        entry = self._entries.pop(username, None)
+        if entry is None or entry[1] is None:
+            return
+        user = entry[1]
+        self._by_id.pop(str(user.get("_id")), None)
+        self._by_email.pop(user.get("email"), None)
+
+    def _store(self, username: str, user: Optional[dict]):
+        self._drop(username)
+        ttl = self.ttl if user is not None else self.negative_ttl
+        self._entries[username] = (time.monotonic() + ttl, user)
+        if user is not None:
+            self._by_id[str(user.get("_id"))] = username
+            if user.get("email"):
+                self._by_email[user["email"]] = username
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _sync(self):
+        # Another worker invalidated a user since the last lookup; which one is not recorded
+        generation = self.generation.read()
+        if generation != self._generation_seen:
+            if self._generation_seen is not None and self._entries:
+                self.clear()
+                self.remote_invalidations += 1
+            self._generation_seen = generation
+
+    async def _publish(self):
+        if self.generation is not None:
+            generation = await run_in_threadpool(self.generation.bump)
+            if generation == (self._generation_seen or 0) + 1:
+                # Only our own bump: keep the cache
+                self._generation_seen = generation
+
+    async def get_or_load(self, username: str, loader: Callable[[str], Awaitable[Optional[dict]]]) -> Optional[dict]:
+        if self.generation is not None:
+            self._sync()
+        entry = self._entries.get(username)
+        if entry is not None:
+            expires_at, user = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(username)
+                if user is None:
+                    self.negative_hits += 1
+                    return None
+                self.hits += 1
+                # Callers annotate the returned document, keep the cached one clean
+                return dict(user)
+            self._drop(username)
+            self.expirations += 1
+        self.misses += 1
+        version = self._version
+        user = await loader(username)
+        if version == self._version:
+            self._store(username, dict(user) if user is not None else None)
+        return user
+
+    def _invalidate(self, username: Optional[str]):
+        self._version += 1
+        if username in self._entries:
+            self._drop(username)
+            self.invalidations += 1
+
+    async def invalidate(self, username: str):
+        self._invalidate(username)
+        await self._publish()
+
+    async def invalidate_id(self, user_id):
+        self._invalidate(self._by_id.get(str(user_id)))
+        await self._publish()
+
+    async def invalidate_email(self, email: str):
+        self._invalidate(self._by_email.get(email))
+        await self._publish()
+
+    def clear(self):
+        self._version += 1
+        self._entries.clear()
+        self._by_id.clear()
+        self._by_email.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.negative_hits) / lookups, 4) if lookups else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "remote_invalidations": self.remote_invalidations,
+            "shared": self.generation is not None,
+        }
+
+
+# Workers sharing a SQLite file also share invalidations; see SharedGeneration
+user_cache = UserCache(USER_CACHE_MAX_ENTRIES, USER_CACHE_TTL_SECONDS, USER_CACHE_NEGATIVE_TTL_SECONDS,
+                       SharedGeneration(SQLITE_PATH) if REPOSITORY_BACKEND == "sqlite" else None)
@@ -0,0 +1,116 @@
+import json
+import os
+from typing import Any, AsyncIterator, Dict, Iterator, List, Tuple, Type
+
+from fastapi import HTTPException, Request, status
+from pydantic import ValidationError
+
+from app.serialization import FastJSONResponse
+
+# Most items one bulk request may carry
+BULK_MAX_ITEMS = int(os.getenv("EMS_BULK_MAX_ITEMS", "100000"))
+# Items written per store call, so a large import does not hold a store's lock
+# or a SQLite write transaction for the whole batch
+BULK_CHUNK_SIZE = int(os.getenv("EMS_BULK_CHUNK_SIZE", "5000"))
+
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+
+class BulkResult:
+    """Outcome of each item of a bulk request, reported in request order."""
+
+    def __init__(self):
+        self.items: Dict[int, Dict[str, Any]] = {}
+        self.counts: Dict[str, int] = {}
+
+    def ok(self, index: int, outcome: str, id: int):
+        self.items[index] = {"index": index, "status": outcome, "id": id}
+        self.counts[outcome] = self.counts.get(outcome, 0) + 1
+
+    def error(self, index: int, detail):
+        self.items[index] = {"index": index, "status": "error", "detail": detail}
+        self.counts["error"] = self.counts.get("error", 0) + 1
+
+    def response(self) -> FastJSONResponse:
+        # Built directly: running 100k result items through jsonable_encoder costs more than the import
+        return FastJSONResponse({**self.counts, "items": [self.items[i] for i in sorted(self.items)]})
+
+
+def _errors(e: ValidationError) -> List[Dict[str, Any]]:
+    return [{"loc": list(err["loc"]), "msg": err["msg"], "type": err["type"]} for err in e.errors()]
+
+
+async def _read_ndjson(request: Request) -> AsyncIterator[Tuple[int, Any, Any]]:
+    # One JSON document per line, parsed as the body streams in
+    index = 0
+    buffer = b""
+
+    def parse(line):
+        try:
+            return json.loads(line), None
+        except ValueError as e:
+            return None, f"Invalid JSON: {e}"
+
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield (index, *parse(line))
+                index += 1
+    if buffer.strip():
+        yield (index, *parse(buffer))
+
+
+async def parse_items(request: Request, model: Type) -> Tuple[List[Tuple[int, Any]], BulkResult]:
+    """Validate the items of a bulk request body against `model`.
+
+    The body is a JSON array, or NDJSON (one object per line) when sent as
+    application/x-ndjson. Returns the (index, model instance) pairs that
+    validated, and a BulkResult already holding an error for every item that
+    did not; a body that is not a list at all is rejected with 400.
+    """
+    result = BulkResult()
+    raw: List[Tuple[int, Any]] = []
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in NDJSON_TYPES:
+        async for index, item, error in _read_ndjson(request):
+            if index >= BULK_MAX_ITEMS:
+                raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"At most {BULK_MAX_ITEMS} items per request")
+            if error:
+                result.error(index, error)
+            else:
+                raw.append((index, item))
+    else:
+        try:
+            body = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Body must be a JSON array, or NDJSON with Content-Type: application/x-ndjson")
+        if isinstance(body, dict) and isinstance(body.get("items"), list):
+            body = body["items"]
+        if not isinstance(body, list):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Body must be a JSON array of items")
+        if len(body) > BULK_MAX_ITEMS:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"At most {BULK_MAX_ITEMS} items per request")
+        raw = list(enumerate(body))
+    valid = []
+    for index, item in raw:
+        try:
+            valid.append((index, model.parse_obj(item)))
+        except ValidationError as e:
+            result.error(index, _errors(e))
+    return valid, result
+
+
+def chunks(items: List, size: int = BULK_CHUNK_SIZE) -> Iterator[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+async def get_many(repo, ids) -> Dict[int, Any]:
+    """Records of `repo` by id, one query per chunk instead of one per id."""
+    found = {}
+    for chunk in chunks(list(ids)):
+        for record in await repo.list({"id": {"$in": chunk}}):
+            found[record.id] = record
+    return found
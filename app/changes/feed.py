@@ -0,0 +1,282 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from itertools import islice
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, status
+from pymongo import ReturnDocument
+
+from app.database import get_database
+from app.serialization import dumps
+
+# Every create, update and delete in these stores is appended to a change log
+# that clients read incrementally from GET /changes?since=<cursor>
+CHANGE_FEED_ENABLED = os.getenv("EMS_CHANGE_FEED", "1").lower() in ("1", "true", "yes")
+CHANGE_FEED_STORES = tuple(s.strip() for s in os.getenv(
+    "EMS_CHANGE_FEED_STORES", "employees,attendance,leave,tasks,payroll,documents").split(",") if s.strip())
+# Changes kept; an older cursor gets 410 and must re-fetch the lists
+CHANGES_RETENTION = int(os.getenv("EMS_CHANGES_RETENTION", "100000"))
+# How often a long poll looks for changes made by other worker processes
+CHANGES_POLL_MS = int(os.getenv("EMS_CHANGES_POLL_MS", "250"))
+CHANGES_MAX_WAIT_SECONDS = float(os.getenv("EMS_CHANGES_MAX_WAIT_SECONDS", "30"))
+CHANGES_MAX_LIMIT = 10000
+
+# (op, record id, record after the change or None for a delete)
+Change = Tuple[str, int, Any]
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class ChangeFeed(ABC):
+    """Ordered log of changes to the tracked stores, each numbered by a cursor (`seq`).
+
+    Repositories append to it as part of every write; readers ask for the
+    changes after a cursor, oldest first. Only the last `retention` changes
+    are kept.
+    """
+
+    def __init__(self, retention: int):
+        self.retention = retention
+        self._waiters: List[asyncio.Future] = []
+        self._waiters_lock = threading.Lock()
+        self.appended = 0
+        self.trimmed = 0
+
+    @abstractmethod
+    async def bounds(self) -> Tuple[int, int]:
+        """(first, last): the oldest retained cursor (last + 1 when empty) and the newest."""
+
+    @abstractmethod
+    async def read(self, since: int, limit: int) -> List[Dict[str, Any]]:
+        """Up to `limit` changes with a cursor above `since`, oldest first."""
+
+    def wake(self):
+        """Release every long poll waiting in this process; safe from any thread."""
+        with self._waiters_lock:
+            waiters, self._waiters = self._waiters, []
+        for future in waiters:
+            future.get_loop().call_soon_threadsafe(_resolve, future)
+
+    async def wait(self, timeout: float):
+        """Until a change is made in this process, or `timeout` seconds."""
+        future = asyncio.get_running_loop().create_future()
+        with self._waiters_lock:
+            self._waiters.append(future)
+        await asyncio.wait({future}, timeout=timeout)
+        if not future.done():
+            with self._waiters_lock:
+                if future in self._waiters:
+                    self._waiters.remove(future)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "stores": list(CHANGE_FEED_STORES),
+            "retention": self.retention,
+            "appended": self.appended,
+            "trimmed": self.trimmed,
+            "waiting": len(self._waiters),
+        }
+
+
+class InMemoryChangeFeed(ChangeFeed):
+    """Changes of the in-memory stores, in a bounded deque.
+
+    Each change is kept as a tuple with the record as JSON text, not the
+    record itself: a full log of models would pin about 100 MB. Changes are
+    decoded back into dicts as they are read.
+
+    Cursors start from the wall clock in microseconds, so after a restart
+    (which loses the log) every cursor handed out before is older than the
+    first retained one and gets a 410 instead of silently skipping changes.
+    """
+
+    def __init__(self, retention: int):
+        super().__init__(retention)
+        self._changes = deque(maxlen=retention)
+        self._seq = time.time_ns() // 1000
+        self._lock = threading.Lock()
+
+    def append(self, store: str, changes: Sequence[Change]):
+        # Called by InMemoryRepository with its lock held, so the order matches the writes
+        ts = time.time()
+        with self._lock:
+            for op, id, record in changes:
+                self._seq += 1
+                if len(self._changes) == self.retention:
+                    self.trimmed += 1
+                # Decoded to str: the bytes orjson returns keep its whole write buffer
+                self._changes.append((self._seq, store, op, id, ts, None if record is None else dumps(record).decode()))
+            self.appended += len(changes)
+        self.wake()
+
+    async def bounds(self):
+        with self._lock:
+            return (self._changes[0][0] if self._changes else self._seq + 1), self._seq
+
+    async def read(self, since, limit):
+        with self._lock:
+            if not self._changes:
+                return []
+            start = max(0, since - self._changes[0][0] + 1)
+            rows = list(islice(self._changes, start, start + limit))
+        return [{"seq": seq, "store": store, "op": op, "id": id, "ts": ts, "data": None if data is None else json.loads(data)}
+                for seq, store, op, id, ts, data in rows]
+
+
+class SQLiteChangeFeed(ChangeFeed):
+    """`changes` table in the shared SQLite file.
+
+    SQLiteRepository appends inside the transaction of the write itself, so
+    every worker process sees one order, and a change is visible exactly when
+    its data is. Other processes' changes are picked up by polling.
+    """
+
+    TABLE = "changes"
+    SCHEMA = (f"CREATE TABLE IF NOT EXISTS {TABLE} (seq INTEGER PRIMARY KEY, store TEXT NOT NULL, "
+              "op TEXT NOT NULL, id INTEGER NOT NULL, ts REAL NOT NULL, data TEXT)")
+    TRIM_EVERY = 1000
+
+    def __init__(self, retention: int, connect):
+        super().__init__(retention)
+        # The repositories' per-thread connection factory, which creates the table
+        self._connect = connect
+
+    def append(self, conn, store: str, changes: Sequence[Change]):
+        # Records come as the JSON text SQLiteRepository stores them as
+        if not changes:
+            return
+        n = len(changes)
+        last = conn.execute(
+            "INSERT INTO counters (name, seq) VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET seq = seq + excluded.seq RETURNING seq",
+            (self.TABLE, n),
+        ).fetchone()[0]
+        ts = time.time()
+        conn.executemany(
+            f"INSERT INTO {self.TABLE} (seq, store, op, id, ts, data) VALUES (?, ?, ?, ?, ?, ?)",
+            [(last - n + 1 + i, store, op, id, ts, data) for i, (op, id, data) in enumerate(changes)],
+        )
+        before = self.appended
+        self.appended += n
+        if before // self.TRIM_EVERY != self.appended // self.TRIM_EVERY:
+            self.trimmed += conn.execute(f"DELETE FROM {self.TABLE} WHERE seq <= ?", (last - self.retention,)).rowcount
+
+    async def bounds(self):
+        conn = self._connect()
+        last = conn.execute("SELECT seq FROM counters WHERE name = ?", (self.TABLE,)).fetchone()
+        last = last[0] if last else 0
+        first = conn.execute(f"SELECT MIN(seq) FROM {self.TABLE}").fetchone()[0]
+        return (last + 1 if first is None else first), last
+
+    async def read(self, since, limit):
+        rows = self._connect().execute(
+            f"SELECT seq, store, op, id, ts, data FROM {self.TABLE} WHERE seq > ? ORDER BY seq LIMIT ?", (since, limit))
+        return [{"seq": seq, "store": store, "op": op, "id": id, "ts": ts, "data": None if data is None else json.loads(data)}
+                for seq, store, op, id, ts, data in rows]
+
+
+class MongoChangeFeed(ChangeFeed):
+    """`changes` collection, numbered through the `counters` collection.
+
+    A cursor is reserved before its change is inserted, so a reader can
+    briefly see a later change before an earlier one lands; reads stop at
+    such a gap until it fills or is `GAP_TIMEOUT` seconds old (its writer died).
+    """
+
+    COLLECTION = "changes"
+    COUNTERS = "counters"
+    TRIM_EVERY = 1000
+    GAP_TIMEOUT = 5.0
+
+    async def append(self, store: str, changes: Sequence[Change]):
+        if not changes:
+            return
+        db = get_database()
+        n = len(changes)
+        counter = await db[self.COUNTERS].find_one_and_update(
+            {"_id": self.COLLECTION}, {"$inc": {"seq": n}}, upsert=True, return_document=ReturnDocument.AFTER)
+        last = counter["seq"]
+        ts = time.time()
+        await db[self.COLLECTION].insert_many([
+            {"_id": last - n + 1 + i, "store": store, "op": op, "id": id, "ts": ts, "data": None if record is None else record.dict()}
+            for i, (op, id, record) in enumerate(changes)
+        ], ordered=False)
+        before = self.appended
+        self.appended += n
+        if before // self.TRIM_EVERY != self.appended // self.TRIM_EVERY:
+            result = await db[self.COLLECTION].delete_many({"_id": {"$lte": last - self.retention}})
+            self.trimmed += result.deleted_count
+        self.wake()
+
+    async def bounds(self):
+        db = get_database()
+        counter = await db[self.COUNTERS].find_one({"_id": self.COLLECTION})
+        last = counter["seq"] if counter else 0
+        first = await db[self.COLLECTION].find_one({}, sort=[("_id", 1)], projection={"_id": 1})
+        return (last + 1 if first is None else first["_id"]), last
+
+    async def read(self, since, limit):
+        changes = []
+        expected = since + 1
+        now = time.time()
+        async for doc in get_database()[self.COLLECTION].find({"_id": {"$gt": since}}).sort("_id", 1).limit(limit):
+            if doc["_id"] != expected and now - doc["ts"] < self.GAP_TIMEOUT:
+                break
+            doc["seq"] = doc.pop("_id")
+            changes.append(doc)
+            expected = doc["seq"] + 1
+        return changes
+
+
+async def read_changes(feed: ChangeFeed, since: Optional[int], limit: int, stores: Optional[set],
+                       wait: float) -> Dict[str, Any]:
+    """Changes after `since` (restricted to `stores`) and the cursor to continue from.
+
+    Without `since` no changes are returned, only the current cursor, to
+    start syncing from after fetching the full lists. With `wait`, blocks
+    up to that many seconds until there is a change to return (long poll).
+    """
+    first, last = await feed.bounds()
+    if since is None:
+        return {"cursor": last, "changes": [], "more": False}
+    if since < first - 1 or since > last:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail={
+            "message": "Cursor expired: re-fetch the lists and continue from this cursor", "cursor": last})
+    deadline = time.monotonic() + wait
+    while True:
+        changes = await feed.read(since, limit)
+        more = len(changes) == limit
+        if changes:
+            since = changes[-1]["seq"]
+        if stores is not None:
+            changes = [c for c in changes if c["store"] in stores]
+        remaining = deadline - time.monotonic()
+        if changes or more or remaining <= 0:
+            return {"cursor": since, "changes": changes, "more": more}
+        # Woken by writes in this process; other processes' are seen at the next poll
+        await feed.wait(min(remaining, CHANGES_POLL_MS / 1000))
+
+
+_feeds: Dict[Tuple, ChangeFeed] = {}
+
+
+def get_change_feed(backend: str, connect=None) -> Optional[ChangeFeed]:
+    """The process-wide change feed of `backend`; None when the feed is disabled."""
+    if not CHANGE_FEED_ENABLED:
+        return None
+    if backend not in _feeds:
+        if backend == "sqlite":
+            _feeds[backend] = SQLiteChangeFeed(CHANGES_RETENTION, connect)
+        elif backend == "mongo":
+            _feeds[backend] = MongoChangeFeed(CHANGES_RETENTION)
+        else:
+            _feeds[backend] = InMemoryChangeFeed(CHANGES_RETENTION)
+    return _feeds[backend]
@@ -0,0 +1,54 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List, Optional
+from app.changes.feed import (
+    CHANGE_FEED_STORES, CHANGES_MAX_LIMIT, CHANGES_MAX_WAIT_SECONDS, get_change_feed, read_changes,
+)
+from app.repository import REPOSITORY_BACKEND
+from app.serialization import FastJSONResponse
+
+router = APIRouter(prefix="/changes", tags=["Changes"])
+
+# Example role-based dependency
+async def get_current_user_role():
+    # Placeholder: Replace with actual authentication logic
+    return "employee"
+
+def require_role(roles: List[str]):
+    async def role_checker(role: str = Depends(get_current_user_role)):
+        if role not in roles:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient permissions")
+    return role_checker
+
+def change_feed():
+    feed = get_change_feed(REPOSITORY_BACKEND)
+    if feed is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="The change feed is disabled")
+    return feed
+
+@router.get("", dependencies=[Depends(require_role(["admin", "manager"]))])
+async def list_changes(since: Optional[int] = None, limit: int = 1000, stores: Optional[str] = None, wait: float = 0):
+    """Creates, updates and deletes after cursor `since`, oldest first, with the record as it is after each change.
+
+    Call without `since` for the current cursor, fetch the full lists, then
+    poll with the returned `cursor`; `more` means another page is ready now.
+    `stores` is a comma-separated subset of the tracked stores, and `wait`
+    (seconds) holds the request open until there is a change. A cursor older
+    than the retained changes gets 410: fetch the lists again.
+    """
+    feed = change_feed()
+    wanted = None
+    if stores:
+        wanted = {s.strip() for s in stores.split(",") if s.strip()}
+        unknown = wanted.difference(CHANGE_FEED_STORES)
+        if unknown:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Not tracked: {', '.join(sorted(unknown))}")
+    limit = max(1, min(limit, CHANGES_MAX_LIMIT))
+    wait = max(0.0, min(wait, CHANGES_MAX_WAIT_SECONDS))
+    # Built directly: the records in the changes are already validated
+    return FastJSONResponse(await read_changes(feed, since, limit, wanted, wait))
+
+@router.get("/stats", dependencies=[Depends(require_role(["admin"]))])
+async def change_feed_stats():
+    feed = change_feed()
+    first, last = await feed.bounds()
+    return {**feed.stats(), "first": first, "last": last}
@@ -0,0 +1,163 @@
+from fastapi import APIRouter, Depends, Request, Response
+from typing import Dict, List, Optional
+from datetime import datetime, timedelta
+import asyncio
+import os
+import time
+from app.auth.routes import get_current_user_optional
+
+router = APIRouter(prefix="/dashboard", tags=["Dashboard"])
+
+DASHBOARD_CACHE_TTL_SECONDS = float(os.getenv("EMS_DASHBOARD_CACHE_TTL_SECONDS", "5"))
+DASHBOARD_EXPIRY_DAYS = int(os.getenv("EMS_DASHBOARD_EXPIRY_DAYS", "30"))
+DASHBOARD_LIST_LIMIT = 5
+
+# Example role-based dependency
+async def get_current_user_role():
+    # Placeholder: Replace with actual authentication logic
+    return "employee"
+
+async def attendance_section():
+    from app.attendance.routes import attendance_kpi_today
+    return await attendance_kpi_today()
+
+async def leaves_section():
+    from app.leave.routes import leave_repo
+    pending = {"status": "pending"}
+    count, recent = await asyncio.gather(
+        leave_repo.count(pending),
+        leave_repo.list(pending, sort="-id", limit=DASHBOARD_LIST_LIMIT),
+    )
+    return {
+        "pending": count,
+        "recent": [{"id": l.id, "employee_id": l.employee_id, "type": l.type, "start_date": l.start_date, "end_date": l.end_date} for l in recent],
+    }
+
+async def tasks_section():
+    from app.tasks.routes import task_repo
+    counts = await task_repo.group_count(by=["status"])
+    by_status = {status_: n for (status_,), n in counts.items()}
+    return {"open": sum(n for s, n in by_status.items() if s != "completed"), "by_status": by_status}
+
+async def documents_section():
+    from app.documents import routes as documents
+    await documents.refresh_expiry_index()
+    expiry_index = documents.expiry_index
+    now = datetime.utcnow()
+    expired = expiry_index.range(end=now)
+    expiring = expiry_index.range(start=now, end=now + timedelta(days=DASHBOARD_EXPIRY_DAYS))
+    soonest = await documents._documents_by_id(expiring[:DASHBOARD_LIST_LIMIT])
+    return {
+        "expired": len(expired),
+        "expiring_within_days": DASHBOARD_EXPIRY_DAYS,
+        "expiring": len(expiring),
+        "soonest": [{"id": d.id, "employee_id": d.employee_id, "category": d.category, "expiry_date": d.expiry_date} for d in soonest],
+    }
+
+SECTIONS = {
+    "attendance": attendance_section,
+    "leaves": leaves_section,
+    "tasks": tasks_section,
+    "documents": documents_section,
+}
+
+# Router each section summarizes; a section is only shown when the app serves it
+SECTION_PREFIXES = {
+    "attendance": "/attendance",
+    "leaves": "/leave",
+    "tasks": "/tasks",
+    "documents": "/documents",
+}
+
+def mounted_sections(app) -> frozenset:
+    sections = getattr(app.state, "dashboard_sections", None)
+    if sections is None:
+        paths = [getattr(route, "path", "") for route in app.routes]
+        sections = frozenset(
+            name for name, prefix in SECTION_PREFIXES.items()
+            if any(path == prefix or path.startswith(prefix + "/") for path in paths)
+        )
+        app.state.dashboard_sections = sections
+    return sections
+
+# Each role sees the sections whose underlying endpoints it may call
+ROLE_SECTIONS: Dict[str, List[str]] = {
+    "admin": ["attendance", "leaves", "tasks", "documents"],
+    "manager": ["attendance", "leaves", "tasks", "documents"],
+    "employee": ["leaves", "tasks"],
+}
+
+class DashboardCache:
+    """Short-lived per-role payloads; concurrent misses for a role share one build."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: Dict[str, tuple] = {}  # role -> (expires_at, payload)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.section_errors: Dict[str, int] = {}
+
+    async def get(self, role: str, sections: frozenset):
+        entry = self._entries.get(role)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1], True
+        self.misses += 1
+        task = self._inflight.get(role)
+        if task is None:
+            task = asyncio.ensure_future(self._build(role, sections))
+            self._inflight[role] = task
+            task.add_done_callback(lambda _: self._inflight.pop(role, None))
+        return await asyncio.shield(task), False
+
+    async def _build(self, role: str, sections: frozenset):
+        names = [name for name in ROLE_SECTIONS.get(role, []) if name in sections]
+        results = await asyncio.gather(*(SECTIONS[name]() for name in names), return_exceptions=True)
+        payload = {"role": role, "generated_at": datetime.utcnow().isoformat()}
+        errors = {}
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                # One failing source should not blank the whole dashboard: the
+                # error is returned with it and counted in /dashboard/stats
+                errors[name] = str(result) or type(result).__name__
+                self.section_errors[name] = self.section_errors.get(name, 0) + 1
+                payload[name] = None
+            else:
+                payload[name] = result
+        if errors:
+            payload["errors"] = errors
+        else:
+            self._entries[role] = (time.monotonic() + self.ttl, payload)
+        return payload
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "section_errors": dict(self.section_errors),
+        }
+
+dashboard_cache = DashboardCache(DASHBOARD_CACHE_TTL_SECONDS)
+
+@router.get("")
+async def get_dashboard(request: Request, response: Response, role: str = Depends(get_current_user_role),
+                        user: Optional[dict] = Depends(get_current_user_optional)):
+    payload, cached = await dashboard_cache.get(role, mounted_sections(request.app))
+    response.headers["X-Cache"] = "hit" if cached else "miss"
+    # Notifications are addressed to employee ids: only an authenticated
+    # account linked to an employee gets its own
+    employee_id = user.get("employee_id") if user else None
+    if employee_id is None:
+        return payload
+    # Per user and already in memory, so they are not cached
+    from app.notifications.logic import notification_db
+    recent = notification_db.for_user(employee_id, limit=DASHBOARD_LIST_LIMIT)
+    return {**payload, "notifications": {"count": notification_db.count_for_user(employee_id), "recent": recent[::-1]}}
+
+@router.get("/stats")
+async def dashboard_stats():
+    return dashboard_cache.stats()
@@ -1,30 +1,265 @@
-from motor.motor_asyncio import AsyncIOMotorClient
+from fastapi import HTTPException
+from pymongo import ASCENDING, IndexModel, monitoring
+from pymongo.errors import OperationFailure
+import asyncio
 import os
+import threading
 from typing import Optional
+from app.metrics import command_metrics
+
+# Connection pool settings, shared by every router through the single client
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "ems")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000"))
+MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
+# Delay between connection attempts while MongoDB is unreachable, doubled
+# after each failure up to the maximum
+MONGO_RECONNECT_INTERVAL_SECONDS = float(os.getenv("MONGO_RECONNECT_INTERVAL_SECONDS", "5"))
+MONGO_RECONNECT_MAX_INTERVAL_SECONDS = float(os.getenv("MONGO_RECONNECT_MAX_INTERVAL_SECONDS", "300"))
+# When records are not stored in Mongo: failed attempts before retrying only
+# once a request needs it
+MONGO_RECONNECT_ATTEMPTS = int(os.getenv("MONGO_RECONNECT_ATTEMPTS", "5"))
+
+# Unanswered OTPs are removed by Mongo this many seconds after creation
+OTP_TTL_SECONDS = int(os.getenv("OTP_TTL_SECONDS", "900"))
+
+# Indexes every deployment needs, created idempotently on startup
+INDEXES = {
+    "users": [
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "otp": [
+        IndexModel([("email", ASCENDING), ("otp", ASCENDING)], name="email_otp"),
+        IndexModel([("created", ASCENDING)], name="created_ttl", expireAfterSeconds=OTP_TTL_SECONDS),
+    ],
+}
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Counts connection pool events. Called from driver threads, hence the lock."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.open_connections = 0
+            self.connections_created = 0
+            self.connections_closed = 0
+            self.checked_out = 0
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.pool_clears = 0
+            self.total_checkout_wait = 0.0
+            self.max_checkout_wait = 0.0
+
+    def _waited(self, event):
+        duration = getattr(event, "duration", None)
+        if duration is not None:
+            self.total_checkout_wait += duration
+            self.max_checkout_wait = max(self.max_checkout_wait, duration)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections += 1
+            self.connections_created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections -= 1
+            self.connections_closed += 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+            self._waited(event)
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self._waited(event)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_pool_size": MONGO_MAX_POOL_SIZE,
+                "min_pool_size": MONGO_MIN_POOL_SIZE,
+                "open_connections": self.open_connections,
+                "checked_out": self.checked_out,
+                "connections_created": self.connections_created,
+                "connections_closed": self.connections_closed,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "pool_clears": self.pool_clears,
+                "avg_checkout_wait_ms": round(1000 * self.total_checkout_wait / self.checkouts, 3) if self.checkouts else 0.0,
+                "max_checkout_wait_ms": round(1000 * self.max_checkout_wait, 3),
+            }
+
+
+pool_monitor = PoolMonitor()
 
 class Database:
-    client: Optional[AsyncIOMotorClient] = None
+    client = None
     db = None
+    index_errors = {}
+    _connecting: Optional[asyncio.Task] = None
+    _loop: Optional[asyncio.AbstractEventLoop] = None
 
     @classmethod
     async def connect_db(cls):
+        if cls.client is not None:
+            return
+        # Imported here so the app can start without loading the driver's client
+        from motor.motor_asyncio import AsyncIOMotorClient
         try:
-            MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
-            cls.client = AsyncIOMotorClient(MONGO_URL)
-            cls.db = cls.client["ems"]
+            cls.client = AsyncIOMotorClient(
+                MONGO_URL,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+                serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                readPreference=MONGO_READ_PREFERENCE,
+                event_listeners=[pool_monitor, command_metrics],
+            )
+            cls.db = cls.client[MONGO_DB_NAME]
             # Verify connection
             await cls.client.admin.command('ping')
             print("Successfully connected to MongoDB")
+            # Inside the try: if this fails for any other reason than a bad
+            # index (e.g. the server went away again), the connection is
+            # dropped and the next attempt creates the indexes
+            await cls.ensure_indexes()
         except Exception as e:
             print(f"Error connecting to MongoDB: {e}")
+            if cls.client is not None:
+                cls.client.close()
+            cls.client = None
+            cls.db = None
             raise
 
+    @classmethod
+    def connect_in_background(cls, on_connect=None, give_up_after: Optional[int] = None):
+        """Keep trying to connect without holding up startup; then await `on_connect()`.
+
+        Attempts back off exponentially, and a failing `on_connect()` is
+        retried the same way. With `give_up_after`, stop after that many
+        failed connection attempts; get_database() starts again when a
+        request needs Mongo.
+        """
+        async def run():
+            delay = MONGO_RECONNECT_INTERVAL_SECONDS
+            failures = 0
+            while True:
+                try:
+                    await cls.connect_db()
+                    if on_connect is not None:
+                        await on_connect()
+                    return
+                except Exception as e:
+                    if cls.client is not None:
+                        print(f"Error preparing the app after connecting to MongoDB: {e}")
+                    else:
+                        failures += 1
+                        if give_up_after is not None and failures >= give_up_after:
+                            print(f"MongoDB unreachable after {failures} attempts; retrying when a request needs it")
+                            return
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MONGO_RECONNECT_MAX_INTERVAL_SECONDS)
+        cls._loop = asyncio.get_event_loop()
+        if cls._connecting is None or cls._connecting.done():
+            cls._connecting = asyncio.ensure_future(run())
+        return cls._connecting
+
+    @classmethod
+    def reconnect_soon(cls):
+        """Restart connection attempts given up on; safe from any thread."""
+        if cls._loop is not None and (cls._connecting is None or cls._connecting.done()):
+            cls._loop.call_soon_threadsafe(cls.connect_in_background, None, MONGO_RECONNECT_ATTEMPTS)
+
+    @classmethod
+    async def ensure_indexes(cls):
+        # create_indexes is a no-op for indexes that already exist with the same
+        # spec; a conflicting spec or duplicate data is reported, not fatal.
+        cls.index_errors = {}
+        for collection, indexes in INDEXES.items():
+            for index in indexes:
+                name = index.document["name"]
+                try:
+                    await cls.db[collection].create_indexes([index])
+                except OperationFailure as e:
+                    cls.index_errors[f"{collection}.{name}"] = str(e)
+                    print(f"Error creating index {collection}.{name}: {e}")
+
+    @classmethod
+    async def index_report(cls):
+        report = {}
+        for collection, indexes in INDEXES.items():
+            existing = {}
+            async for index in cls.db[collection].list_indexes():
+                existing[index["name"]] = {k: (dict(v) if k == "key" else v) for k, v in index.items() if k not in ("v", "ns")}
+            report[collection] = {
+                "existing": existing,
+                "missing": [i.document["name"] for i in indexes if i.document["name"] not in existing],
+            }
+        return {"collections": report, "errors": cls.index_errors}
+
     @classmethod
     async def close_db(cls):
+        cls._loop = None
+        if cls._connecting is not None:
+            cls._connecting.cancel()
+            cls._connecting = None
         if cls.client:
-            await cls.client.close()
+            cls.client.close()
+            cls.client = None
+            cls.db = None
             print("MongoDB connection closed")
 
     @classmethod
     def get_db(cls):
-        return cls.db
\ No newline at end of file
+        return cls.db
+
+    @classmethod
+    def pool_stats(cls):
+        return pool_monitor.stats()
+
+
+def get_database():
+    # FastAPI dependency: routers resolve the shared database per request, so
+    # importing them never depends on the startup hook having run.
+    db = Database.get_db()
+    if db is None:
+        Database.reconnect_soon()
+        raise HTTPException(status_code=503, detail="Database not connected")
+    return db
+
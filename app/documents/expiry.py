@@ -0,0 +1,68 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+
+def parse_expiry_date(value: str) -> datetime:
+    """Parse an ISO date/datetime into a naive UTC datetime. Raises ValueError."""
+    expiry = datetime.fromisoformat(value)
+    if expiry.tzinfo is not None:
+        expiry = expiry.astimezone(timezone.utc).replace(tzinfo=None)
+    return expiry
+
+
+class ExpiryIndex:
+    """Documents sorted by expiry date, globally and per employee / category."""
+
+    def __init__(self):
+        self._all: List[Tuple[datetime, int]] = []
+        self._by_employee: Dict[int, List[Tuple[datetime, int]]] = {}
+        self._by_category: Dict[str, List[Tuple[datetime, int]]] = {}
+        self._lock = threading.Lock()
+
+    def _lists(self, employee_id: int, category: str):
+        return (
+            self._all,
+            self._by_employee.setdefault(employee_id, []),
+            self._by_category.setdefault(category, []),
+        )
+
+    def add(self, doc_id: int, employee_id: int, category: str, expiry: datetime):
+        entry = (expiry, doc_id)
+        with self._lock:
+            for entries in self._lists(employee_id, category):
+                insort(entries, entry)
+
+    def remove(self, doc_id: int, employee_id: int, category: str, expiry: datetime):
+        entry = (expiry, doc_id)
+        with self._lock:
+            for entries in self._lists(employee_id, category):
+                i = bisect_left(entries, entry)
+                if i < len(entries) and entries[i] == entry:
+                    del entries[i]
+
+    def _select(self, employee_id: Optional[int], category: Optional[str]):
+        if employee_id is not None:
+            return self._by_employee.get(employee_id, [])
+        if category is not None:
+            return self._by_category.get(category, [])
+        return self._all
+
+    def range(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        employee_id: Optional[int] = None,
+        category: Optional[str] = None,
+    ) -> List[int]:
+        """Return doc ids with start <= expiry <= end, ordered by expiry.
+
+        When both employee_id and category are given only the employee list is
+        sliced; callers filter the (small) result on category.
+        """
+        with self._lock:
+            entries = self._select(employee_id, category)
+            lo = 0 if start is None else bisect_left(entries, (start,))
+            hi = len(entries) if end is None else bisect_right(entries, (end, float("inf")))
+            return [doc_id for _, doc_id in entries[lo:hi]]
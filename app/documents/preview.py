@@ -0,0 +1,176 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from app.lazy import installed, optional_module
+
+PREVIEW_DIR = os.getenv("EMS_PREVIEW_DIR", "/tmp/ems_previews")
+PREVIEW_CACHE_MAX_BYTES = int(os.getenv("EMS_PREVIEW_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+PREVIEW_MAX_DIMENSION = int(os.getenv("EMS_PREVIEW_MAX_DIMENSION", "512"))
+PREVIEW_PDF_DPI = int(os.getenv("EMS_PREVIEW_PDF_DPI", "48"))
+PREVIEW_MEDIA_TYPE = "image/jpeg"
+PREVIEW_EXTENSION = ".jpg"
+
+
+class PreviewCache:
+    """Bounded on-disk cache of reduced-size document previews, evicted in LRU order."""
+
+    def __init__(self, directory: str, max_bytes: int, max_dimension: int = PREVIEW_MAX_DIMENSION):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_dimension = max_dimension
+        # key -> size in bytes; read from the directory on first use
+        self._entries: "Optional[OrderedDict[str, int]]" = None
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.failures = 0
+
+    def _load(self) -> "OrderedDict[str, int]":
+        # Caller holds the lock. Rebuild the index from disk so previews
+        # survive a restart; oldest first
+        if self._entries is None:
+            os.makedirs(self.directory, exist_ok=True)
+            files = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(PREVIEW_EXTENSION):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_atime, name[:-len(PREVIEW_EXTENSION)], st.st_size))
+            self._entries = OrderedDict()
+            for _, key, size in sorted(files):
+                self._entries[key] = size
+                self._total_bytes += size
+            self._evict()
+        return self._entries
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + PREVIEW_EXTENSION)
+
+    def _key(self, source_path: str) -> str:
+        st = os.stat(source_path)
+        raw = f"{source_path}:{st.st_mtime_ns}:{st.st_size}:{self.max_dimension}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _evict(self):
+        # Caller holds the lock
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _render(self, source_path: str, content_type: str, target: str) -> bool:
+        # Optional renderers, imported on the first preview: without them
+        # previews fall back to the original file
+        Image = optional_module("PIL.Image")
+        if content_type == "application/pdf":
+            fitz = optional_module("fitz")
+            if fitz is None or Image is None:
+                return False
+            with fitz.open(source_path) as pdf:
+                if pdf.page_count == 0:
+                    return False
+                pix = pdf.load_page(0).get_pixmap(dpi=PREVIEW_PDF_DPI)
+                img = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+        elif content_type and content_type.startswith("image/"):
+            if Image is None:
+                return False
+            img = Image.open(source_path)
+            # Decode at reduced scale where the format supports it (JPEG)
+            img.draft("RGB", (self.max_dimension, self.max_dimension))
+        else:
+            return False
+        img.thumbnail((self.max_dimension, self.max_dimension))
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        img.save(target, "JPEG", quality=75, optimize=True)
+        return True
+
+    def get(self, source_path: str, content_type: str) -> Optional[Tuple[str, str]]:
+        """Return (path, media_type) of the preview, generating it on first request.
+
+        Returns None when no preview can be produced for this file type.
+        """
+        try:
+            key = self._key(source_path)
+        except OSError:
+            return None
+        with self._lock:
+            entries = self._load()
+            if key in entries:
+                entries.move_to_end(key)
+                self.hits += 1
+                return self._path(key), PREVIEW_MEDIA_TYPE
+            self.misses += 1
+        target = self._path(key)
+        tmp = f"{target}.{threading.get_ident()}.tmp"
+        try:
+            rendered = self._render(source_path, content_type, tmp)
+        except Exception:
+            rendered = False
+        if not rendered:
+            with self._lock:
+                self.failures += 1
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return None
+        size = os.path.getsize(tmp)
+        os.replace(tmp, target)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = size
+                self._total_bytes += size
+            self._entries.move_to_end(key)
+            self._evict()
+        # A single preview larger than the whole budget is evicted immediately
+        if not os.path.exists(target):
+            return None
+        return target, PREVIEW_MEDIA_TYPE
+
+    def invalidate(self, source_path: str):
+        try:
+            key = self._key(source_path)
+        except OSError:
+            return
+        with self._lock:
+            size = self._load().pop(key, None)
+            if size is None:
+                return
+            self._total_bytes -= size
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._load()),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "failures": self.failures,
+                "image_renderer": installed("PIL"),
+                "pdf_renderer": installed("fitz"),
+            }
+
+
+preview_cache = PreviewCache(PREVIEW_DIR, PREVIEW_CACHE_MAX_BYTES)
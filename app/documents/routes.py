@@ -1,13 +1,21 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, status, Depends
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, status, Depends, Query
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime, timedelta
 import os
+from app.documents.preview import preview_cache
+from app.documents.expiry import ExpiryIndex, parse_expiry_date
+from app.repository import REPOSITORY_BACKEND, get_repository
+from app.metrics import run_in_threadpool
+from app.serialization import list_response
 
 router = APIRouter(prefix="/documents", tags=["Documents"])
 
-# In-memory DB placeholder for documents
-document_db = {}
+# Parsed expiry dates, kept sorted for the alert queries
+document_expiry = {}
+expiry_index = ExpiryIndex()
+# Store version the index was last rebuilt at
+expiry_index_version = None
 
 # Document categories and access levels
 CATEGORIES = ["ID", "Contract", "Certificate", "Other"]
@@ -15,14 +23,13 @@ ACCESS_LEVELS = ["employee", "manager", "admin"]
 
 # Directory to store uploaded files (for demo, in-memory, not persistent)
 UPLOAD_DIR = "/tmp/ems_documents"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-def get_current_user_role():
+async def get_current_user_role():
     # Placeholder: Replace with actual authentication logic
     return "employee"
 
 def require_role(roles: List[str]):
-    def role_checker(role: str = Depends(get_current_user_role)):
+    async def role_checker(role: str = Depends(get_current_user_role)):
         if role not in roles:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient permissions")
     return role_checker
@@ -45,8 +52,44 @@ class Document(DocumentBase):
     uploaded_at: str
     path: str
 
+document_repo = get_repository("documents", Document, indexes=("employee_id", "category"))
+
+def index_document_expiry(doc: Document, index: ExpiryIndex = None, expiries: dict = None):
+    if doc.expiry_date:
+        expiry = parse_expiry_date(doc.expiry_date)
+        (document_expiry if expiries is None else expiries)[doc.id] = expiry
+        (expiry_index if index is None else index).add(doc.id, doc.employee_id, doc.category, expiry)
+
+async def load_expiry_index():
+    # Rebuild the process-local index from the store (e.g. at startup). The
+    # version is read first: a write that lands during the scan bumps it
+    # again, so the next refresh rebuilds once more
+    global document_expiry, expiry_index, expiry_index_version
+    version = await document_repo.version()
+    index, expiries = ExpiryIndex(), {}
+    for doc in await document_repo.list({"expiry_date": {"$ne": None}}):
+        try:
+            index_document_expiry(doc, index, expiries)
+        except ValueError:
+            continue
+    document_expiry, expiry_index, expiry_index_version = expiries, index, version
+
+async def refresh_expiry_index():
+    # A memory store is only ever written by this process; sqlite and mongo
+    # are shared with other workers, whose uploads, edits and deletes show
+    # up as a new store version. Ids are no high-water mark: on Mongo a lower
+    # id can be inserted after a higher one
+    if REPOSITORY_BACKEND != "memory" and await document_repo.version() != expiry_index_version:
+        await load_expiry_index()
+
+def save_upload(file: UploadFile, file_path: str):
+    # Created on first upload rather than at import
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    with open(file_path, "wb") as f:
+        f.write(file.file.read())
+
 @router.post("/upload", response_model=Document, status_code=status.HTTP_201_CREATED, dependencies=[Depends(require_role(["admin", "manager"]))])
-def upload_document(
+async def upload_document(
     employee_id: int = Form(...),
     category: str = Form(...),
     access_level: str = Form(...),
@@ -58,11 +101,15 @@ def upload_document(
         raise HTTPException(status_code=400, detail="Invalid category")
     if access_level not in ACCESS_LEVELS:
         raise HTTPException(status_code=400, detail="Invalid access level")
-    new_id = len(document_db) + 1
+    if expiry_date:
+        try:
+            parse_expiry_date(expiry_date)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid expiry date, expected ISO format")
+    new_id = (await document_repo.next_ids())[0]
     filename = f"{employee_id}_{int(datetime.utcnow().timestamp())}_{file.filename}"
     file_path = os.path.join(UPLOAD_DIR, filename)
-    with open(file_path, "wb") as f:
-        f.write(file.file.read())
+    await run_in_threadpool(save_upload, file, file_path)
     doc = Document(
         id=new_id,
         employee_id=employee_id,
@@ -75,64 +122,100 @@ def upload_document(
         uploaded_at=datetime.utcnow().isoformat(),
         path=file_path
     )
-    document_db[new_id] = doc
+    await document_repo.put(doc)
+    index_document_expiry(doc)
     return doc
 
 @router.get("", response_model=List[Document], dependencies=[Depends(require_role(["admin", "manager"]))])
-def list_documents(employee_id: Optional[int] = None, category: Optional[str] = None):
-    docs = list(document_db.values())
+async def list_documents(employee_id: Optional[int] = None, category: Optional[str] = None):
+    filters = {}
     if employee_id is not None:
-        docs = [d for d in docs if d.employee_id == employee_id]
+        filters["employee_id"] = employee_id
     if category is not None:
-        docs = [d for d in docs if d.category == category]
-    return docs
+        filters["category"] = category
+    return await list_response(document_repo, filters)
 
 @router.get("/{doc_id}", response_model=Document, dependencies=[Depends(require_role(["admin", "manager", "employee"]))])
-def get_document(doc_id: int):
-    doc = document_db.get(doc_id)
+async def get_document(doc_id: int):
+    doc = await document_repo.get(doc_id)
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     return doc
 
 @router.get("/download/{doc_id}", dependencies=[Depends(require_role(["admin", "manager", "employee"]))])
-def download_document(doc_id: int):
+async def download_document(doc_id: int):
     from fastapi.responses import FileResponse
-    doc = document_db.get(doc_id)
+    doc = await document_repo.get(doc_id)
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     return FileResponse(doc.path, filename=doc.filename, media_type=doc.content_type)
 
 @router.get("/preview/{doc_id}", dependencies=[Depends(require_role(["admin", "manager", "employee"]))])
-def preview_document(doc_id: int):
+async def preview_document(doc_id: int):
     from fastapi.responses import FileResponse
-    doc = document_db.get(doc_id)
+    doc = await document_repo.get(doc_id)
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
-    # For preview, just return the file (browser will preview if possible)
-    return FileResponse(doc.path, filename=doc.filename, media_type=doc.content_type)
+    # Serve a cached reduced-size derivative; fall back to the original file
+    # for types we cannot render (browser will preview if possible)
+    preview = await run_in_threadpool(preview_cache.get, doc.path, doc.content_type)
+    if preview is None:
+        return FileResponse(doc.path, filename=doc.filename, media_type=doc.content_type)
+    preview_path, media_type = preview
+    return FileResponse(preview_path, media_type=media_type)
+
+@router.get("/preview/cache/stats", dependencies=[Depends(require_role(["admin"]))])
+async def preview_cache_stats():
+    return preview_cache.stats()
 
 @router.delete("/{doc_id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(require_role(["admin"]))])
-def delete_document(doc_id: int):
-    doc = document_db.get(doc_id)
+async def delete_document(doc_id: int):
+    doc = await document_repo.get(doc_id)
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
+    preview_cache.invalidate(doc.path)
+    expiry = document_expiry.pop(doc_id, None)
+    if expiry is not None:
+        expiry_index.remove(doc_id, doc.employee_id, doc.category, expiry)
     try:
         os.remove(doc.path)
     except Exception:
         pass
-    del document_db[doc_id]
+    await document_repo.delete(doc_id)
     return None
 
+async def _documents_by_id(doc_ids: List[int], category: Optional[str] = None) -> List[Document]:
+    # Fetch in one query, then restore the expiry ordering of doc_ids
+    found = {d.id: d for d in await document_repo.list({"id": {"$in": doc_ids}})}
+    docs = [found[i] for i in doc_ids if i in found]
+    if category is not None:
+        docs = [d for d in docs if d.category == category]
+    return docs
+
 @router.get("/expiry/alerts", response_model=List[Document], dependencies=[Depends(require_role(["admin", "manager"]))])
-def expiry_alerts(days: int = 30):
-    now = datetime.utcnow()
-    alerts = []
-    for doc in document_db.values():
-        if doc.expiry_date:
-            try:
-                expiry = datetime.fromisoformat(doc.expiry_date)
-                if expiry - now <= timedelta(days=days):
-                    alerts.append(doc)
-            except Exception:
-                continue
-    return alerts
\ No newline at end of file
+async def expiry_alerts(days: int = 30, employee_id: Optional[int] = None, category: Optional[str] = None):
+    # Everything expiring within `days`, including documents already expired
+    await refresh_expiry_index()
+    until = datetime.utcnow() + timedelta(days=days)
+    doc_ids = expiry_index.range(end=until, employee_id=employee_id, category=category)
+    return await _documents_by_id(doc_ids, category if employee_id is not None else None)
+
+@router.get("/expiry/expired", response_model=List[Document], dependencies=[Depends(require_role(["admin", "manager"]))])
+async def expired_since(
+    since: str,
+    employee_id: Optional[int] = None,
+    category: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=10000)
+):
+    # Compliance sweep: documents that expired between `since` and now
+    try:
+        start = parse_expiry_date(since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid since date, expected ISO format")
+    await refresh_expiry_index()
+    doc_ids = expiry_index.range(start=start, end=datetime.utcnow(), employee_id=employee_id, category=category)
+    if employee_id is not None and category is not None:
+        docs = await _documents_by_id(doc_ids, category)
+        return docs[offset:offset + limit]
+    return await _documents_by_id(doc_ids[offset:offset + limit])
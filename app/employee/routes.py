@@ -1,9 +1,11 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, HTTPException, Request, status
 
 router = APIRouter(prefix="/employees", tags=["Employees"])
 
 from typing import List, Optional
 from pydantic import BaseModel
+from app.repository import get_repository
+from app.bulk import chunks, get_many, parse_items
 
 class Employee(BaseModel):
     id: int
@@ -14,91 +16,146 @@ class Employee(BaseModel):
     performance_scores: Optional[List[float]] = []
     performance_notes: Optional[List[str]] = []
 
-# In-memory DB placeholder
-employee_db = {}
+employee_repo = get_repository("employees", Employee, indexes=("department", "department_id"))
 
 @router.get("", response_model=List[Employee])
-def list_employees(
+async def list_employees(
     department: Optional[str] = None,
     search: Optional[str] = None,
     page: int = 1,
     page_size: int = 10
 ):
-    employees = list(employee_db.values())
-    # Filter by department if provided
-    if department:
-        employees = [e for e in employees if getattr(e, "department", None) == department]
+    start = (page - 1) * page_size
+    # Filter by department in the store; without a search the page is sliced there too
+    filters = {"department": department} if department else None
+    if not search:
+        return await employee_repo.list(filters, skip=start, limit=page_size)
+    employees = await employee_repo.list(filters)
     # Enhanced search: partial match on name, department, and performance_notes
-    if search:
-        search_lower = search.lower()
-        def match(e):
-            if search_lower in e.name.lower():
-                return True
-            if getattr(e, "department", None) and search_lower in e.department.lower():
-                return True
-            if any(search_lower in note.lower() for note in getattr(e, "performance_notes", [])):
-                return True
-            return False
-        employees = [e for e in employees if match(e)]
+    search_lower = search.lower()
+    def match(e):
+        if search_lower in e.name.lower():
+            return True
+        if getattr(e, "department", None) and search_lower in e.department.lower():
+            return True
+        if any(search_lower in note.lower() for note in getattr(e, "performance_notes", [])):
+            return True
+        return False
+    employees = [e for e in employees if match(e)]
     # Pagination
-    start = (page - 1) * page_size
-    end = start + page_size
-    employees = employees[start:end]
-    return employees
+    return employees[start:start + page_size]
 
 @router.post("", response_model=Employee)
-def add_employee(employee: Employee):
+async def add_employee(employee: Employee):
     # Link department name if department_id is provided
     if getattr(employee, "department_id", None) is not None:
-        from app.settings.routes import department_db
-        dept = department_db.get(employee.department_id)
+        from app.settings.routes import department_repo
+        dept = await department_repo.get(employee.department_id)
         if dept:
             employee.department = dept.name
         else:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Department does not exist")
-    employee_db[employee.id] = employee
+    await employee_repo.put(employee)
     return employee
 
+@router.post("/bulk")
+async def add_employees_bulk(request: Request):
+    """Create or replace many employees: a JSON array of employees, or NDJSON."""
+    return await put_employees(request, existing_only=False)
+
+@router.put("/bulk")
+async def update_employees_bulk(request: Request):
+    """Replace many existing employees; unknown ids are reported per item."""
+    return await put_employees(request, existing_only=True)
+
+async def put_employees(request: Request, existing_only: bool):
+    valid, result = await parse_items(request, Employee)
+    seen = set()
+    for chunk in chunks(valid):
+        existing = await get_many(employee_repo, {e.id for _, e in chunk})
+        # Departments are looked up once per chunk instead of once per employee
+        department_ids = {e.department_id for _, e in chunk if e.department_id is not None}
+        departments = {}
+        if department_ids:
+            from app.settings.routes import department_repo
+            departments = await get_many(department_repo, department_ids)
+        accepted = []
+        for index, employee in chunk:
+            if employee.id in seen:
+                result.error(index, f"Employee {employee.id} appears more than once")
+                continue
+            seen.add(employee.id)
+            if existing_only and employee.id not in existing:
+                result.error(index, f"Employee {employee.id} not found")
+                continue
+            if employee.department_id is not None:
+                dept = departments.get(employee.department_id)
+                if not dept:
+                    result.error(index, "Department does not exist")
+                    continue
+                employee.department = dept.name
+            accepted.append((index, employee))
+        await employee_repo.bulk_put([e for _, e in accepted])
+        for index, employee in accepted:
+            result.ok(index, "updated" if employee.id in existing else "created", employee.id)
+    return result.response()
+
 @router.get("/{id}", response_model=Employee)
-def get_employee(id: int):
-    record = employee_db.get(id)
+async def get_employee(id: int):
+    record = await employee_repo.get(id)
     if not record:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Employee {id} not found")
     return record
 
 @router.put("/{id}", response_model=Employee)
-def update_employee(id: int, employee: Employee):
-    if id not in employee_db:
+async def update_employee(id: int, employee: Employee):
+    if not await employee_repo.exists(id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Employee {id} not found")
     # Update department name if department_id is provided
     if getattr(employee, "department_id", None) is not None:
-        from app.settings.routes import department_db
-        dept = department_db.get(employee.department_id)
+        from app.settings.routes import department_repo
+        dept = await department_repo.get(employee.department_id)
         if dept:
             employee.department = dept.name
         else:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Department does not exist")
-    employee_db[id] = employee
+    employee = employee.copy(update={"id": id})
+    await employee_repo.put(employee)
     return employee
 
 @router.delete("/{id}")
-def delete_employee(id: int):
-    if id not in employee_db:
+async def delete_employee(id: int):
+    if not await employee_repo.delete(id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Employee {id} not found")
-    del employee_db[id]
     return {"message": f"Employee {id} deleted successfully"}
 
 from fastapi.responses import StreamingResponse
+from app.metrics import run_in_threadpool
+from app.reports.cache import report_cache
 import csv
 import io
-from fpdf import FPDF
 
 @router.get("/export/csv")
-def export_employees_csv():
+async def export_employees_csv():
+    async def compute():
+        return render_employees_csv(await employee_repo.list())
+    content = await report_cache.get_or_compute("employees.csv", {}, [employee_repo], compute)
+    return StreamingResponse(io.BytesIO(content), media_type="text/csv", headers={"Content-Disposition": "attachment; filename=employees.csv"})
+
+@router.get("/export/pdf")
+async def export_employees_pdf():
+    async def compute():
+        employees = await employee_repo.list()
+        # Rendering is CPU-bound, keep it off the event loop
+        return await run_in_threadpool(render_employees_pdf, employees)
+    content = await report_cache.get_or_compute("employees.pdf", {}, [employee_repo], compute)
+    return StreamingResponse(io.BytesIO(content), media_type="application/pdf", headers={"Content-Disposition": "attachment; filename=employees.pdf"})
+
+def render_employees_csv(employees) -> bytes:
     output = io.StringIO()
     writer = csv.writer(output)
     writer.writerow(["id", "name", "department", "tasks", "performance_scores", "performance_notes"])
-    for e in employee_db.values():
+    for e in employees:
         writer.writerow([
             e.id,
             e.name,
@@ -107,18 +164,15 @@ def export_employees_csv():
             ",".join(map(str, e.performance_scores)),
             ",".join(e.performance_notes)
         ])
-    output.seek(0)
-    return StreamingResponse(output, media_type="text/csv", headers={"Content-Disposition": "attachment; filename=employees.csv"})
+    return output.getvalue().encode()
 
-@router.get("/export/pdf")
-def export_employees_pdf():
+def render_employees_pdf(employees) -> bytes:
+    from fpdf import FPDF
     pdf = FPDF()
     pdf.add_page()
     pdf.set_font("Arial", size=12)
     pdf.cell(200, 10, txt="Employee Directory", ln=True, align="C")
     pdf.ln(10)
-    for e in employee_db.values():
+    for e in employees:
         pdf.cell(0, 10, txt=f"ID: {e.id}, Name: {e.name}, Dept: {getattr(e, 'department', '')}", ln=True)
-    pdf_output = io.BytesIO(pdf.output(dest='S').encode('latin1'))
-    pdf_output.seek(0)
-    return StreamingResponse(pdf_output, media_type="application/pdf", headers={"Content-Disposition": "attachment; filename=employees.pdf"})
\ No newline at end of file
+    return pdf.output(dest='S').encode('latin1')
\ No newline at end of file
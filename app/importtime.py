@@ -0,0 +1,98 @@
+import importlib._bootstrap as _bootstrap
+import os
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+# Per-module import cost, like `python -X importtime`, printed at startup
+IMPORT_PROFILE = os.getenv("EMS_IMPORT_PROFILE", "0").lower() in ("1", "true", "yes")
+IMPORT_PROFILE_TOP = int(os.getenv("EMS_IMPORT_PROFILE_TOP", "15"))
+# Warn when importing main plus the startup hooks takes longer; 0 disables the check
+STARTUP_BUDGET_MS = float(os.getenv("EMS_STARTUP_BUDGET_MS", "0"))
+
+
+class ImportProfiler:
+    """Times every module imported while installed.
+
+    Hooks the import system's `_find_and_load`, which the import statement
+    looks up on each import of a module not yet in sys.modules, so modules
+    that are already loaded cost nothing extra.
+    """
+
+    def __init__(self):
+        self.cumulative: Dict[str, float] = {}
+        self.self_time: Dict[str, float] = {}
+        self._local = threading.local()
+        self._original = None
+
+    def install(self):
+        if self._original is not None:
+            return
+        original = self._original = _bootstrap._find_and_load
+
+        def find_and_load(name, import_):
+            stack = self._local.__dict__.setdefault("stack", [])
+            stack.append(0.0)
+            started = time.perf_counter()
+            try:
+                return original(name, import_)
+            finally:
+                elapsed = time.perf_counter() - started
+                children = stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                self.cumulative[name] = elapsed
+                self.self_time[name] = elapsed - children
+
+        _bootstrap._find_and_load = find_and_load
+
+    def uninstall(self):
+        if self._original is not None:
+            _bootstrap._find_and_load = self._original
+            self._original = None
+
+    def report(self, top: int) -> str:
+        lines = [f"{'self ms':>9s} {'cumulative ms':>14s}  module"]
+        for name in sorted(self.self_time, key=self.self_time.get, reverse=True)[:top]:
+            lines.append(f"{self.self_time[name] * 1000:9.1f} {self.cumulative[name] * 1000:14.1f}  {name}")
+        return "\n".join(lines)
+
+
+class StartupTimer:
+    """Cold start: from main starting its imports to the startup hooks finishing."""
+
+    def __init__(self, budget_ms: float, profile: bool):
+        self.started = time.perf_counter()
+        self.budget_ms = budget_ms
+        self.import_seconds: Optional[float] = None
+        self.startup_seconds: Optional[float] = None
+        self.profiler = ImportProfiler() if profile else None
+        if self.profiler is not None:
+            self.profiler.install()
+
+    def imports_done(self):
+        self.import_seconds = time.perf_counter() - self.started
+        if self.profiler is not None:
+            self.profiler.uninstall()
+
+    def startup_done(self):
+        self.startup_seconds = time.perf_counter() - self.started
+        total_ms = self.startup_seconds * 1000
+        print(f"Started in {total_ms:.0f} ms ({(self.import_seconds or 0) * 1000:.0f} ms importing, "
+              f"{len(sys.modules)} modules loaded)")
+        if self.profiler is not None:
+            print("Slowest imports:\n" + self.profiler.report(IMPORT_PROFILE_TOP))
+        if self.budget_ms and total_ms > self.budget_ms:
+            print(f"Warning: startup took {total_ms:.0f} ms, over the {self.budget_ms:.0f} ms budget")
+
+    def stats(self) -> dict:
+        return {
+            "import_ms": round(self.import_seconds * 1000, 1) if self.import_seconds is not None else None,
+            "startup_ms": round(self.startup_seconds * 1000, 1) if self.startup_seconds is not None else None,
+            "budget_ms": self.budget_ms or None,
+            "modules_loaded": len(sys.modules),
+        }
+
+
+startup_timer = StartupTimer(STARTUP_BUDGET_MS, IMPORT_PROFILE)
@@ -0,0 +1,34 @@
+import importlib
+import importlib.util
+import threading
+
+# Heavy optional dependencies (PDF, Excel, image rendering) are imported on
+# first use, so starting the app never pays for them
+_modules = {}
+_lock = threading.Lock()
+
+
+def optional_module(name: str):
+    """Import `name` on first use; None if it is not installed."""
+    try:
+        return _modules[name]
+    except KeyError:
+        pass
+    # Renderers run on worker threads, so two may ask at once
+    with _lock:
+        if name not in _modules:
+            try:
+                _modules[name] = importlib.import_module(name)
+            except ImportError:
+                _modules[name] = None
+        return _modules[name]
+
+
+def installed(name: str) -> bool:
+    """Whether `name` can be imported, without importing it."""
+    if name in _modules:
+        return _modules[name] is not None
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
@@ -1,16 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from typing import List, Optional
 from pydantic import BaseModel
+from app.repository import get_repository
+from app.bulk import chunks, get_many, parse_items
 
 router = APIRouter(prefix="/leave", tags=["Leave"])
 
 # Example role-based dependency
-def get_current_user_role():
+async def get_current_user_role():
     # Placeholder: Replace with actual authentication logic
     return "employee"
 
 def require_role(roles: List[str]):
-    def role_checker(role: str = Depends(get_current_user_role)):
+    async def role_checker(role: str = Depends(get_current_user_role)):
         if role not in roles:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient permissions")
     return role_checker
@@ -33,21 +35,21 @@ class LeaveUpdate(BaseModel):
     reason: Optional[str] = None
     status: Optional[str] = None
 
+class LeaveBulkUpdate(LeaveUpdate):
+    id: int
+
 class Leave(LeaveBase):
     id: int
 
-# In-memory DB placeholder
-leave_db = {}
+leave_repo = get_repository("leave", Leave, indexes=("employee_id", "status"))
 
 @router.get("", response_model=List[Leave])
-def list_leaves(role: str = Depends(get_current_user_role)):
-    return list(leave_db.values())
+async def list_leaves(role: str = Depends(get_current_user_role)):
+    return await leave_repo.list()
 
 @router.post("", response_model=Leave, status_code=status.HTTP_201_CREATED, dependencies=[Depends(require_role(["admin", "manager", "employee"]))])
-def apply_leave(leave: LeaveCreate):
-    new_id = len(leave_db) + 1
-    record = Leave(id=new_id, **leave.dict())
-    leave_db[new_id] = record
+async def apply_leave(leave: LeaveCreate):
+    record = await leave_repo.insert(leave.dict())
     try:
         from app.notifications.logic import create_notification
         create_notification(user_id=record.employee_id, message=f"Your leave application from {record.start_date} to {record.end_date} has been submitted.", type_="leave_applied", related_leave=record.id)
@@ -57,20 +59,72 @@ def apply_leave(leave: LeaveCreate):
         pass
     return record
 
+@router.post("/bulk", dependencies=[Depends(require_role(["admin", "manager"]))])
+async def apply_leaves_bulk(request: Request):
+    """Create many leave applications: a JSON array, or NDJSON. Reports each leave's id or errors."""
+    valid, result = await parse_items(request, LeaveCreate)
+    for chunk in chunks(valid):
+        records = await leave_repo.bulk_insert([leave.dict() for _, leave in chunk])
+        for (index, _), record in zip(chunk, records):
+            result.ok(index, "created", record.id)
+        try:
+            from app.notifications.logic import create_notifications
+            notifications = []
+            for r in records:
+                notifications.append(dict(user_id=r.employee_id, message=f"Your leave application from {r.start_date} to {r.end_date} has been submitted.", type_="leave_applied", related_leave=r.id))
+                notifications.append(dict(user_id=1, message=f"Employee {r.employee_id} applied for leave from {r.start_date} to {r.end_date}.", type_="leave_applied", related_leave=r.id))
+            create_notifications(notifications)
+        except ImportError:
+            pass
+    return result.response()
+
+@router.put("/bulk", dependencies=[Depends(require_role(["admin", "manager"]))])
+async def update_leaves_bulk(request: Request):
+    """Update many leaves, e.g. approve a batch: each item has the leave's id and the fields to change."""
+    valid, result = await parse_items(request, LeaveBulkUpdate)
+    seen = set()
+    for chunk in chunks(valid):
+        current = await get_many(leave_repo, {u.id for _, u in chunk})
+        changes = {}
+        notifications = []
+        for index, update in chunk:
+            if update.id in seen:
+                result.error(index, f"Leave {update.id} appears more than once")
+            elif update.id not in current:
+                result.error(index, "Leave not found")
+            else:
+                fields = update.dict(exclude_unset=True, exclude={"id"})
+                if fields:
+                    changes[update.id] = fields
+                result.ok(index, "updated", update.id)
+                updated = current[update.id].copy(update=fields)
+                if update.status == "approved":
+                    notifications.append(dict(user_id=updated.employee_id, message=f"Your leave from {updated.start_date} to {updated.end_date} has been approved.", type_="leave_approved", related_leave=updated.id))
+                    notifications.append(dict(user_id=1, message=f"Leave for employee {updated.employee_id} has been approved.", type_="leave_approved", related_leave=updated.id))
+                elif update.status == "rejected":
+                    notifications.append(dict(user_id=updated.employee_id, message=f"Your leave from {updated.start_date} to {updated.end_date} has been rejected.", type_="leave_rejected", related_leave=updated.id))
+                    notifications.append(dict(user_id=1, message=f"Leave for employee {updated.employee_id} has been rejected.", type_="leave_rejected", related_leave=updated.id))
+            seen.add(update.id)
+        await leave_repo.bulk_update(changes)
+        try:
+            from app.notifications.logic import create_notifications
+            create_notifications(notifications)
+        except ImportError:
+            pass
+    return result.response()
+
 @router.get("/{leave_id}", response_model=Leave)
-def get_leave(leave_id: int):
-    record = leave_db.get(leave_id)
+async def get_leave(leave_id: int):
+    record = await leave_repo.get(leave_id)
     if not record:
         raise HTTPException(status_code=404, detail="Leave not found")
     return record
 
 @router.put("/{leave_id}", response_model=Leave, dependencies=[Depends(require_role(["admin", "manager"]))])
-def update_leave(leave_id: int, update: LeaveUpdate):
-    record = leave_db.get(leave_id)
-    if not record:
+async def update_leave(leave_id: int, update: LeaveUpdate):
+    updated = await leave_repo.update(leave_id, update.dict(exclude_unset=True))
+    if not updated:
         raise HTTPException(status_code=404, detail="Leave not found")
-    updated = record.copy(update=update.dict(exclude_unset=True))
-    leave_db[leave_id] = updated
     try:
         from app.notifications.logic import create_notification
         if update.status == "approved":
@@ -84,8 +138,7 @@ def update_leave(leave_id: int, update: LeaveUpdate):
     return updated
 
 @router.delete("/{leave_id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(require_role(["admin"]))])
-def delete_leave(leave_id: int):
-    if leave_id not in leave_db:
+async def delete_leave(leave_id: int):
+    if not await leave_repo.delete(leave_id):
         raise HTTPException(status_code=404, detail="Leave not found")
-    del leave_db[leave_id]
     return None
\ No newline at end of file
@@ -0,0 +1,233 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Tuple
+
+import anyio.to_thread
+from pymongo import monitoring
+from starlette.concurrency import run_in_threadpool as _run_in_threadpool
+
+# Upper bounds; each histogram also has an implicit +Inf bucket
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (128, 512, 2048, 8192, 32768, 131072, 524288, 2097152, 8388608)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class Histogram:
+    """Cumulative-bucket histogram. Not locked: callers serialise access."""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class HistogramFamily:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...], bounds: Tuple[float, ...]):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.bounds = bounds
+        self.children: Dict[tuple, Histogram] = {}
+
+    def get(self, *label_values) -> Histogram:
+        child = self.children.get(label_values)
+        if child is None:
+            child = self.children[label_values] = Histogram(self.bounds)
+        return child
+
+    def render(self, out: List[str]):
+        out.append(f"# HELP {self.name} {self.help}")
+        out.append(f"# TYPE {self.name} histogram")
+        for values, h in list(self.children.items()):
+            labels = _labels(self.labels, values)
+            cumulative = 0
+            for bound, n in zip(self.bounds, h.counts):
+                cumulative += n
+                out.append(f'{self.name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {cumulative}')
+            out.append(f'{self.name}_bucket{{{labels}{"," if labels else ""}le="+Inf"}} {h.count}')
+            out.append(f"{self.name}_sum{{{labels}}} {h.sum}")
+            out.append(f"{self.name}_count{{{labels}}} {h.count}")
+
+
+class CounterFamily:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...], type: str = "counter"):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.type = type
+        self.values: Dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self, out: List[str]):
+        out.append(f"# HELP {self.name} {self.help}")
+        out.append(f"# TYPE {self.name} {self.type}")
+        for values, v in list(self.values.items()):
+            out.append(f"{self.name}{{{_labels(self.labels, values)}}} {v}")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Tuple[str, ...], values: tuple) -> str:
+    return ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+
+
+http_requests = CounterFamily("ems_http_requests_total", "Requests by route template and status code.", ("method", "route", "status"))
+http_in_flight = CounterFamily("ems_http_requests_in_flight", "Requests currently being handled, by first path segment.", ("method", "prefix"), type="gauge")
+http_latency = HistogramFamily("ems_http_request_duration_seconds", "Time from request start to the last body byte sent.", ("method", "route"), LATENCY_BUCKETS)
+http_size = HistogramFamily("ems_http_response_size_bytes", "Response body size.", ("method", "route"), SIZE_BUCKETS)
+threadpool_wait = HistogramFamily("ems_threadpool_wait_seconds", "Time explicitly offloaded work waited for a worker thread.", ("function",), LATENCY_BUCKETS)
+threadpool_run = HistogramFamily("ems_threadpool_run_seconds", "Time explicitly offloaded work ran on a worker thread.", ("function",), LATENCY_BUCKETS)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: no per-request task or body buffering.
+
+    Requests are labelled with the route template (e.g. /employees/{id})
+    once routing has matched, so label cardinality stays bounded. In-flight
+    requests are counted before routing, under the first path segment when it
+    is one of `prefixes` (the routers' prefixes).
+    """
+
+    def __init__(self, app, prefixes: Iterable[str] = ()):
+        self.app = app
+        self.prefixes = frozenset(prefixes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        method = scope["method"]
+        started = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        prefix = _prefix(scope["path"])
+        in_flight_key = (method, prefix if prefix in self.prefixes else UNMATCHED_ROUTE)
+        http_in_flight.inc(*in_flight_key)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.inc(*in_flight_key, amount=-1)
+            route = scope.get("route")
+            template = getattr(route, "path_format", None) or getattr(route, "path", None) or UNMATCHED_ROUTE
+            http_latency.get(method, template).observe(time.perf_counter() - started)
+            http_size.get(method, template).observe(size)
+            http_requests.inc(method, template, status)
+
+
+def _prefix(path: str) -> str:
+    # First path segment only, e.g. /employees/42 -> /employees
+    end = path.find("/", 1)
+    return path if end == -1 else path[:end]
+
+
+async def run_in_threadpool(func: Callable, *args, **kwargs):
+    """fastapi.concurrency.run_in_threadpool that records queue wait and run time."""
+    name = getattr(func, "__qualname__", repr(func))
+    submitted = time.perf_counter()
+    timings = []
+
+    def timed():
+        started = time.perf_counter()
+        timings.append(started - submitted)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timings.append(time.perf_counter() - started)
+
+    try:
+        return await _run_in_threadpool(timed)
+    finally:
+        if timings:
+            threadpool_wait.get(name).observe(timings[0])
+        if len(timings) > 1:
+            threadpool_run.get(name).observe(timings[1])
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Mongo command latency by command name. Called from driver threads, hence the lock."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = HistogramFamily("ems_mongo_command_duration_seconds", "MongoDB command round trip time.", ("command",), LATENCY_BUCKETS)
+        self.failures = CounterFamily("ems_mongo_command_failures_total", "MongoDB commands that failed.", ("command",))
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        with self._lock:
+            self.latency.get(event.command_name).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        with self._lock:
+            self.latency.get(event.command_name).observe(event.duration_micros / 1e6)
+            self.failures.inc(event.command_name)
+
+    def render(self, out: List[str]):
+        with self._lock:
+            self.latency.render(out)
+            self.failures.render(out)
+
+
+command_metrics = CommandMetrics()
+
+# Point-in-time values read at scrape time: name -> (help, callable returning a number)
+gauges: Dict[str, Tuple[str, Callable[[], float]]] = {}
+
+
+def register_gauge(name: str, help: str, read: Callable[[], float]):
+    gauges[name] = (help, read)
+
+
+def _threadpool_gauges():
+    stats = anyio.to_thread.current_default_thread_limiter().statistics()
+    return stats.borrowed_tokens, stats.total_tokens, stats.tasks_waiting
+
+
+def render() -> str:
+    out: List[str] = []
+    for family in (http_requests, http_in_flight, http_latency, http_size, threadpool_wait, threadpool_run):
+        family.render(out)
+    command_metrics.render(out)
+    samples = []
+    try:
+        busy, capacity, waiting = _threadpool_gauges()
+        samples += [
+            ("ems_threadpool_threads_busy", "Worker threads running sync handlers, dependencies or offloaded work.", busy),
+            ("ems_threadpool_capacity", "Worker thread limit.", capacity),
+            ("ems_threadpool_tasks_waiting", "Calls queued for a worker thread, including sync handlers.", waiting),
+        ]
+    except RuntimeError:
+        pass  # no running event loop
+    for name, (help, read) in list(gauges.items()):
+        try:
+            samples.append((name, help, read()))
+        except Exception as e:
+            print(f"Error reading metric {name}: {e}")
+    for name, help, value in samples:
+        out.append(f"# HELP {name} {help}")
+        out.append(f"# TYPE {name} gauge")
+        out.append(f"{name} {value}")
+    return "\n".join(out) + "\n"
@@ -1,20 +1,115 @@
-from typing import List, Dict, Any
-from datetime import datetime
+from array import array
+from typing import List, Dict, Any, Iterator, Optional
+from datetime import datetime, timedelta
+
+_EPOCH = datetime(1970, 1, 1)
+_RELATED = ("related_task", "related_leave", "related_attendance")
+
+
+class NotificationStore:
+    """Append-only notifications, kept as one array per field.
+
+    A dict per notification costs about 500 bytes. Here user ids, related ids
+    and timestamps (microseconds since the epoch) are machine integers, the
+    type is a code into a small table, and only the message is a Python
+    object. Dicts are built only for the notifications returned, and each
+    user's notifications are indexed. Ids are positions, from 1.
+    """
+
+    def __init__(self):
+        self._user_ids = array("q")
+        self._messages: List[str] = []
+        self._types = array("H")
+        self._type_names: List[str] = []
+        self._type_codes: Dict[str, int] = {}
+        self._timestamps = array("q")
+        # 0 for None; ids start at 1
+        self._related = {field: array("q") for field in _RELATED}
+        self._by_user: Dict[int, array] = {}
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def append(self, notification: Dict[str, Any]):
+        # Any "id" given is ignored: it is always the next position
+        index = len(self._messages)
+        self._user_ids.append(notification["user_id"])
+        self._messages.append(notification["message"])
+        code = self._type_codes.get(notification["type"])
+        if code is None:
+            code = self._type_codes[notification["type"]] = len(self._type_names)
+            self._type_names.append(notification["type"])
+        self._types.append(code)
+        self._timestamps.append((datetime.fromisoformat(notification["timestamp"]) - _EPOCH) // timedelta(microseconds=1))
+        for field in _RELATED:
+            self._related[field].append(notification.get(field) or 0)
+        self._by_user.setdefault(notification["user_id"], array("I")).append(index)
+
+    def extend(self, notifications: List[Dict[str, Any]]):
+        for notification in notifications:
+            self.append(notification)
+
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        if index < 0:
+            index += len(self._messages)
+        notification = {
+            "id": index + 1,
+            "user_id": self._user_ids[index],
+            "message": self._messages[index],
+            "type": self._type_names[self._types[index]],
+            "timestamp": (_EPOCH + timedelta(microseconds=self._timestamps[index])).isoformat(),
+        }
+        for field in _RELATED:
+            notification[field] = self._related[field][index] or None
+        return notification
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return (self[i] for i in range(len(self._messages)))
+
+    def for_user(self, user_id: int, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """The user's notifications, oldest first; with `limit`, only the newest `limit`."""
+        indexes = self._by_user.get(user_id, ())
+        if limit is not None:
+            indexes = indexes[max(len(indexes) - limit, 0):]
+        return [self[i] for i in indexes]
+
+    def count_for_user(self, user_id: int) -> int:
+        return len(self._by_user.get(user_id, ()))
+
 
 # In-memory notification store
-notification_db: List[Dict[str, Any]] = []
+notification_db = NotificationStore()
 
-def create_notification(user_id: int, message: str, type_: str = "info", related_task: int = None):
+def create_notification(user_id: int, message: str, type_: str = "info", related_task: int = None, related_leave: int = None, related_attendance: int = None):
     notification = {
-        "id": len(notification_db) + 1,
         "user_id": user_id,
         "message": message,
         "type": type_,
         "timestamp": datetime.utcnow().isoformat(),
-        "related_task": related_task
+        "related_task": related_task,
+        "related_leave": related_leave,
+        "related_attendance": related_attendance
     }
     notification_db.append(notification)
-    return notification
+    return notification_db[-1]
+
+def create_notifications(notifications: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # For bulk endpoints: each item holds create_notification's keyword arguments
+    timestamp = datetime.utcnow().isoformat()
+    first = len(notification_db)
+    notification_db.extend([
+        {
+            "user_id": n["user_id"],
+            "message": n["message"],
+            "type": n.get("type_", "info"),
+            "timestamp": timestamp,
+            "related_task": n.get("related_task"),
+            "related_leave": n.get("related_leave"),
+            "related_attendance": n.get("related_attendance")
+        }
+        for n in notifications
+    ])
+    return [notification_db[i] for i in range(first, len(notification_db))]
 
 def get_notifications_for_user(user_id: int) -> List[Dict[str, Any]]:
-    return [n for n in notification_db if n["user_id"] == user_id]
\ No newline at end of file
+    return notification_db.for_user(user_id)
@@ -0,0 +1,629 @@
+import asyncio
+import atexit
+import bisect
+import json
+import os
+import pickle
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from datetime import date
+from functools import partial
+from operator import attrgetter, eq
+from typing import Any, Dict, Iterable, List, Optional, Type
+
+from app.metrics import run_in_threadpool
+from app.repository import (_OPERATORS, EXPORT_CHUNK_RECORDS, CompactRepository, InMemoryRepository,
+                            group_records, period_key)
+from app.serialization import dump_records, dumps
+
+# Months kept in memory as records, the current one included; older months
+# live in compressed columnar files and are read back when a query reaches them
+PARTITION_HOT_MONTHS = int(os.getenv("EMS_PARTITION_HOT_MONTHS", "2"))
+# Where cold partitions are written: EMS_DATA_DIR when persistence is on (the
+# snapshot refers to them), else a temporary directory removed at exit
+PARTITION_DIR = os.getenv("EMS_PARTITION_DIR") or (
+    os.path.join(os.getenv("EMS_DATA_DIR"), "partitions") if os.getenv("EMS_DATA_DIR") else None)
+# Compact as soon as this many rows of cold months are in memory (e.g. while
+# importing history), otherwise at most every PARTITION_CHECK_SECONDS
+PARTITION_COMPACT_ROWS = int(os.getenv("EMS_PARTITION_COMPACT_ROWS", "20000"))
+PARTITION_CHECK_SECONDS = float(os.getenv("EMS_PARTITION_CHECK_SECONDS", "60"))
+# Values (rows x columns) of decoded cold columns kept for reuse
+PARTITION_CACHE_VALUES = int(os.getenv("EMS_PARTITION_CACHE_VALUES", "1000000"))
+
+_MAGIC = b"EMSPART1"
+# Magic, then the length of the JSON header that locates each column
+_HEADER = struct.Struct("<8sI")
+
+
+def write_partition(path: str, columns: Dict[str, list]) -> int:
+    """Write equal-length columns as one zlib-compressed pickle each; returns the file size."""
+    header = {"count": len(next(iter(columns.values()), [])), "columns": {}}
+    blobs = []
+    offset = 0
+    for field, values in columns.items():
+        blob = zlib.compress(pickle.dumps(values, protocol=pickle.HIGHEST_PROTOCOL), 6)
+        header["columns"][field] = [offset, len(blob)]
+        offset += len(blob)
+        blobs.append(blob)
+    head = json.dumps(header).encode()
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, len(head)) + head)
+        for blob in blobs:
+            f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return os.path.getsize(path)
+
+
+def read_columns(path: str, fields: Iterable[str]) -> Dict[str, list]:
+    """Read only the requested columns of a partition file."""
+    with open(path, "rb") as f:
+        magic, length = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a partition file")
+        header = json.loads(f.read(length))
+        start = _HEADER.size + length
+        columns = {}
+        for field in fields:
+            offset, size = header["columns"][field]
+            f.seek(start + offset)
+            columns[field] = pickle.loads(zlib.decompress(f.read(size)))
+    return columns
+
+
+def _select(columns: Dict[str, list], count: int, filters: Dict[str, Any]) -> List[int]:
+    # Row numbers matching `filters`, evaluated one column at a time
+    rows = None
+    for field, cond in filters.items():
+        values = columns[field]
+        for op, operand in (cond.items() if isinstance(cond, dict) else [("$eq", cond)]):
+            if op == "$eq":
+                test = partial(eq, operand)
+            elif op == "$in":
+                test = set(operand).__contains__
+            else:
+                test = lambda v, test=_OPERATORS[op], operand=operand: test(v, operand)
+            if rows is None:
+                rows = [i for i, v in enumerate(values) if test(v)]
+            else:
+                rows = [i for i in rows if test(values[i])]
+    return list(range(count)) if rows is None else rows
+
+
+class PartitionedRepository(CompactRepository):
+    """In-memory store partitioned by the month of a date field.
+
+    The last `hot_months` months are held as rows like any other
+    CompactRepository. Older months are compacted, in a background thread,
+    into one compressed columnar file per month, and only the columns a query
+    needs are read back, for the months its date filter reaches; an LRU keeps
+    recently used columns decoded. Writing to a record of a cold month first
+    brings its month back into memory ("thaws" it) until the next compaction.
+
+    The lock only covers in-memory state. Reading, decoding and turning cold
+    rows into records run in the threadpool, on the partitions as they were
+    when the lock was released; files are pinned meanwhile, so a compaction
+    or thaw that replaces one defers deleting it.
+    """
+
+    def __init__(self, name: str, model: Type, indexes: Iterable = (), shared: Iterable[str] = (),
+                 partition_by: str = "date", directory: Optional[str] = None, hot_months: int = PARTITION_HOT_MONTHS):
+        super().__init__(name, model, indexes, shared)
+        self.partition_by = partition_by
+        self.hot_months = hot_months
+        if directory is None:
+            directory = tempfile.mkdtemp(prefix=f"ems-{name}-")
+            atexit.register(shutil.rmtree, directory, True)
+        else:
+            directory = os.path.join(directory, name)
+            os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        # month -> {"file", "count", "min_id", "max_id", "bytes"}
+        self._cold: Dict[str, dict] = {}
+        # month -> records of that month held in memory
+        self._months: Dict[str, int] = {}
+        self._columns: "OrderedDict[tuple, list]" = OrderedDict()
+        self._columns_lock = threading.Lock()
+        self._cached_values = 0
+        self._compact_lock = threading.Lock()
+        self._next_check = 0.0
+        # Set once persistence adopts the directory: replaced files are then
+        # kept until a snapshot no longer refers to them
+        self.persisted = False
+        self._retired: List[str] = []
+        # file -> reads in progress; pinned files are deleted once unpinned
+        self._pins: Dict[str, int] = {}
+        self._doomed: set = set()
+        self._snapshot_manifest: Dict[str, dict] = {}
+        self.compactions = 0
+        self.thaws = 0
+        self.column_reads = 0
+
+    def _month(self, record) -> str:
+        return period_key(str(getattr(record, self.partition_by)), "monthly")
+
+    def hot_floor(self) -> str:
+        """First month held in memory; earlier ones are cold."""
+        today = date.today()
+        months = today.year * 12 + today.month - 1 - (self.hot_months - 1)
+        return f"{months // 12:04d}-{months % 12 + 1:02d}"
+
+    def _add_to_indexes(self, record):
+        super()._add_to_indexes(record)
+        month = self._month(record)
+        self._months[month] = self._months.get(month, 0) + 1
+
+    def _remove_from_indexes(self, record):
+        super()._remove_from_indexes(record)
+        month = self._month(record)
+        if self._months.get(month, 0) > 1:
+            self._months[month] -= 1
+        else:
+            self._months.pop(month, None)
+
+    def _log(self, op, records, created=None):
+        super()._log(op, records, created)
+        self._maybe_compact()
+
+    # Cold partitions
+
+    def _path(self, entry: dict) -> str:
+        return os.path.join(self.directory, entry["file"])
+
+    def _retire(self, file: str):
+        if not self.persisted:
+            self._delete_file(file)
+        else:
+            self._retired.append(file)
+
+    def _pin(self, entries: Iterable[dict]):
+        # Caller holds the lock
+        for entry in entries:
+            self._pins[entry["file"]] = self._pins.get(entry["file"], 0) + 1
+
+    def _unpin(self, entries: Iterable[dict]):
+        with self._lock:
+            for entry in entries:
+                file = entry["file"]
+                if self._pins[file] > 1:
+                    self._pins[file] -= 1
+                    continue
+                del self._pins[file]
+                if file in self._doomed:
+                    self._doomed.discard(file)
+                    self._delete_file(file)
+
+    def _delete_file(self, file: str):
+        # Caller holds the lock
+        if file in self._pins:
+            self._doomed.add(file)
+            return
+        with self._columns_lock:
+            for key in [k for k in self._columns if k[0] == file]:
+                self._cached_values -= len(self._columns.pop(key))
+        try:
+            os.remove(os.path.join(self.directory, file))
+        except FileNotFoundError:
+            pass
+
+    def _load(self, entry: dict, fields: Iterable[str]) -> Dict[str, list]:
+        columns, missing = {}, []
+        with self._columns_lock:
+            for field in fields:
+                key = (entry["file"], field)
+                if key in self._columns:
+                    self._columns.move_to_end(key)
+                    columns[field] = self._columns[key]
+                else:
+                    missing.append(field)
+        if missing:
+            loaded = read_columns(self._path(entry), missing)
+            self.column_reads += len(missing)
+            with self._columns_lock:
+                for field, values in loaded.items():
+                    key = (entry["file"], field)
+                    if key not in self._columns:
+                        self._columns[key] = values
+                        self._cached_values += len(values)
+                while self._cached_values > PARTITION_CACHE_VALUES and self._columns:
+                    self._cached_values -= len(self._columns.popitem(last=False)[1])
+            columns.update(loaded)
+        return columns
+
+    def _records_of(self, entry: dict, rows: Optional[List[int]] = None) -> List:
+        columns = self._load(entry, self.fields)
+        if rows is None:
+            rows = range(entry["count"])
+        return [self.model(**{f: columns[f][i] for f in self.fields}) for i in rows]
+
+    def _rows_of(self, entry: dict) -> List:
+        # Stored rows for a whole month, without building models
+        columns = [self._load(entry, self.fields)[f] for f in self.fields]
+        tables = [self._shared.get(f) for f in self.fields]
+        rows = []
+        for i in range(entry["count"]):
+            row = self._row_type()
+            for field, values, table in zip(self.fields, columns, tables):
+                value = values[i]
+                setattr(row, field, value if table is None else table.setdefault(value, value))
+            rows.append(row)
+        return rows
+
+    def _find(self, entries: List[dict], id: int):
+        # Threadpool: the record `id` from the first of `entries` holding it
+        for entry in entries:
+            ids = self._load(entry, ["id"])["id"]
+            i = bisect.bisect_left(ids, id)
+            if i < len(ids) and ids[i] == id:
+                return self._records_of(entry, [i])[0]
+        return None
+
+    def _holding(self, entries: List[tuple], ids: List[int]) -> List[tuple]:
+        # Threadpool: (month, entry, rows) for each entry, rows None when it
+        # holds none of `ids`
+        found = []
+        for month, entry in entries:
+            stored = self._load(entry, ["id"])["id"]
+            held = False
+            for id in ids:
+                i = bisect.bisect_left(stored, id)
+                if i < len(stored) and stored[i] == id:
+                    held = True
+                    break
+            found.append((month, entry, self._rows_of(entry) if held else None))
+        return found
+
+    async def _write(self, ids: Iterable[int], write):
+        """Run `write()` under the lock once no record of `ids` is cold.
+
+        Months holding any of them are read in the threadpool, then thawed;
+        the check is repeated under the lock, since a compaction may have
+        moved them again in between.
+        """
+        ids = list(ids)
+        checked = set()  # files read and found not to hold any of the ids
+        while True:
+            with self._lock:
+                missing = [id for id in ids if id not in self._records] if self._cold else []
+                entries = [(m, e) for m, e in self._cold.items() if e["file"] not in checked
+                           and any(e["min_id"] <= id <= e["max_id"] for id in missing)]
+                if not entries:
+                    return write()
+                self._pin(e for _, e in entries)
+            try:
+                found = await run_in_threadpool(self._holding, entries, missing)
+            finally:
+                self._unpin(e for _, e in entries)
+            with self._lock:
+                for month, entry, rows in found:
+                    if rows is None:
+                        checked.add(entry["file"])
+                    elif self._cold.get(month) is entry:
+                        # The records are unchanged, so nothing is journaled
+                        del self._cold[month]
+                        for row in rows:
+                            InMemoryRepository._store(self, row)
+                        self._retire(entry["file"])
+                        self.thaws += 1
+
+    def _read(self, entries: List[dict], filters: Dict[str, Any]) -> List:
+        # Threadpool: the records of `entries` matching `filters`
+        records = []
+        for entry in entries:
+            columns = self._load(entry, filters)
+            records.extend(self._records_of(entry, _select(columns, entry["count"], filters)))
+        return records
+
+    def _selected(self, entry: dict, filters: Dict[str, Any]) -> List[int]:
+        return _select(self._load(entry, filters), entry["count"], filters)
+
+    def _dump_cold(self, entry: dict, rows: List[int]) -> bytes:
+        columns = self._load(entry, self.fields)
+        return dumps([{f: columns[f][i] for f in self.fields} for i in rows])
+
+    def _count(self, entries: List[dict], filters: Dict[str, Any]) -> int:
+        return sum(len(_select(self._load(entry, filters), entry["count"], filters)) for entry in entries)
+
+    def _group(self, entries: List[dict], filters: Dict[str, Any], by, period, counts: Dict[tuple, int]):
+        # Threadpool: adds the matching cold rows to `counts`, reading only
+        # the filtered and grouped columns
+        fields = set(filters) | set(by) | ({period[0]} if period else set())
+        for entry in entries:
+            columns = self._load(entry, fields)
+            keys = [columns[field] for field in by]
+            if period:
+                buckets = {}
+                keys.insert(0, [buckets[d] if d in buckets else buckets.setdefault(d, period_key(d, period[1]))
+                                for d in columns[period[0]]])
+            for i in _select(columns, entry["count"], filters):
+                key = tuple(k[i] for k in keys)
+                counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def _touched(self, filters: Optional[Dict[str, Any]]) -> List[dict]:
+        # Cold partitions the date filter can match, oldest first
+        cond = (filters or {}).get(self.partition_by)
+        months = sorted(self._cold)
+        if cond is None:
+            return [self._cold[m] for m in months]
+        if not isinstance(cond, dict):
+            cond = {"$eq": cond}
+        low = high = only = None
+        for op, operand in cond.items():
+            if op == "$eq":
+                only = {str(operand)[:7]}
+            elif op == "$in":
+                only = {str(v)[:7] for v in operand}
+            elif op in ("$gt", "$gte"):
+                low = str(operand)[:7]
+            elif op in ("$lt", "$lte"):
+                high = str(operand)[:7]
+        return [self._cold[m] for m in months
+                if (only is None or m in only) and (low is None or m >= low) and (high is None or m <= high)]
+
+    def _cold_month_of(self, id: int) -> Optional[str]:
+        for month, entry in self._cold.items():
+            if entry["min_id"] <= id <= entry["max_id"]:
+                ids = self._load(entry, ["id"])["id"]
+                i = bisect.bisect_left(ids, id)
+                if i < len(ids) and ids[i] == id:
+                    return month
+        return None
+
+    def _thaw(self, months: Iterable[str]):
+        # Recovery only, before requests are served: reads under the lock.
+        # The records are unchanged, so nothing is journaled
+        for month in months:
+            entry = self._cold.pop(month, None)
+            if entry is None:
+                continue
+            for record in self._records_of(entry):
+                self._store(record)
+            self._retire(entry["file"])
+            self.thaws += 1
+
+    def _thaw_ids(self, ids: Iterable[int]):
+        if self._cold:
+            self._thaw({m for m in (self._cold_month_of(id) for id in ids if id not in self._records) if m})
+
+    # Compaction
+
+    def _maybe_compact(self):
+        # Called with the lock held after every write
+        now = time.monotonic()
+        if self._compact_lock.locked() or not self._months:
+            return
+        floor = self.hot_floor()
+        pending = sum(n for m, n in self._months.items() if m < floor)
+        if not pending or (now < self._next_check and pending < PARTITION_COMPACT_ROWS):
+            return
+        self._next_check = now + PARTITION_CHECK_SECONDS
+        threading.Thread(target=self.compact, name=f"{self.name}-compaction", daemon=True).start()
+
+    def compact(self) -> int:
+        """Move the in-memory records of months before the hot window to their cold files.
+
+        Files are written without the lock; a month whose records change
+        meanwhile is left for the next run. Returns the number of records moved.
+        """
+        if not self._compact_lock.acquire(blocking=False):
+            return 0
+        moved = 0
+        try:
+            floor = self.hot_floor()
+            with self._lock:
+                by_month: Dict[str, List] = {}
+                for record in self._records.values():
+                    month = self._month(record)
+                    if month < floor:
+                        by_month.setdefault(month, []).append(record)
+                previous = {m: self._cold.get(m) for m in by_month}
+            for month in sorted(by_month):
+                moved += self._compact_month(month, by_month[month], previous[month])
+        finally:
+            self._compact_lock.release()
+        return moved
+
+    def _compact_month(self, month: str, records: List, old: Optional[dict]) -> int:
+        columns = {f: [getattr(r, f) for r in records] for f in self.fields}
+        if old is not None:
+            with self._lock:
+                if self._cold.get(month) is not old:
+                    return 0
+                self._pin([old])
+            try:
+                existing = self._load(old, self.fields)
+            finally:
+                self._unpin([old])
+            columns = {f: existing[f] + columns[f] for f in self.fields}
+        # Sorted by id so a lookup by id is a bisection
+        order = sorted(range(len(columns["id"])), key=columns["id"].__getitem__)
+        columns = {f: [values[i] for i in order] for f, values in columns.items()}
+        entry = {"file": f"{month}-{uuid.uuid4().hex[:8]}.part", "count": len(order),
+                 "min_id": columns["id"][0], "max_id": columns["id"][-1]}
+        entry["bytes"] = write_partition(self._path(entry), columns)
+        with self._lock:
+            if self._cold.get(month) is not old or any(self._records.get(r.id) is not r for r in records):
+                self._delete_file(entry["file"])
+                return 0
+            for record in records:
+                del self._records[record.id]
+                self._remove_from_indexes(record)
+            self._cold[month] = entry
+            if old is not None:
+                self._retire(old["file"])
+            self.compactions += 1
+            self._trim_shared()
+        return len(records)
+
+    # Repository interface. The rows in memory are read and the partitions to
+    # read pinned under one hold of the lock, or a compaction in between could
+    # move records from memory to a partition already chosen (or not yet); the
+    # pinned files are then read in the threadpool
+
+    async def get(self, id):
+        with self._lock:
+            row = self._records.get(id)
+            if row is not None:
+                return self._unpack(row)
+            entries = [e for e in self._cold.values() if e["min_id"] <= id <= e["max_id"]]
+            if not entries:
+                return None
+            self._pin(entries)
+        try:
+            return await run_in_threadpool(self._find, entries, id)
+        finally:
+            self._unpin(entries)
+
+    async def exists(self, id):
+        return await self.get(id) is not None
+
+    async def list(self, filters=None, sort=None, skip=0, limit=None):
+        with self._lock:
+            rows = self._matching(filters)
+            touched = self._touched(filters)
+            self._pin(touched)
+        if not touched:
+            return [self._unpack(row) for row in self._order(rows, sort, skip, limit)]
+        records = [self._unpack(row) for row in rows]
+        try:
+            records.extend(await run_in_threadpool(self._read, touched, filters or {}))
+        finally:
+            self._unpin(touched)
+        if not sort:
+            # Same order as without partitions
+            records.sort(key=lambda r: r.id)
+        return self._order(records, sort, skip, limit)
+
+    async def list_json(self, filters=None, sort=None, skip=0, limit=None):
+        # Not CompactRepository's, which only sees the rows in memory
+        return dump_records(await self.list(filters, sort, skip, limit))
+
+    async def iter_json(self, filters=None, size=EXPORT_CHUNK_RECORDS):
+        # Month by month, oldest first: each cold partition is selected and
+        # dumped in the threadpool, then come the rows in memory
+        with self._lock:
+            rows = sorted(self._matching(filters), key=attrgetter("id"))
+            touched = self._touched(filters)
+            self._pin(touched)
+        try:
+            for entry in touched:
+                selected = await run_in_threadpool(self._selected, entry, filters or {})
+                for start in range(0, len(selected), size):
+                    yield await run_in_threadpool(self._dump_cold, entry, selected[start:start + size])
+        finally:
+            self._unpin(touched)
+        for start in range(0, len(rows), size):
+            yield self._dump(rows[start:start + size])
+            await asyncio.sleep(0)
+
+    async def count(self, filters=None):
+        with self._lock:
+            total = len(self._matching(filters)) if filters else len(self._records)
+            touched = self._touched(filters)
+            if not filters:
+                return total + sum(entry["count"] for entry in touched)
+            self._pin(touched)
+        try:
+            return total + await run_in_threadpool(self._count, touched, filters)
+        finally:
+            self._unpin(touched)
+
+    async def group_count(self, filters=None, by=(), period=None):
+        with self._lock:
+            counts = group_records(self._matching(filters), by, period)
+            touched = self._touched(filters)
+            self._pin(touched)
+        try:
+            return await run_in_threadpool(self._group, touched, filters or {}, by, period, counts)
+        finally:
+            self._unpin(touched)
+
+    # Writes to a record of a cold month thaw it first
+
+    async def put(self, record):
+        return await self._write([record.id], lambda: self._put([record])[0])
+
+    async def bulk_put(self, records):
+        return await self._write([r.id for r in records], lambda: self._put(records))
+
+    async def update(self, id, changes):
+        def update():
+            updated = self._update({id: changes})
+            return updated[0] if updated else None
+        return await self._write([id], update)
+
+    async def bulk_update(self, changes_by_id):
+        return await self._write(changes_by_id, lambda: len(self._update(changes_by_id)))
+
+    async def delete(self, id):
+        return await self._write([id], lambda: self._delete(id))
+
+    # Persistence
+
+    def snapshot(self):
+        with self._lock:
+            self._snapshot_manifest = {m: dict(e) for m, e in self._cold.items()}
+            return super().snapshot()
+
+    def snapshot_partitions(self) -> Dict[str, dict]:
+        """Cold partitions as of the last snapshot(), for the snapshot file."""
+        return self._snapshot_manifest
+
+    def snapshot_written(self):
+        # Only the partitions in the snapshot just written can be needed for recovery now
+        keep = {e["file"] for e in self._snapshot_manifest.values()}
+        with self._lock:
+            retired, self._retired = self._retired, []
+            for file in retired:
+                if file in keep:
+                    self._retired.append(file)
+                else:
+                    self._delete_file(file)
+
+    def restore_partitions(self, manifest: Dict[str, dict]):
+        """Adopt the cold partitions of a recovered snapshot, deleting files it does not list."""
+        with self._lock:
+            self.persisted = True
+            self._cold = {m: dict(e) for m, e in manifest.items()}
+            for entry in self._cold.values():
+                self._sequence = max(self._sequence, entry["max_id"])
+            listed = {e["file"] for e in self._cold.values()}
+            for file in os.listdir(self.directory):
+                if file not in listed:
+                    self._delete_file(file)
+
+    def restore(self, op, records, sequence=0):
+        with self._lock:
+            self._thaw_ids([r.id for r in records])
+            super().restore(op, records, sequence)
+            self._maybe_compact()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "partitioned": True,
+                "hot_floor": self.hot_floor(),
+                "hot_records": len(self._records),
+                "hot_months": dict(sorted(self._months.items())),
+                "cold_partitions": len(self._cold),
+                "cold_records": sum(e["count"] for e in self._cold.values()),
+                "cold_bytes": sum(e["bytes"] for e in self._cold.values()),
+                "cached_columns": len(self._columns),
+                "cached_values": self._cached_values,
+                "column_reads": self.column_reads,
+                "compactions": self.compactions,
+                "thaws": self.thaws,
+                "shared_values": {f: len(t) for f, t in self._shared.items()},
+                "shared_rebuilds": self.shared_rebuilds,
+                "compacting": self._compact_lock.locked(),
+                "directory": self.directory,
+            }
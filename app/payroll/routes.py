@@ -1,16 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from typing import List, Optional
 from pydantic import BaseModel
+from app.repository import get_repository
+from app.bulk import chunks, get_many, parse_items
+from app.serialization import list_response
 
 router = APIRouter(prefix="/payroll", tags=["Payroll"])
 
 # Example role-based dependency
-def get_current_user_role():
+async def get_current_user_role():
     # Placeholder: Replace with actual authentication logic
     return "employee"
 
 def require_role(roles: List[str]):
-    def role_checker(role: str = Depends(get_current_user_role)):
+    async def role_checker(role: str = Depends(get_current_user_role)):
         if role not in roles:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient permissions")
     return role_checker
@@ -36,27 +39,30 @@ class PayrollUpdate(BaseModel):
     status: Optional[str] = None
     notes: Optional[str] = None
 
+class PayrollBulkUpdate(PayrollUpdate):
+    id: int
+
 class Payroll(PayrollBase):
     id: int
 
-# In-memory DB placeholder
-payroll_db = {}
+# Compact rows in memory; an employee's pay usually repeats from one period to the next
+payroll_repo = get_repository("payroll", Payroll, indexes=("employee_id", "period", ("employee_id", "period")), compact=(
+    "employee_id", "period", "base_salary", "bonus", "deductions", "net_pay", "status",
+))
 
 @router.get("", response_model=List[Payroll], dependencies=[Depends(require_role(["admin", "manager"]))])
-def list_payrolls(employee_id: Optional[int] = None, period: Optional[str] = None):
-    records = list(payroll_db.values())
+async def list_payrolls(employee_id: Optional[int] = None, period: Optional[str] = None):
+    filters = {}
     if employee_id is not None:
-        records = [r for r in records if r.employee_id == employee_id]
+        filters["employee_id"] = employee_id
     if period is not None:
-        records = [r for r in records if r.period == period]
-    return records
+        filters["period"] = period
+    return await list_response(payroll_repo, filters)
 
 @router.post("", response_model=Payroll, status_code=status.HTTP_201_CREATED, dependencies=[Depends(require_role(["admin", "manager"]))])
-def add_payroll(payroll: PayrollCreate):
-    new_id = len(payroll_db) + 1
+async def add_payroll(payroll: PayrollCreate):
     net_pay = payroll.base_salary + (payroll.bonus or 0) - (payroll.deductions or 0)
-    record = Payroll(id=new_id, **payroll.dict(), net_pay=net_pay)
-    payroll_db[new_id] = record
+    record = await payroll_repo.insert({**payroll.dict(), "net_pay": net_pay})
     try:
         from app.notifications.logic import create_notification
         create_notification(user_id=record.employee_id, message=f"Payroll for {record.period} has been created.", type_="payroll_created")
@@ -64,26 +70,82 @@ def add_payroll(payroll: PayrollCreate):
         pass
     return record
 
+@router.post("/bulk", dependencies=[Depends(require_role(["admin", "manager"]))])
+async def add_payrolls_bulk(request: Request):
+    """Create many payroll records: a JSON array, or NDJSON. Reports each record's id or errors."""
+    valid, result = await parse_items(request, PayrollCreate)
+    for chunk in chunks(valid):
+        records = await payroll_repo.bulk_insert([
+            {**p.dict(), "net_pay": p.base_salary + (p.bonus or 0) - (p.deductions or 0)} for _, p in chunk
+        ])
+        for (index, _), record in zip(chunk, records):
+            result.ok(index, "created", record.id)
+        try:
+            from app.notifications.logic import create_notifications
+            create_notifications([
+                dict(user_id=r.employee_id, message=f"Payroll for {r.period} has been created.", type_="payroll_created")
+                for r in records
+            ])
+        except ImportError:
+            pass
+    return result.response()
+
+@router.put("/bulk", dependencies=[Depends(require_role(["admin", "manager"]))])
+async def update_payrolls_bulk(request: Request):
+    """Update many payroll records, e.g. mark a period paid: each item has the record's id and the fields to change."""
+    valid, result = await parse_items(request, PayrollBulkUpdate)
+    seen = set()
+    for chunk in chunks(valid):
+        notifications = []
+        # net_pay is derived from the stored fields, which must not change in between
+        async with payroll_repo.lock:
+            current = await get_many(payroll_repo, {u.id for _, u in chunk})
+            changes = {}
+            for index, update in chunk:
+                if update.id in seen:
+                    result.error(index, f"Payroll {update.id} appears more than once")
+                elif update.id not in current:
+                    result.error(index, "Payroll not found")
+                else:
+                    record = current[update.id]
+                    updated_data = update.dict(exclude_unset=True, exclude={"id"})
+                    base_salary = updated_data.get("base_salary", record.base_salary)
+                    bonus = updated_data.get("bonus", record.bonus)
+                    deductions = updated_data.get("deductions", record.deductions)
+                    changes[update.id] = {**updated_data, "net_pay": base_salary + (bonus or 0) - (deductions or 0)}
+                    result.ok(index, "updated", update.id)
+                    if update.status == "paid":
+                        notifications.append(dict(user_id=record.employee_id, message=f"Your payroll for {record.period} has been marked as paid.", type_="payroll_paid"))
+                seen.add(update.id)
+            await payroll_repo.bulk_update(changes)
+        try:
+            from app.notifications.logic import create_notifications
+            create_notifications(notifications)
+        except ImportError:
+            pass
+    return result.response()
+
 @router.get("/{payroll_id}", response_model=Payroll, dependencies=[Depends(require_role(["admin", "manager", "employee"]))])
-def get_payroll(payroll_id: int):
-    record = payroll_db.get(payroll_id)
+async def get_payroll(payroll_id: int):
+    record = await payroll_repo.get(payroll_id)
     if not record:
         raise HTTPException(status_code=404, detail="Payroll not found")
     return record
 
 @router.put("/{payroll_id}", response_model=Payroll, dependencies=[Depends(require_role(["admin", "manager"]))])
-def update_payroll(payroll_id: int, update: PayrollUpdate):
-    record = payroll_db.get(payroll_id)
-    if not record:
-        raise HTTPException(status_code=404, detail="Payroll not found")
-    updated_data = update.dict(exclude_unset=True)
-    # Recalculate net_pay if any relevant field is updated
-    base_salary = updated_data.get("base_salary", record.base_salary)
-    bonus = updated_data.get("bonus", record.bonus)
-    deductions = updated_data.get("deductions", record.deductions)
-    net_pay = base_salary + (bonus or 0) - (deductions or 0)
-    updated = record.copy(update={**updated_data, "net_pay": net_pay})
-    payroll_db[payroll_id] = updated
+async def update_payroll(payroll_id: int, update: PayrollUpdate):
+    # net_pay is derived from the stored fields, which must not change in between
+    async with payroll_repo.lock:
+        record = await payroll_repo.get(payroll_id)
+        if not record:
+            raise HTTPException(status_code=404, detail="Payroll not found")
+        updated_data = update.dict(exclude_unset=True)
+        # Recalculate net_pay if any relevant field is updated
+        base_salary = updated_data.get("base_salary", record.base_salary)
+        bonus = updated_data.get("bonus", record.bonus)
+        deductions = updated_data.get("deductions", record.deductions)
+        net_pay = base_salary + (bonus or 0) - (deductions or 0)
+        updated = await payroll_repo.update(payroll_id, {**updated_data, "net_pay": net_pay})
     try:
         from app.notifications.logic import create_notification
         if update.status == "paid":
@@ -93,19 +155,16 @@ def update_payroll(payroll_id: int, update: PayrollUpdate):
     return updated
 
 @router.delete("/{payroll_id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(require_role(["admin"]))])
-def delete_payroll(payroll_id: int):
-    if payroll_id not in payroll_db:
+async def delete_payroll(payroll_id: int):
+    if not await payroll_repo.delete(payroll_id):
         raise HTTPException(status_code=404, detail="Payroll not found")
-    del payroll_db[payroll_id]
     return None
 
 @router.post("/process/{employee_id}", response_model=Payroll, dependencies=[Depends(require_role(["admin", "manager"]))])
-def process_payroll(employee_id: int, period: str, base_salary: float, bonus: Optional[float] = 0.0, deductions: Optional[float] = 0.0):
+async def process_payroll(employee_id: int, period: str, base_salary: float, bonus: Optional[float] = 0.0, deductions: Optional[float] = 0.0):
     # Calculate net pay and create payroll record
     net_pay = base_salary + (bonus or 0) - (deductions or 0)
-    new_id = len(payroll_db) + 1
-    record = Payroll(id=new_id, employee_id=employee_id, period=period, base_salary=base_salary, bonus=bonus, deductions=deductions, net_pay=net_pay, status="processed")
-    payroll_db[new_id] = record
+    record = await payroll_repo.insert(dict(employee_id=employee_id, period=period, base_salary=base_salary, bonus=bonus, deductions=deductions, net_pay=net_pay, status="processed"))
     try:
         from app.notifications.logic import create_notification
         create_notification(user_id=employee_id, message=f"Payroll for {period} has been processed. Net pay: {net_pay}", type_="payroll_processed")
@@ -0,0 +1,303 @@
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.partitions import PartitionedRepository
+from app.repository import InMemoryRepository, repositories
+
+# Durability for the in-memory stores: every mutation is appended to a
+# write-ahead log, fsynced in batches, and the stores are periodically
+# written to a snapshot so recovery only replays the log tail.
+DATA_DIR = os.getenv("EMS_DATA_DIR")  # unset: in-memory stores are not persisted
+WAL_FSYNC_INTERVAL_MS = int(os.getenv("EMS_WAL_FSYNC_INTERVAL_MS", "20"))
+SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("EMS_SNAPSHOT_INTERVAL_SECONDS", "300"))
+# Also snapshot early once this much log has accumulated
+SNAPSHOT_WAL_BYTES = int(os.getenv("EMS_SNAPSHOT_WAL_BYTES", str(256 * 1024 * 1024)))
+
+# Entry framing: payload length, crc32 of payload, lsn
+_HEADER = struct.Struct("<IIQ")
+_SEGMENT_PREFIX = "wal-"
+_SEGMENT_SUFFIX = ".log"
+SNAPSHOT_FILE = "snapshot.bin"
+
+
+def _fields(model) -> List[str]:
+    return list(getattr(model, "model_fields", None) or model.__fields__)
+
+
+class WriteAheadLog:
+    """Append-only log split into segments named after their first lsn.
+
+    append() only buffers; a background thread writes and fsyncs the buffer
+    every `fsync_interval` seconds (group commit), or sooner via flush().
+    """
+
+    def __init__(self, directory: str, fsync_interval: float):
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._buffer: List[bytes] = []
+        self._closed = False
+        self.next_lsn = self._last_lsn() + 1
+        self._file = None
+        self.bytes_since_rotate = 0
+        self.appended = 0
+        self.fsyncs = 0
+        self._open_segment(self.next_lsn)
+        self._thread = threading.Thread(target=self._run, name="wal-flusher", daemon=True)
+        self._thread.start()
+
+    def segments(self) -> List[Tuple[int, str]]:
+        return list_segments(self.directory)
+
+    def _last_lsn(self) -> int:
+        last = 0
+        for first, path in self.segments():
+            last = max(last, first - 1)
+            for lsn, _ in read_segment(path):
+                last = lsn
+        return last
+
+    def _open_segment(self, first_lsn: int):
+        path = os.path.join(self.directory, f"{_SEGMENT_PREFIX}{first_lsn:020d}{_SEGMENT_SUFFIX}")
+        self._file = open(path, "ab")
+
+    def append(self, entry) -> int:
+        payload = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            lsn = self.next_lsn
+            self.next_lsn += 1
+            self._buffer.append(_HEADER.pack(len(payload), zlib.crc32(payload), lsn) + payload)
+            self.appended += 1
+        return lsn
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self._buffer = self._buffer, []
+            if not pending:
+                return
+            data = b"".join(pending)
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.bytes_since_rotate += len(data)
+            self.fsyncs += 1
+
+    def rotate(self) -> int:
+        """Start a new segment; returns its first lsn. Entries before it are in older segments."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._buffer = self._buffer, []
+                first = self.next_lsn
+            if pending:
+                self._file.write(b"".join(pending))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._open_segment(first)
+            self.bytes_since_rotate = 0
+        return first
+
+    def discard_before(self, lsn: int):
+        segments = self.segments()
+        for (first, path), following in zip(segments, segments[1:] + [(None, None)]):
+            # A segment is obsolete when the next one starts at or before `lsn`
+            if following[0] is not None and following[0] <= lsn:
+                os.remove(path)
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.fsync_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing write-ahead log: {e}")
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+        self._file.close()
+
+
+def list_segments(directory: str) -> List[Tuple[int, str]]:
+    found = []
+    for name in os.listdir(directory):
+        if name.startswith(_SEGMENT_PREFIX) and name.endswith(_SEGMENT_SUFFIX):
+            first = int(name[len(_SEGMENT_PREFIX):-len(_SEGMENT_SUFFIX)])
+            found.append((first, os.path.join(directory, name)))
+    return sorted(found)
+
+
+def read_segment(path: str) -> Iterator[Tuple[int, object]]:
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+            length, crc, lsn = _HEADER.unpack(header)
+            payload = f.read(length)
+            # A torn write at the tail (crash mid-append) ends the log
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return
+            yield lsn, pickle.loads(payload)
+
+
+def write_snapshot(path: str, lsn: int, stores: Dict[str, InMemoryRepository]):
+    # Rows are stored as tuples in field order, with the field names once per store
+    data = {"lsn": lsn, "created": time.time(), "stores": {}}
+    for name, repo in stores.items():
+        sequence, records = repo.snapshot()
+        fields = _fields(repo.model)
+        data["stores"][name] = {
+            "fields": fields,
+            "sequence": sequence,
+            "rows": [tuple(getattr(r, f) for f in fields) for r in records],
+        }
+        if isinstance(repo, PartitionedRepository):
+            # Cold months stay in their own files; the snapshot only lists them
+            data["stores"][name]["partitions"] = repo.snapshot_partitions()
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    for repo in stores.values():
+        if isinstance(repo, PartitionedRepository):
+            repo.snapshot_written()
+
+
+def _rows_to_records(repo: InMemoryRepository, fields: List[str], rows) -> List:
+    model = repo.model
+    return [model(**dict(zip(fields, row))) for row in rows]
+
+
+class Persistence:
+    """Recovers the in-memory repositories at startup and journals them afterwards."""
+
+    def __init__(self, directory: str, fsync_interval_ms: int = WAL_FSYNC_INTERVAL_MS,
+                 snapshot_interval: float = SNAPSHOT_INTERVAL_SECONDS, snapshot_wal_bytes: int = SNAPSHOT_WAL_BYTES):
+        self.directory = directory
+        self.fsync_interval = fsync_interval_ms / 1000.0
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_wal_bytes = snapshot_wal_bytes
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self.wal: Optional[WriteAheadLog] = None
+        self.stores: Dict[str, InMemoryRepository] = {}
+        self._snapshot_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_snapshot_at = None
+        self.last_recovery = {}
+
+    def _journal(self, store: str, op: str, records: List):
+        self.wal.append((store, op, [r.dict() for r in records]))
+
+    def recover(self) -> dict:
+        started = time.perf_counter()
+        os.makedirs(self.directory, exist_ok=True)
+        snapshot_lsn = 0
+        snapshot_rows = 0
+        data = {"stores": {}}
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "rb") as f:
+                data = pickle.load(f)
+            snapshot_lsn = data["lsn"]
+        for name, repo in self.stores.items():
+            if isinstance(repo, PartitionedRepository):
+                repo.restore_partitions(data["stores"].get(name, {}).get("partitions", {}))
+        for name, store in data["stores"].items():
+            repo = self.stores.get(name)
+            if repo is None:
+                continue
+            repo.restore("put", _rows_to_records(repo, store["fields"], store["rows"]), store["sequence"])
+            snapshot_rows += len(store["rows"])
+        loaded = time.perf_counter()
+        replayed = 0
+        wal_dir = os.path.join(self.directory, "wal")
+        if os.path.isdir(wal_dir):
+            for _, path in list_segments(wal_dir):
+                for lsn, (store, op, rows) in read_segment(path):
+                    if lsn < snapshot_lsn:
+                        continue
+                    repo = self.stores.get(store)
+                    if repo is None:
+                        continue
+                    repo.restore(op, [repo.model(**row) for row in rows])
+                    replayed += 1
+        self.last_recovery = {
+            "snapshot_lsn": snapshot_lsn,
+            "snapshot_rows": snapshot_rows,
+            "wal_entries_replayed": replayed,
+            "snapshot_load_seconds": round(loaded - started, 3),
+            "wal_replay_seconds": round(time.perf_counter() - loaded, 3),
+        }
+        return self.last_recovery
+
+    def start(self, stores: Optional[Dict[str, InMemoryRepository]] = None):
+        if stores is None:
+            stores = {name: repo for name, repo in repositories.items() if isinstance(repo, InMemoryRepository)}
+        self.stores = stores
+        recovery = self.recover()
+        self.wal = WriteAheadLog(os.path.join(self.directory, "wal"), self.fsync_interval)
+        for repo in self.stores.values():
+            repo.journal = self._journal
+        self._thread = threading.Thread(target=self._run, name="snapshotter", daemon=True)
+        self._thread.start()
+        print(f"Recovered in-memory stores from {self.directory}: {recovery}")
+        return recovery
+
+    def snapshot(self):
+        with self._snapshot_lock:
+            # Everything before `lsn` is already applied to the stores, so the
+            # snapshot covers it; later entries are replayed (idempotently) on top.
+            lsn = self.wal.rotate()
+            write_snapshot(self.snapshot_path, lsn, self.stores)
+            self.wal.discard_before(lsn)
+            self.last_snapshot_at = time.time()
+
+    def _run(self):
+        last = time.monotonic()
+        while not self._stop.wait(1.0):
+            due = time.monotonic() - last >= self.snapshot_interval
+            if due or self.wal.bytes_since_rotate >= self.snapshot_wal_bytes:
+                try:
+                    self.snapshot()
+                except Exception as e:
+                    print(f"Error writing snapshot: {e}")
+                last = time.monotonic()
+
+    def stop(self, final_snapshot: bool = True):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        for repo in self.stores.values():
+            repo.journal = None
+        if self.wal is not None:
+            if final_snapshot:
+                self.snapshot()
+            self.wal.close()
+
+    def stats(self) -> dict:
+        return {
+            "directory": self.directory,
+            "wal_entries_appended": self.wal.appended if self.wal else 0,
+            "wal_fsyncs": self.wal.fsyncs if self.wal else 0,
+            "wal_bytes_since_snapshot": self.wal.bytes_since_rotate if self.wal else 0,
+            "last_snapshot_at": self.last_snapshot_at,
+            "last_recovery": self.last_recovery,
+        }
+
+
+persistence = Persistence(DATA_DIR) if DATA_DIR else None
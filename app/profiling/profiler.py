@@ -0,0 +1,251 @@
+import cProfile
+import json
+import os
+import pstats
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+
+from app.lazy import installed, optional_module
+from app.metrics import run_in_threadpool
+
+# Off unless set: the middleware is not even installed
+PROFILING_ENABLED = os.getenv("EMS_PROFILING", "0").lower() in ("1", "true", "yes")
+# Value of the X-Profile header or ?profile= query parameter that profiles a
+# request; header/query triggering is disabled while it is unset
+PROFILE_TOKEN = os.getenv("EMS_PROFILE_TOKEN", "")
+# Also profile one request in N (0: never)
+PROFILE_SAMPLE_EVERY = int(os.getenv("EMS_PROFILE_SAMPLE_EVERY", "0"))
+# "cprofile" (deterministic, .pstats) or "pyinstrument" (sampling, speedscope JSON; optional dependency)
+PROFILER = os.getenv("EMS_PROFILER", "cprofile")
+PROFILE_DIR = os.getenv("EMS_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "ems-profiles"))
+PROFILE_MAX_FILES = int(os.getenv("EMS_PROFILE_MAX_FILES", "50"))
+PROFILE_MAX_BYTES = int(os.getenv("EMS_PROFILE_MAX_BYTES", str(100 * 1024 * 1024)))
+
+EXTENSIONS = {"cprofile": ".pstats", "pyinstrument": ".speedscope.json"}
+
+
+class ProfileStore:
+    """Saved profiles on disk, oldest deleted first beyond `max_files` or `max_bytes`.
+
+    Each profile has a JSON sidecar with the request it came from; the index
+    is rebuilt from the sidecars on first use, so it survives restarts.
+    """
+
+    def __init__(self, directory: str, max_files: int, max_bytes: int):
+        self.directory = directory
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self._index: Optional[Dict[str, dict]] = None
+        self._lock = threading.Lock()
+        self.saved = 0
+        self.evicted = 0
+
+    def _load(self) -> Dict[str, dict]:
+        # Caller holds the lock
+        if self._index is None:
+            os.makedirs(self.directory, exist_ok=True)
+            entries = []
+            for name in os.listdir(self.directory):
+                if name.endswith(".meta.json"):
+                    try:
+                        with open(os.path.join(self.directory, name)) as f:
+                            entries.append(json.load(f))
+                    except (OSError, ValueError):
+                        continue
+            self._index = {e["id"]: e for e in sorted(entries, key=lambda e: e["created"])}
+        return self._index
+
+    def _delete(self, entry: dict):
+        for path in (self.path(entry), self._meta_path(entry["id"])):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _meta_path(self, profile_id: str) -> str:
+        return os.path.join(self.directory, profile_id + ".meta.json")
+
+    def path(self, entry: dict) -> str:
+        return os.path.join(self.directory, entry["id"] + entry["extension"])
+
+    def save(self, entry: dict, write) -> dict:
+        """Write a profile with `write(path)` and record `entry`; runs in a worker thread."""
+        with self._lock:
+            index = self._load()
+            path = self.path(entry)
+            write(path)
+            entry["size"] = os.path.getsize(path)
+            with open(self._meta_path(entry["id"]), "w") as f:
+                json.dump(entry, f)
+            index[entry["id"]] = entry
+            self.saved += 1
+            while index and (len(index) > self.max_files or sum(e["size"] for e in index.values()) > self.max_bytes):
+                oldest = next(iter(index.values()))
+                del index[oldest["id"]]
+                self._delete(oldest)
+                self.evicted += 1
+        return entry
+
+    def list(self) -> List[dict]:
+        with self._lock:
+            return list(reversed(self._load().values()))
+
+    def get(self, profile_id: str) -> Optional[dict]:
+        with self._lock:
+            return self._load().get(profile_id)
+
+    def delete(self, profile_id: str) -> bool:
+        with self._lock:
+            entry = self._load().pop(profile_id, None)
+            if entry is not None:
+                self._delete(entry)
+        return entry is not None
+
+    def stats(self) -> dict:
+        with self._lock:
+            index = self._load()
+            return {
+                "profiles": len(index),
+                "bytes": sum(e["size"] for e in index.values()),
+                "max_files": self.max_files,
+                "max_bytes": self.max_bytes,
+                "saved": self.saved,
+                "evicted": self.evicted,
+            }
+
+
+class RequestProfiler:
+    """Decides which requests to profile and profiles them.
+
+    A request is profiled when it carries the token (X-Profile header or
+    ?profile= query parameter) or is the Nth since the last sample. cProfile
+    is per thread, so only one cProfile runs at a time and its profile also
+    contains whatever else ran on the event loop meanwhile; pyinstrument in
+    async mode only attributes time to the profiled request.
+    """
+
+    def __init__(self, store: ProfileStore, token: str = "", sample_every: int = 0, profiler: str = "cprofile"):
+        self.store = store
+        self.token = token
+        self.sample_every = sample_every
+        self.profiler = profiler if profiler in EXTENSIONS else "cprofile"
+        self._requests = 0
+        self._cprofile_busy = False
+        self.profiled = 0
+        self.skipped = 0
+
+    def trigger(self, scope) -> Optional[str]:
+        self._requests += 1
+        if self.token:
+            query = scope.get("query_string", b"")
+            if b"profile=" in query and self.token in parse_qs(query.decode("latin-1")).get("profile", ()):
+                return "query"
+            token = self.token.encode()
+            for name, value in scope["headers"]:
+                if name == b"x-profile" and value == token:
+                    return "header"
+        if self.sample_every and self._requests % self.sample_every == 0:
+            return "sampled"
+        return None
+
+    async def profile(self, app, scope, receive, send, trigger: str):
+        kind = self.profiler
+        if kind == "pyinstrument" and optional_module("pyinstrument") is None:
+            kind = "cprofile"
+        if kind == "cprofile" and self._cprofile_busy:
+            self.skipped += 1
+            return await app(scope, receive, send)
+
+        profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]}
+            await send(message)
+
+        started = time.perf_counter()
+        if kind == "cprofile":
+            self._cprofile_busy = True
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            profiler = optional_module("pyinstrument").Profiler(async_mode="enabled")
+            profiler.start()
+        try:
+            await app(scope, receive, send_wrapper)
+        finally:
+            if kind == "cprofile":
+                profiler.disable()
+                self._cprofile_busy = False
+            else:
+                profiler.stop()
+            elapsed = time.perf_counter() - started
+            self.profiled += 1
+            query = scope.get("query_string", b"").decode("latin-1")
+            entry = {
+                "id": profile_id,
+                "created": time.time(),
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": query.replace(self.token, "***") if self.token else query,
+                "route": getattr(scope.get("route"), "path_format", None),
+                "status": status,
+                "duration_ms": round(elapsed * 1000, 3),
+                "trigger": trigger,
+                "profiler": kind,
+                "extension": EXTENSIONS[kind],
+            }
+            try:
+                await run_in_threadpool(self.store.save, entry, _writer(kind, profiler))
+            except Exception as e:
+                print(f"Error saving profile {profile_id}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": PROFILING_ENABLED,
+            "profiler": self.profiler,
+            "pyinstrument_installed": installed("pyinstrument"),
+            "sample_every": self.sample_every,
+            "token_trigger": bool(self.token),
+            "profiled": self.profiled,
+            "skipped_busy": self.skipped,
+            **self.store.stats(),
+        }
+
+
+class ProfilingMiddleware:
+    """Pure ASGI; an unprofiled request costs a counter increment and a scan of its headers."""
+
+    def __init__(self, app, profiler: RequestProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        trigger = self.profiler.trigger(scope)
+        if trigger is None:
+            return await self.app(scope, receive, send)
+        await self.profiler.profile(self.app, scope, receive, send, trigger)
+
+
+def _writer(kind: str, profiler):
+    if kind == "cprofile":
+        return lambda path: pstats.Stats(profiler).dump_stats(path)
+
+    def write(path):
+        from pyinstrument.renderers import SpeedscopeRenderer
+        with open(path, "w") as f:
+            f.write(profiler.output(renderer=SpeedscopeRenderer()))
+    return write
+
+
+profile_store = ProfileStore(PROFILE_DIR, PROFILE_MAX_FILES, PROFILE_MAX_BYTES)
+request_profiler = RequestProfiler(profile_store, PROFILE_TOKEN, PROFILE_SAMPLE_EVERY, PROFILER)
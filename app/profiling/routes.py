@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import FileResponse
+from typing import List
+from app.metrics import run_in_threadpool
+from app.profiling.profiler import request_profiler, profile_store
+
+router = APIRouter(prefix="/profiles", tags=["Profiling"])
+
+# Example role-based dependency
+async def get_current_user_role():
+    # Placeholder: Replace with actual authentication logic
+    return "employee"
+
+def require_role(roles: List[str]):
+    async def role_checker(role: str = Depends(get_current_user_role)):
+        if role not in roles:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient permissions")
+    return role_checker
+
+@router.get("", dependencies=[Depends(require_role(["admin"]))])
+async def list_profiles():
+    profiles = await run_in_threadpool(profile_store.list)
+    return {"stats": request_profiler.stats(), "profiles": profiles}
+
+@router.get("/{id}", dependencies=[Depends(require_role(["admin"]))])
+async def download_profile(id: str):
+    entry = await run_in_threadpool(profile_store.get, id)
+    if not entry:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Profile {id} not found")
+    # .pstats opens with pstats/snakeviz, .speedscope.json with https://www.speedscope.app
+    filename = entry["id"] + entry["extension"]
+    return FileResponse(profile_store.path(entry), media_type="application/octet-stream", filename=filename)
+
+@router.delete("/{id}", dependencies=[Depends(require_role(["admin"]))])
+async def delete_profile(id: str):
+    if not await run_in_threadpool(profile_store.delete, id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Profile {id} not found")
+    return {"message": f"Profile {id} deleted successfully"}
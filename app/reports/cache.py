@@ -0,0 +1,128 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Sequence
+
+from app.repository import Repository
+
+REPORT_CACHE_MAX_BYTES = int(os.getenv("EMS_REPORT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+def normalize_params(params: Dict[str, Any]) -> tuple:
+    # Unset parameters and argument order must not produce distinct entries
+    return tuple(sorted(
+        (k, tuple(v) if isinstance(v, list) else v) for k, v in params.items() if v is not None
+    ))
+
+
+def _size(value) -> int:
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    try:
+        return len(json.dumps(value, default=str))
+    except TypeError:
+        # e.g. tuple dict keys; repr is a close enough estimate
+        return len(repr(value))
+
+
+class ReportCache:
+    """LRU cache of computed reports, bounded by the estimated size of the results.
+
+    An entry records the version of every repository it was computed from and
+    is reused only while none of them has been written to since. Cached values
+    are shared between requests and must be treated as read-only. Only touched
+    from the event loop, so no locking is needed.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        # (name, params) -> (versions, value, size, compute seconds)
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        # Concurrent misses for the same key and versions share one computation
+        self._inflight: Dict[tuple, tuple] = {}
+        self.bytes = 0
+        self.evictions = 0
+        self.coalesced = 0
+        self.seconds_saved = 0.0
+        self.by_report: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, name: str, outcome: str):
+        counts = self.by_report.setdefault(name, {"hits": 0, "misses": 0, "stale": 0})
+        counts[outcome] += 1
+
+    def _drop(self, key: tuple):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def _store(self, key: tuple, versions: tuple, value, elapsed: float):
+        size = _size(value)
+        if size > self.max_bytes:
+            return
+        self._drop(key)
+        self._entries[key] = (versions, value, size, elapsed)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    async def get_or_compute(self, name: str, params: Dict[str, Any], sources: Sequence[Repository],
+                             compute: Callable[[], Awaitable[Any]]):
+        key = (name, normalize_params(params))
+        versions = tuple([await repo.version() for repo in sources])
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] == versions:
+                self._entries.move_to_end(key)
+                self._count(name, "hits")
+                self.seconds_saved += entry[3]
+                return entry[1]
+            self._drop(key)
+            self._count(name, "stale")
+        else:
+            self._count(name, "misses")
+
+        inflight = self._inflight.get(key)
+        if inflight is not None and inflight[0] == versions:
+            self.coalesced += 1
+            return await asyncio.shield(inflight[1])
+
+        async def run():
+            started = time.perf_counter()
+            value = await compute()
+            self._store(key, versions, value, time.perf_counter() - started)
+            return value
+
+        task = asyncio.ensure_future(run())
+        self._inflight[key] = (versions, task)
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if self._inflight.get(key, (None, None))[1] is task:
+                del self._inflight[key]
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def stats(self) -> dict:
+        hits = sum(c["hits"] for c in self.by_report.values())
+        lookups = sum(sum(c.values()) for c in self.by_report.values())
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": lookups - hits,
+            "hit_ratio": round(hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "coalesced": self.coalesced,
+            "compute_seconds_saved": round(self.seconds_saved, 3),
+            "by_report": self.by_report,
+        }
+
+
+report_cache = ReportCache(REPORT_CACHE_MAX_BYTES)
@@ -0,0 +1,261 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Type
+
+from app.metrics import run_in_threadpool
+
+REPORT_JOB_WORKERS = int(os.getenv("EMS_REPORT_JOB_WORKERS", "2"))
+REPORT_JOB_MAX_QUEUED = int(os.getenv("EMS_REPORT_JOB_MAX_QUEUED", "50"))
+REPORT_RESULTS_DIR = os.getenv("EMS_REPORT_RESULTS_DIR", os.path.join(tempfile.gettempdir(), "ems-reports"))
+REPORT_RESULT_TTL_SECONDS = float(os.getenv("EMS_REPORT_RESULT_TTL_SECONDS", "3600"))
+REPORT_SWEEP_INTERVAL_SECONDS = float(os.getenv("EMS_REPORT_SWEEP_INTERVAL_SECONDS", "60"))
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class SpooledRecords:
+    """Records spooled to a file by `spool`, built one at a time as they are iterated.
+
+    Only the path crosses to the pool process, which reads the file itself.
+    """
+
+    def __init__(self, model: Type, path: str):
+        self.model = model
+        self.path = path
+
+    def __iter__(self):
+        with open(self.path, "rb") as f:
+            for line in f:
+                for item in json.loads(line):
+                    yield self.model(**item)
+
+
+async def spool(repo, filters: Optional[Dict[str, Any]], path: str) -> SpooledRecords:
+    """Write the records of `repo` matching `filters` to `path`, a chunk at a time."""
+    with open(path, "wb") as f:
+        async for chunk in repo.iter_json(filters):
+            await run_in_threadpool(f.write, chunk + b"\n")
+    return SpooledRecords(repo.model, path)
+
+
+def _render_to_file(render: Callable[..., bytes], args: tuple, path: str) -> int:
+    # Runs in a pool process; the rename makes a half-written file invisible
+    content = render(*args)
+    partial = path + ".part"
+    with open(partial, "wb") as f:
+        f.write(content)
+    os.replace(partial, path)
+    return len(content)
+
+
+class ReportJob:
+    def __init__(self, kind: str, params: Dict[str, Any], load: Callable[[str], Awaitable[tuple]],
+                 render: Callable[..., bytes], media_type: str, filename: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.load = load
+        self.render = render
+        self.media_type = media_type
+        self.filename = filename
+        self.status = QUEUED
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.error: Optional[str] = None
+        self.size: Optional[int] = None
+        self.path: Optional[str] = None
+        self.expires: Optional[float] = None
+
+    def info(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "expires": self.expires,
+            "error": self.error,
+            "size": self.size,
+            "filename": self.filename,
+        }
+
+
+class ReportJobQueue:
+    """Renders exports in a process pool so they never hold the event loop or its threadpool.
+
+    At most `workers` jobs run at once and at most `max_queued` wait; jobs are
+    only handed to the pool when a process is free, so a queued job can always
+    be cancelled. A running job cannot be interrupted: cancelling it discards
+    its result when it finishes. Results are deleted `ttl` seconds after they
+    are ready.
+
+    Jobs are known only to the process that accepted them: with several
+    workers, polling or downloading a job through another worker gets a 404.
+    """
+
+    def __init__(self, workers: int, max_queued: int, results_dir: str, ttl: float):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.results_dir = results_dir
+        self.ttl = ttl
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[str, ReportJob] = {}
+        self._queue: Deque[ReportJob] = deque()
+        self._running = 0
+        self._sweeper: Optional[asyncio.Task] = None
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.expired = 0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            os.makedirs(self.results_dir, exist_ok=True)
+            # Spawned rather than forked: the server process runs threads
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def start(self):
+        if self._sweeper is None:
+            self._sweeper = asyncio.ensure_future(self._sweep_forever())
+
+    def shutdown(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def submit(self, kind: str, params: Dict[str, Any], load: Callable[[str], Awaitable[tuple]],
+               render: Callable[..., bytes], media_type: str, filename: str) -> ReportJob:
+        """Queue an export. `load(path)` gathers the render arguments, spooling
+        records to `path` rather than passing them to the pool; `render` must be
+        a module-level function returning the file content."""
+        if len(self._queue) >= self.max_queued:
+            raise JobQueueFull()
+        self.start()
+        job = ReportJob(kind, params, load, render, media_type, filename)
+        self._jobs[job.id] = job
+        self._queue.append(job)
+        self._dispatch()
+        return job
+
+    def get(self, job_id: str) -> Optional[ReportJob]:
+        return self._jobs.get(job_id)
+
+    def list(self):
+        return list(self._jobs.values())
+
+    def cancel(self, job_id: str) -> Optional[ReportJob]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        if job.status == QUEUED:
+            self._queue.remove(job)
+        if job.status in (QUEUED, RUNNING):
+            job.status = CANCELLED
+            job.finished = time.time()
+            self.cancelled += 1
+        elif job.status == DONE:
+            # Cancelling a finished job deletes its result
+            self._remove(job)
+        return job
+
+    def _dispatch(self):
+        while self._queue and self._running < self.workers:
+            job = self._queue.popleft()
+            self._running += 1
+            asyncio.ensure_future(self._run(job))
+
+    async def _run(self, job: ReportJob):
+        job.status = RUNNING
+        job.started = time.time()
+        path = os.path.join(self.results_dir, job.id)
+        try:
+            os.makedirs(self.results_dir, exist_ok=True)
+            args = await job.load(path + ".rows")
+            if job.status == CANCELLED:
+                return
+            loop = asyncio.get_running_loop()
+            size = await loop.run_in_executor(self._pool(), _render_to_file, job.render, args, path)
+            if job.status == CANCELLED:
+                self._delete_file(path)
+                return
+            job.path = path
+            job.size = size
+            job.status = DONE
+            job.finished = time.time()
+            job.expires = job.finished + self.ttl
+            self.completed += 1
+        except Exception as e:
+            if job.status != CANCELLED:
+                job.status = FAILED
+                job.error = getattr(e, "detail", None) or str(e) or type(e).__name__
+                self.failed += 1
+                print(f"Report job {job.id} ({job.kind}) failed: {job.error}")
+        finally:
+            self._delete_file(path + ".rows")
+            if job.finished is None:
+                job.finished = time.time()
+            self._running -= 1
+            self._dispatch()
+
+    @staticmethod
+    def _delete_file(path: Optional[str]):
+        if path:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _remove(self, job: ReportJob):
+        self._jobs.pop(job.id, None)
+        self._delete_file(job.path)
+
+    def sweep(self) -> int:
+        # Finished jobs of any outcome are forgotten once their result expires
+        cutoff = time.time() - self.ttl
+        expired = [j for j in self._jobs.values() if j.finished is not None and j.finished < cutoff]
+        for job in expired:
+            self._remove(job)
+        self.expired += len(expired)
+        return len(expired)
+
+    async def _sweep_forever(self):
+        while True:
+            await asyncio.sleep(REPORT_SWEEP_INTERVAL_SECONDS)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Error expiring report results: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "running": self._running,
+            "queued": len(self._queue),
+            "max_queued": self.max_queued,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "expired": self.expired,
+            "result_ttl_seconds": self.ttl,
+        }
+
+
+report_jobs = ReportJobQueue(REPORT_JOB_WORKERS, REPORT_JOB_MAX_QUEUED, REPORT_RESULTS_DIR, REPORT_RESULT_TTL_SECONDS)
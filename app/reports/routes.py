@@ -0,0 +1,102 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import FileResponse
+from typing import List, Optional
+from pydantic import BaseModel
+from app.lazy import installed
+from app.reports.cache import report_cache
+from app.reports.jobs import DONE, JobQueueFull, report_jobs, spool
+
+router = APIRouter(prefix="/reports", tags=["Reports"])
+
+# Example role-based dependency
+async def get_current_user_role():
+    # Placeholder: Replace with actual authentication logic
+    return "employee"
+
+def require_role(roles: List[str]):
+    async def role_checker(role: str = Depends(get_current_user_role)):
+        if role not in roles:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient permissions")
+    return role_checker
+
+@router.get("/cache/stats", dependencies=[Depends(require_role(["admin"]))])
+async def report_cache_stats():
+    return report_cache.stats()
+
+@router.delete("/cache", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(require_role(["admin"]))])
+async def clear_report_cache():
+    report_cache.clear()
+    return None
+
+
+class ExportJobCreate(BaseModel):
+    report: str  # attendance, employees
+    format: str = "csv"  # csv, excel, pdf (employees: csv, pdf)
+    employee_id: Optional[int] = None
+    department: Optional[str] = None
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+
+def export_job(request: ExportJobCreate):
+    """Return (load, render, media_type, filename) for a requested export."""
+    if request.report == "attendance":
+        from app.attendance.routes import REPORT_FORMATS, attendance_filters, attendance_repo, render_attendance_report
+        if request.format not in REPORT_FORMATS:
+            raise HTTPException(status_code=400, detail="Invalid format")
+        if request.format == "excel" and not installed("openpyxl"):
+            raise HTTPException(status_code=500, detail="openpyxl is not installed on the server")
+        async def load(path):
+            filters = await attendance_filters(request.employee_id, request.department, request.start_date, request.end_date)
+            return (await spool(attendance_repo, filters, path), request.format)
+        media_type, filename = REPORT_FORMATS[request.format]
+        return load, render_attendance_report, media_type, filename
+    if request.report == "employees":
+        from app.employee.routes import employee_repo, render_employees_csv, render_employees_pdf
+        renderers = {
+            "csv": (render_employees_csv, "text/csv", "employees.csv"),
+            "pdf": (render_employees_pdf, "application/pdf", "employees.pdf"),
+        }
+        if request.format not in renderers:
+            raise HTTPException(status_code=400, detail="Invalid format")
+        render, media_type, filename = renderers[request.format]
+        async def load(path):
+            return (await spool(employee_repo, None, path),)
+        return load, render, media_type, filename
+    raise HTTPException(status_code=400, detail="Unknown report")
+
+def get_job(job_id: str):
+    job = report_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+@router.post("/jobs", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(require_role(["admin", "manager"]))])
+async def submit_export_job(request: ExportJobCreate):
+    load, render, media_type, filename = export_job(request)
+    try:
+        job = report_jobs.submit(request.report, request.dict(exclude_none=True), load, render, media_type, filename)
+    except JobQueueFull:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Too many export jobs queued, try again later", headers={"Retry-After": "30"})
+    return job.info()
+
+@router.get("/jobs", dependencies=[Depends(require_role(["admin", "manager"]))])
+async def list_export_jobs():
+    return {"jobs": [job.info() for job in report_jobs.list()], "stats": report_jobs.stats()}
+
+@router.get("/jobs/{job_id}", dependencies=[Depends(require_role(["admin", "manager"]))])
+async def get_export_job(job_id: str):
+    return get_job(job_id).info()
+
+@router.get("/jobs/{job_id}/download", dependencies=[Depends(require_role(["admin", "manager"]))])
+async def download_export_job(job_id: str):
+    job = get_job(job_id)
+    if job.status != DONE:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Job is {job.status}")
+    return FileResponse(job.path, media_type=job.media_type, filename=job.filename)
+
+@router.delete("/jobs/{job_id}", dependencies=[Depends(require_role(["admin", "manager"]))])
+async def cancel_export_job(job_id: str):
+    job = report_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job.info()
@@ -0,0 +1,984 @@
+import asyncio
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left
+from datetime import date, datetime
+from operator import attrgetter
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple, Type
+
+from fastapi.concurrency import run_in_threadpool
+from pymongo import ASCENDING, DESCENDING, ReplaceOne, ReturnDocument, UpdateOne
+
+from app.changes.feed import CHANGE_FEED_STORES, SQLiteChangeFeed, get_change_feed
+from app.database import get_database
+from app.serialization import dump_records, dumps
+
+# "memory" keeps records in process; "sqlite" shares a local database file
+# between worker processes; "mongo" stores them through Database
+REPOSITORY_BACKEND = os.getenv("EMS_REPOSITORY_BACKEND", "memory")
+SQLITE_PATH = os.getenv("EMS_SQLITE_PATH", "ems.sqlite3")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("EMS_SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_BYTES = int(os.getenv("EMS_SQLITE_MMAP_BYTES", str(256 * 1024 * 1024)))
+# Records per chunk when a whole result set is streamed, e.g. for an export
+EXPORT_CHUNK_RECORDS = int(os.getenv("EMS_EXPORT_CHUNK_RECORDS", "5000"))
+# Compact stores: rebuild their tables of shared values once this many rows
+# (and at least as many as are left) have been removed or replaced
+SHARED_REBUILD_ROWS = int(os.getenv("EMS_SHARED_REBUILD_ROWS", "10000"))
+# Memory backend: keep only recent months of date-partitioned stores in memory
+PARTITIONING_ENABLED = os.getenv("EMS_PARTITIONING", "1").lower() in ("1", "true", "yes")
+
+# Filters use a small subset of Mongo query syntax so they can be pushed down
+# as-is: {"field": value} for equality, or {"field": {"$gte": a, "$lte": b}}
+# with $eq, $ne, $gt, $gte, $lt, $lte, $in and $nin.
+_OPERATORS = {
+    "$eq": lambda v, x: v == x,
+    "$ne": lambda v, x: v != x,
+    "$gt": lambda v, x: v is not None and v > x,
+    "$gte": lambda v, x: v is not None and v >= x,
+    "$lt": lambda v, x: v is not None and v < x,
+    "$lte": lambda v, x: v is not None and v <= x,
+    "$in": lambda v, x: v in x,
+    "$nin": lambda v, x: v not in x,
+}
+
+
+def matches(record, filters: Dict[str, Any]) -> bool:
+    for field, cond in filters.items():
+        value = getattr(record, field, None)
+        if isinstance(cond, dict):
+            for op, operand in cond.items():
+                if not _OPERATORS[op](value, operand):
+                    return False
+        elif value != cond:
+            return False
+    return True
+
+
+def _after(filters: Optional[Dict[str, Any]], id: int) -> Dict[str, Any]:
+    # `filters` narrowed to ids above `id`, for paging by id
+    cond = (filters or {}).get("id")
+    if cond is not None and not isinstance(cond, dict):
+        cond = {"$eq": cond}
+    return {**(filters or {}), "id": {**(cond or {}), "$gt": id}}
+
+
+def period_key(value: str, period: str) -> str:
+    """Bucket an ISO date string: "2024-06" for monthly, "2024-W23" for weekly."""
+    if period == "monthly":
+        return value[:7]
+    if period == "weekly":
+        year, week, _ = datetime.strptime(value, "%Y-%m-%d").isocalendar()
+        return f"{year}-W{week:02d}"
+    return value
+
+
+def group_records(records: Iterable, by: Sequence[str] = (), period: Optional[Tuple[str, str]] = None,
+                  counts: Optional[Dict[tuple, int]] = None) -> Dict[tuple, int]:
+    """Count `records` per key as Repository.group_count does, adding to `counts` if given."""
+    counts = {} if counts is None else counts
+    for record in records:
+        key = tuple(getattr(record, field, None) for field in by)
+        if period:
+            key = (period_key(getattr(record, period[0]), period[1]),) + key
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+class Repository(ABC):
+    """Storage for one record type, keyed by the integer `id` field.
+
+    Records are pydantic models of `model`. Methods are coroutines so backends
+    that talk to a server can be swapped in without touching the routes.
+    `indexes` lists field names, or tuples of field names for compound indexes.
+    """
+
+    def __init__(self, name: str, model: Type, indexes: Iterable = ()):
+        self.name = name
+        self.model = model
+        self.indexes = tuple(indexes)
+        # Held by handlers around read-modify-write sequences (get, change, write
+        # back) so two requests in this process cannot interleave and lose an update
+        self.lock = asyncio.Lock()
+        # Optional app.changes.feed.ChangeFeed that every create, update and delete is appended to
+        self.feed = None
+
+    def index_keys(self) -> List[Tuple[str, ...]]:
+        """Declared indexes as field tuples, without single fields a compound index already leads with."""
+        keys = [(i,) if isinstance(i, str) else tuple(i) for i in self.indexes]
+        return [k for k in keys if len(k) > 1 or not any(len(o) > 1 and o[0] == k[0] for o in keys)]
+
+    @abstractmethod
+    async def get(self, id: int):
+        ...
+
+    async def exists(self, id: int) -> bool:
+        return await self.get(id) is not None
+
+    @abstractmethod
+    async def list(self, filters: Optional[Dict[str, Any]] = None, sort: Optional[str] = None,
+                   skip: int = 0, limit: Optional[int] = None) -> List:
+        """Records matching `filters`; `sort` is a field name, "-field" for descending."""
+
+    async def list_json(self, filters: Optional[Dict[str, Any]] = None, sort: Optional[str] = None,
+                        skip: int = 0, limit: Optional[int] = None) -> bytes:
+        """Same records as `list`, as a JSON array, without building models where the store can avoid it."""
+        return dump_records(await self.list(filters, sort, skip, limit))
+
+    async def iter_json(self, filters: Optional[Dict[str, Any]] = None,
+                        size: int = EXPORT_CHUNK_RECORDS) -> AsyncIterator[bytes]:
+        """Records matching `filters` as JSON arrays of at most `size` records, in id order.
+
+        Each chunk is read separately, so the whole result set is never held at once.
+        """
+        last = None
+        while True:
+            records = await self.list(filters if last is None else _after(filters, last), "id", 0, size)
+            if records:
+                yield dump_records(records)
+            if len(records) < size:
+                return
+            last = records[-1].id
+
+    @abstractmethod
+    async def count(self, filters: Optional[Dict[str, Any]] = None) -> int:
+        ...
+
+    async def group_count(self, filters: Optional[Dict[str, Any]] = None, by: Sequence[str] = (),
+                          period: Optional[Tuple[str, str]] = None) -> Dict[tuple, int]:
+        """Count records matching `filters` per distinct value of the `by` fields.
+
+        `period` is (date field, "weekly" | "monthly"); its bucket (see
+        period_key) is prepended to each key.
+        """
+        return group_records(await self.list(filters), by, period)
+
+    @abstractmethod
+    async def next_ids(self, n: int = 1) -> List[int]:
+        """Atomically reserve `n` consecutive ids."""
+
+    async def insert(self, data: Dict[str, Any]):
+        """Create a record from `data`, assigning the next id."""
+        return (await self.bulk_insert([data]))[0]
+
+    @abstractmethod
+    async def bulk_insert(self, items: List[Dict[str, Any]]) -> List:
+        ...
+
+    @abstractmethod
+    async def put(self, record):
+        """Create or replace a record under its own id."""
+
+    async def bulk_put(self, records: List) -> List:
+        """`put` for many records in one write."""
+        for record in records:
+            await self.put(record)
+        return records
+
+    @abstractmethod
+    async def update(self, id: int, changes: Dict[str, Any]):
+        """Apply `changes` to a record; returns the updated record or None."""
+
+    @abstractmethod
+    async def bulk_update(self, changes_by_id: Dict[int, Dict[str, Any]]) -> int:
+        ...
+
+    @abstractmethod
+    async def update_many(self, filters: Dict[str, Any], changes: Dict[str, Any]) -> int:
+        ...
+
+    @abstractmethod
+    async def delete(self, id: int) -> bool:
+        ...
+
+    @abstractmethod
+    async def version(self) -> int:
+        """Counter bumped by every write, for caching results derived from the records."""
+
+    async def ensure_indexes(self):
+        pass
+
+
+class InMemoryRepository(Repository):
+    """Dict-backed store with hash indexes on the declared fields."""
+
+    def __init__(self, name: str, model: Type, indexes: Iterable = ()):
+        super().__init__(name, model, indexes)
+        self._records: Dict[int, Any] = {}
+        # Compound indexes only matter to backends with a query planner
+        self._index: Dict[str, Dict[Any, set]] = {field: {} for field in self.indexes if isinstance(field, str)}
+        self._sequence = 0
+        self._version = 0
+        # Handlers run on the event loop; this guards against the snapshot thread
+        self._lock = threading.RLock()
+        # Optional callable(store, op, records) notified of every mutation while
+        # the lock is held, so its order matches the order changes are applied
+        self.journal = None
+
+    def _log(self, op: str, records: List, created: Optional[List[bool]] = None):
+        # `created` tells the change feed which "put" records are new
+        self._version += 1
+        if self.journal is not None:
+            self.journal(self.name, op, records)
+        if self.feed is not None:
+            if op == "delete":
+                self.feed.append(self.name, [("delete", r.id, None) for r in records])
+            else:
+                created = created or [False] * len(records)
+                self.feed.append(self.name, [("create" if new else "update", r.id, r) for r, new in zip(records, created)])
+
+    def _add_to_indexes(self, record):
+        for field, index in self._index.items():
+            index.setdefault(getattr(record, field, None), set()).add(record.id)
+
+    def _remove_from_indexes(self, record):
+        for field, index in self._index.items():
+            ids = index.get(getattr(record, field, None))
+            if ids is not None:
+                ids.discard(record.id)
+                if not ids:
+                    del index[getattr(record, field, None)]
+
+    def _store(self, record):
+        old = self._records.get(record.id)
+        if old is not None:
+            self._remove_from_indexes(old)
+        self._records[record.id] = record
+        self._add_to_indexes(record)
+        if record.id > self._sequence:
+            self._sequence = record.id
+        return old
+
+    def _candidates(self, filters: Dict[str, Any]):
+        # Narrow the scan with an id lookup or the first indexed equality / $in
+        # filter; the records found match it exactly, so only the other filters are returned
+        for field, cond in filters.items():
+            if field == "id":
+                if not isinstance(cond, dict):
+                    ids = [cond]
+                elif set(cond) == {"$in"}:
+                    ids = cond["$in"]
+                else:
+                    continue
+                rest = {f: c for f, c in filters.items() if f != field}
+                return [self._records[i] for i in ids if i in self._records], rest
+            index = self._index.get(field)
+            if index is None:
+                continue
+            if not isinstance(cond, dict):
+                ids = index.get(cond, ())
+            elif set(cond) == {"$in"}:
+                ids = set().union(*(index.get(v, ()) for v in cond["$in"]))
+            else:
+                continue
+            rest = {f: c for f, c in filters.items() if f != field}
+            return [self._records[i] for i in sorted(ids)], rest
+        return list(self._records.values()), filters
+
+    async def get(self, id: int):
+        return self._records.get(id)
+
+    async def exists(self, id: int) -> bool:
+        return id in self._records
+
+    def _matching(self, filters=None) -> List:
+        # Stored records matching `filters`, in no particular order
+        with self._lock:
+            records, filters = self._candidates(filters) if filters else (list(self._records.values()), None)
+        if filters:
+            records = [r for r in records if matches(r, filters)]
+        return records
+
+    def _unpack(self, stored):
+        # The model for a stored record; subclasses may store something smaller
+        return stored
+
+    async def list(self, filters=None, sort=None, skip=0, limit=None):
+        return self._order(self._matching(filters), sort, skip, limit)
+
+    @staticmethod
+    def _order(records: List, sort=None, skip=0, limit=None) -> List:
+        if sort:
+            field = sort.lstrip("-")
+            records.sort(key=lambda r: (getattr(r, field, None) is None, getattr(r, field, None)),
+                         reverse=sort.startswith("-"))
+        if skip or limit is not None:
+            records = records[skip:None if limit is None else skip + limit]
+        return records
+
+    async def count(self, filters=None):
+        if not filters:
+            return len(self._records)
+        return len(self._matching(filters))
+
+    async def iter_json(self, filters=None, size=EXPORT_CHUNK_RECORDS):
+        # One pass over the records; only a chunk at a time is turned into JSON
+        rows = sorted(self._matching(filters), key=attrgetter("id"))
+        for start in range(0, len(rows), size):
+            yield self._dump(rows[start:start + size])
+            await asyncio.sleep(0)
+
+    def _dump(self, rows: List) -> bytes:
+        return dump_records(rows)
+
+    async def group_count(self, filters=None, by=(), period=None):
+        return group_records(self._matching(filters), by, period)
+
+    async def next_ids(self, n=1):
+        with self._lock:
+            first = self._sequence + 1
+            self._sequence += n
+        return list(range(first, first + n))
+
+    async def bulk_insert(self, items):
+        if not items:
+            return []
+        ids = await self.next_ids(len(items))
+        records = [self.model(id=id, **item) for id, item in zip(ids, items)]
+        with self._lock:
+            for record in records:
+                self._store(record)
+            self._log("put", records, [True] * len(records))
+        return records
+
+    # The writes themselves never suspend, so subclasses can run them under the lock
+
+    def _put(self, records: List) -> List:
+        with self._lock:
+            created = [self._store(record) is None for record in records]
+            if records:
+                self._log("put", records, created)
+        return records
+
+    def _update(self, changes_by_id: Dict[int, Dict[str, Any]]) -> List:
+        updated = []
+        with self._lock:
+            for id, changes in changes_by_id.items():
+                record = self._records.get(id)
+                if record is not None:
+                    record = self._unpack(record).copy(update=changes)
+                    self._store(record)
+                    updated.append(record)
+            if updated:
+                self._log("put", updated)
+        return updated
+
+    def _delete(self, id: int) -> bool:
+        with self._lock:
+            record = self._records.pop(id, None)
+            if record is None:
+                return False
+            self._remove_from_indexes(record)
+            self._log("delete", [self._unpack(record)])
+        return True
+
+    async def put(self, record):
+        return self._put([record])[0]
+
+    async def bulk_put(self, records):
+        return self._put(records)
+
+    async def update(self, id, changes):
+        updated = self._update({id: changes})
+        return updated[0] if updated else None
+
+    async def bulk_update(self, changes_by_id):
+        return len(self._update(changes_by_id))
+
+    async def update_many(self, filters, changes):
+        matched = await self.list(filters)
+        return await self.bulk_update({r.id: changes for r in matched})
+
+    async def delete(self, id):
+        return self._delete(id)
+
+    async def version(self):
+        return self._version
+
+    def snapshot(self):
+        """Consistent copy of (sequence, stored records) for persistence."""
+        with self._lock:
+            return self._sequence, list(self._records.values())
+
+    def restore(self, op: str, records: List, sequence: int = 0):
+        """Apply recovered changes without journaling them again."""
+        with self._lock:
+            for record in records:
+                if op == "put":
+                    self._store(record)
+                elif self._records.pop(record.id, None) is not None:
+                    self._remove_from_indexes(record)
+            self._sequence = max(self._sequence, sequence)
+
+
+class CompactRepository(InMemoryRepository):
+    """InMemoryRepository that stores each record as a small __slots__ row.
+
+    A pydantic model costs about a kilobyte; a row holds just the field values,
+    and the values of the `shared` fields (statuses, dates, ids repeated across
+    many records) are stored once per distinct value. Index entries are sorted
+    arrays of ids rather than sets. Models are built again only for the
+    records a read returns. The shared values are kept until enough rows have
+    been removed or replaced, then rebuilt from the rows left.
+    """
+
+    def __init__(self, name: str, model: Type, indexes: Iterable = (), shared: Iterable[str] = ()):
+        super().__init__(name, model, indexes)
+        self.fields = list(getattr(model, "model_fields", None) or model.__fields__)
+        self._row_type = type(f"{model.__name__}Row", (), {"__slots__": tuple(self.fields)})
+        self._values = attrgetter(*self.fields)
+        self._shared: Dict[str, Dict[Any, Any]] = {field: {} for field in shared}
+        # Rows removed or replaced since the shared values were last rebuilt
+        self._removed = 0
+        self.shared_rebuilds = 0
+
+    def _pack(self, record):
+        row = self._row_type()
+        for field in self.fields:
+            value = getattr(record, field)
+            table = self._shared.get(field)
+            if table is not None:
+                value = table.setdefault(value, value)
+            setattr(row, field, value)
+        return row
+
+    def _unpack(self, stored):
+        # Validating is faster than model_construct() with pydantic 2
+        return self.model(**dict(zip(self.fields, self._values(stored))))
+
+    def _add_to_indexes(self, record):
+        id = record.id
+        for field, index in self._index.items():
+            ids = index.get(getattr(record, field, None))
+            if ids is None:
+                index[getattr(record, field, None)] = array("q", (id,))
+            elif ids[-1] < id:
+                # Ids are mostly handed out in order
+                ids.append(id)
+            else:
+                i = bisect_left(ids, id)
+                if i == len(ids) or ids[i] != id:
+                    ids.insert(i, id)
+
+    def _remove_from_indexes(self, record):
+        for field, index in self._index.items():
+            value = getattr(record, field, None)
+            ids = index.get(value)
+            if ids is not None:
+                i = bisect_left(ids, record.id)
+                if i < len(ids) and ids[i] == record.id:
+                    del ids[i]
+                    if not ids:
+                        del index[value]
+        self._removed += 1
+
+    def _store(self, record):
+        return super()._store(self._pack(record))
+
+    def _log(self, op, records, created=None):
+        super()._log(op, records, created)
+        self._trim_shared()
+
+    def _trim_shared(self):
+        # Caller holds the lock. The tables would otherwise keep every value
+        # ever stored; rebuilding once as many rows have gone as are left
+        # costs O(1) per removal
+        if not self._shared or self._removed < max(len(self._records), SHARED_REBUILD_ROWS):
+            return
+        for field in self._shared:
+            live = {}
+            for row in self._records.values():
+                value = getattr(row, field)
+                live.setdefault(value, value)
+            self._shared[field] = live
+        self._removed = 0
+        self.shared_rebuilds += 1
+
+    async def get(self, id):
+        row = self._records.get(id)
+        return None if row is None else self._unpack(row)
+
+    async def list(self, filters=None, sort=None, skip=0, limit=None):
+        # Sorted and paged as rows, so only the returned page becomes models
+        return [self._unpack(row) for row in await super().list(filters, sort, skip, limit)]
+
+    async def list_json(self, filters=None, sort=None, skip=0, limit=None):
+        return self._dump(await InMemoryRepository.list(self, filters, sort, skip, limit))
+
+    def _dump(self, rows):
+        return dumps([dict(zip(self.fields, self._values(row))) for row in rows])
+
+
+class SQLiteRepository(Repository):
+    """Table in a SQLite file shared by every worker process on the host.
+
+    Records are stored as JSON with expression indexes on the declared fields.
+    The database runs in WAL mode, so readers never block each other or the
+    single writer: reads run inline, writes run in the threadpool because they
+    may wait for the write lock held by another process.
+    """
+
+    _local = threading.local()
+
+    def __init__(self, name: str, model: Type, indexes: Iterable = (), path: Optional[str] = None):
+        super().__init__(name, model, indexes)
+        self.path = path or SQLITE_PATH
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread and process; tables are created on first use
+        connections = self._local.__dict__.setdefault("connections", {})
+        key = (os.getpid(), self.path)
+        if key not in connections:
+            conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_BYTES}")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, seq INTEGER NOT NULL)")
+            conn.execute(SQLiteChangeFeed.SCHEMA)
+            connections[key] = (conn, set())
+        conn, tables = connections[key]
+        if self.name not in tables:
+            conn.execute(f'CREATE TABLE IF NOT EXISTS "{self.name}" (id INTEGER PRIMARY KEY, data TEXT NOT NULL)')
+            for key in self.index_keys():
+                conn.execute(f'CREATE INDEX IF NOT EXISTS "{self.name}_{"_".join(key)}" '
+                             f'ON "{self.name}" ({", ".join(self._column(f) for f in key)})')
+            tables.add(self.name)
+        return conn
+
+    @staticmethod
+    def _column(field: str) -> str:
+        return "id" if field == "id" else f"json_extract(data, '$.{field}')"
+
+    @staticmethod
+    def _param(value):
+        # Match how pydantic serialises the stored JSON
+        if isinstance(value, date):
+            return value.isoformat()
+        return value
+
+    def _where(self, filters: Optional[Dict[str, Any]]):
+        clauses, params = [], []
+        for field, cond in (filters or {}).items():
+            column = self._column(field)
+            if not isinstance(cond, dict):
+                cond = {"$eq": cond}
+            for op, operand in cond.items():
+                if op in ("$eq", "$ne") and operand is None:
+                    clauses.append(f"{column} IS {'NOT ' if op == '$ne' else ''}NULL")
+                elif op == "$eq":
+                    clauses.append(f"{column} = ?")
+                    params.append(self._param(operand))
+                elif op == "$ne":
+                    clauses.append(f"({column} IS NULL OR {column} != ?)")
+                    params.append(self._param(operand))
+                elif op in ("$in", "$nin"):
+                    values = [self._param(v) for v in operand if v is not None]
+                    has_null = len(values) < len(operand)
+                    inside = f"{column} IN ({', '.join('?' * len(values))})"
+                    if op == "$in":
+                        clauses.append(f"({inside}{f' OR {column} IS NULL' if has_null else ''})")
+                    else:
+                        clauses.append(f"(({column} IS NULL AND {int(not has_null)}) OR NOT {inside})")
+                    params.extend(values)
+                else:
+                    symbol = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}[op]
+                    clauses.append(f"{column} {symbol} ?")
+                    params.append(self._param(operand))
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def _decode(self, data: str):
+        return self.model.parse_raw(data)
+
+    async def _write(self, fn, changes: bool = True):
+        def run():
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn)
+                if changes:
+                    # Bumped in the same transaction, so other workers see it with the data
+                    conn.execute("INSERT INTO counters (name, seq) VALUES (?, 1) "
+                                 "ON CONFLICT (name) DO UPDATE SET seq = seq + 1", (f"{self.name}:version",))
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+        result = await run_in_threadpool(run)
+        if changes and self.feed is not None:
+            self.feed.wake()
+        return result
+
+    def _reserve(self, conn, n: int) -> List[int]:
+        last = conn.execute(
+            "INSERT INTO counters (name, seq) VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET seq = seq + excluded.seq RETURNING seq",
+            (self.name, n),
+        ).fetchone()[0]
+        return list(range(last - n + 1, last + 1))
+
+    def _replace(self, conn, records: List, op: Optional[str] = None):
+        # `op` is what the change feed records: "create", "update", or None to look it up
+        rows = [(r.id, r.json()) for r in records]
+        if self.feed is not None and rows:
+            if op is None:
+                existing = {id for (id,) in conn.execute(
+                    f'SELECT id FROM "{self.name}" WHERE id IN ({",".join("?" * len(rows))})', [id for id, _ in rows])}
+                changes = [("update" if id in existing else "create", id, data) for id, data in rows]
+            else:
+                changes = [(op, id, data) for id, data in rows]
+            self.feed.append(conn, self.name, changes)
+        conn.executemany(f'INSERT OR REPLACE INTO "{self.name}" (id, data) VALUES (?, ?)', rows)
+
+    def _apply(self, conn, where: str, params: List, changes_for) -> int:
+        rows = conn.execute(f'SELECT data FROM "{self.name}"{where}', params).fetchall()
+        updated = []
+        for (data,) in rows:
+            record = self._decode(data)
+            changes = changes_for(record.id)
+            if changes is not None:
+                updated.append(record.copy(update=changes))
+        self._replace(conn, updated, "update")
+        return len(updated)
+
+    async def get(self, id):
+        row = self._connection().execute(f'SELECT data FROM "{self.name}" WHERE id = ?', (id,)).fetchone()
+        return self._decode(row[0]) if row else None
+
+    async def exists(self, id):
+        return self._connection().execute(f'SELECT 1 FROM "{self.name}" WHERE id = ?', (id,)).fetchone() is not None
+
+    def _select(self, filters, sort, skip, limit):
+        where, params = self._where(filters)
+        order = "id"
+        if sort:
+            column = self._column(sort.lstrip("-"))
+            # Same order as the in-memory backend: missing values last, first when descending
+            direction = "DESC" if sort.startswith("-") else "ASC"
+            order = f"{column} IS NULL {direction}, {column} {direction}, id"
+        sql = f'SELECT data FROM "{self.name}"{where} ORDER BY {order}'
+        if skip or limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params = params + [-1 if limit is None else limit, skip]
+        return sql, params
+
+    async def list(self, filters=None, sort=None, skip=0, limit=None):
+        sql, params = self._select(filters, sort, skip, limit)
+        return [self._decode(data) for (data,) in self._connection().execute(sql, params)]
+
+    async def list_json(self, filters=None, sort=None, skip=0, limit=None):
+        # The stored rows are already the records' JSON
+        sql, params = self._select(filters, sort, skip, limit)
+        return ("[" + ",".join(data for (data,) in self._connection().execute(sql, params)) + "]").encode("utf-8")
+
+    async def iter_json(self, filters=None, size=EXPORT_CHUNK_RECORDS):
+        # Paged by id in the threadpool: an export can span the whole table
+        def page(last):
+            where, params = self._where(filters if last is None else _after(filters, last))
+            return self._connection().execute(
+                f'SELECT id, data FROM "{self.name}"{where} ORDER BY id LIMIT ?', params + [size]).fetchall()
+        last = None
+        while True:
+            rows = await run_in_threadpool(page, last)
+            if rows:
+                yield ("[" + ",".join(data for _, data in rows) + "]").encode("utf-8")
+                last = rows[-1][0]
+            if len(rows) < size:
+                return
+
+    async def count(self, filters=None):
+        where, params = self._where(filters)
+        return self._connection().execute(f'SELECT COUNT(*) FROM "{self.name}"{where}', params).fetchone()[0]
+
+    async def group_count(self, filters=None, by=(), period=None):
+        where, params = self._where(filters)
+        columns = [self._column(field) for field in by]
+        if period:
+            # SQLite before 3.46 has no ISO week format, so weeks are folded from days
+            date_column = self._column(period[0])
+            columns.insert(0, f"substr({date_column}, 1, 7)" if period[1] == "monthly" else date_column)
+        select = ", ".join(columns + ["COUNT(*)"])
+        group = f" GROUP BY {', '.join(columns)}" if columns else ""
+        counts: Dict[tuple, int] = {}
+        for *key, n in self._connection().execute(f'SELECT {select} FROM "{self.name}"{where}{group}', params):
+            if period:
+                key[0] = period_key(key[0], period[1])
+            counts[tuple(key)] = counts.get(tuple(key), 0) + n
+        return counts
+
+    async def next_ids(self, n=1):
+        return await self._write(lambda conn: self._reserve(conn, n), changes=False)
+
+    async def bulk_insert(self, items):
+        if not items:
+            return []
+        def insert(conn):
+            ids = self._reserve(conn, len(items))
+            records = [self.model(id=id, **item) for id, item in zip(ids, items)]
+            self._replace(conn, records, "create")
+            return records
+        return await self._write(insert)
+
+    async def put(self, record):
+        def put(conn):
+            self._replace(conn, [record])
+            # Keep the sequence ahead of client-chosen ids
+            conn.execute("INSERT INTO counters (name, seq) VALUES (?, ?) "
+                         "ON CONFLICT (name) DO UPDATE SET seq = max(seq, excluded.seq)", (self.name, record.id))
+        await self._write(put)
+        return record
+
+    async def bulk_put(self, records):
+        if not records:
+            return []
+        def put(conn):
+            self._replace(conn, records)
+            conn.execute("INSERT INTO counters (name, seq) VALUES (?, ?) "
+                         "ON CONFLICT (name) DO UPDATE SET seq = max(seq, excluded.seq)", (self.name, max(r.id for r in records)))
+        await self._write(put)
+        return records
+
+    async def update(self, id, changes):
+        def update(conn):
+            row = conn.execute(f'SELECT data FROM "{self.name}" WHERE id = ?', (id,)).fetchone()
+            if row is None:
+                return None
+            record = self._decode(row[0]).copy(update=changes)
+            self._replace(conn, [record], "update")
+            return record
+        return await self._write(update)
+
+    async def bulk_update(self, changes_by_id):
+        if not changes_by_id:
+            return 0
+        where, params = self._where({"id": {"$in": list(changes_by_id)}})
+        return await self._write(lambda conn: self._apply(conn, where, params, changes_by_id.get))
+
+    async def update_many(self, filters, changes):
+        where, params = self._where(filters)
+        return await self._write(lambda conn: self._apply(conn, where, params, lambda id: changes))
+
+    async def delete(self, id):
+        def delete(conn):
+            deleted = conn.execute(f'DELETE FROM "{self.name}" WHERE id = ?', (id,)).rowcount > 0
+            if deleted and self.feed is not None:
+                self.feed.append(conn, self.name, [("delete", id, None)])
+            return deleted
+        return await self._write(delete)
+
+    async def version(self):
+        row = self._connection().execute("SELECT seq FROM counters WHERE name = ?", (f"{self.name}:version",)).fetchone()
+        return row[0] if row else 0
+
+    async def ensure_indexes(self):
+        self._connection()
+
+
+class MongoRepository(Repository):
+    """Collection-backed store; `id` is kept in `_id` and sequences in `counters`."""
+
+    COUNTERS = "counters"
+
+    @property
+    def collection(self):
+        return get_database()[self.name]
+
+    @staticmethod
+    def _query(filters: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        if not filters:
+            return {}
+        return {("_id" if k == "id" else k): v for k, v in filters.items()}
+
+    def _to_doc(self, record) -> Dict[str, Any]:
+        doc = record.dict()
+        doc["_id"] = doc.pop("id")
+        return doc
+
+    def _from_doc(self, doc):
+        doc["id"] = doc.pop("_id")
+        return self.model(**doc)
+
+    async def get(self, id):
+        doc = await self.collection.find_one({"_id": id})
+        return self._from_doc(doc) if doc else None
+
+    async def exists(self, id):
+        return await self.collection.count_documents({"_id": id}, limit=1) > 0
+
+    def _find(self, filters, sort, skip, limit):
+        cursor = self.collection.find(self._query(filters))
+        if sort:
+            field = sort.lstrip("-")
+            cursor = cursor.sort("_id" if field == "id" else field, DESCENDING if sort.startswith("-") else ASCENDING)
+        if skip:
+            cursor = cursor.skip(skip)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        return cursor
+
+    async def list(self, filters=None, sort=None, skip=0, limit=None):
+        return [self._from_doc(doc) async for doc in self._find(filters, sort, skip, limit)]
+
+    async def list_json(self, filters=None, sort=None, skip=0, limit=None):
+        # Documents are written from validated records, so they are sent as stored
+        docs = []
+        async for doc in self._find(filters, sort, skip, limit):
+            doc["id"] = doc.pop("_id")
+            docs.append(doc)
+        return dumps(docs)
+
+    async def count(self, filters=None):
+        return await self.collection.count_documents(self._query(filters))
+
+    async def group_count(self, filters=None, by=(), period=None):
+        # Only one document per group crosses the network
+        group_id = {field: "$_id" if field == "id" else f"${field}" for field in by}
+        if period:
+            field, unit = period
+            # Weeks are folded from per-day groups: ISO week operators need BSON
+            # dates, and dates are stored as "YYYY-MM-DD" strings
+            group_id["_period"] = {"$substr": [f"${field}", 0, 7]} if unit == "monthly" else f"${field}"
+        pipeline = [{"$match": self._query(filters)}, {"$group": {"_id": group_id, "count": {"$sum": 1}}}]
+        counts: Dict[tuple, int] = {}
+        async for row in self.collection.aggregate(pipeline):
+            key = tuple(row["_id"].get(field) for field in by)
+            if period:
+                key = (period_key(row["_id"]["_period"], period[1]),) + key
+            counts[key] = counts.get(key, 0) + row["count"]
+        return counts
+
+    async def next_ids(self, n=1):
+        counter = await get_database()[self.COUNTERS].find_one_and_update(
+            {"_id": self.name},
+            {"$inc": {"seq": n}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        last = counter["seq"]
+        return list(range(last - n + 1, last + 1))
+
+    async def bulk_insert(self, items):
+        if not items:
+            return []
+        ids = await self.next_ids(len(items))
+        records = [self.model(id=id, **item) for id, item in zip(ids, items)]
+        await self.collection.insert_many([self._to_doc(r) for r in records], ordered=False)
+        await self._changed([("create", r.id, r) for r in records])
+        return records
+
+    async def put(self, record):
+        result = await self.collection.replace_one({"_id": record.id}, self._to_doc(record), upsert=True)
+        # Keep the sequence ahead of client-chosen ids
+        await get_database()[self.COUNTERS].update_one({"_id": self.name}, {"$max": {"seq": record.id}}, upsert=True)
+        await self._changed([("update" if result.upserted_id is None else "create", record.id, record)])
+        return record
+
+    async def bulk_put(self, records):
+        if not records:
+            return []
+        result = await self.collection.bulk_write(
+            [ReplaceOne({"_id": r.id}, self._to_doc(r), upsert=True) for r in records],
+            ordered=False,
+        )
+        await get_database()[self.COUNTERS].update_one({"_id": self.name}, {"$max": {"seq": max(r.id for r in records)}}, upsert=True)
+        created = set(result.upserted_ids.values())
+        await self._changed([("create" if r.id in created else "update", r.id, r) for r in records])
+        return records
+
+    async def update(self, id, changes):
+        doc = await self.collection.find_one_and_update(
+            {"_id": id}, {"$set": changes}, return_document=ReturnDocument.AFTER
+        )
+        if doc is None:
+            return None
+        record = self._from_doc(doc)
+        await self._changed([("update", id, record)])
+        return record
+
+    async def bulk_update(self, changes_by_id):
+        if not changes_by_id:
+            return 0
+        result = await self.collection.bulk_write(
+            [UpdateOne({"_id": id}, {"$set": changes}) for id, changes in changes_by_id.items()],
+            ordered=False,
+        )
+        await self._changed(await self._updated({"id": {"$in": list(changes_by_id)}}))
+        return result.matched_count
+
+    async def update_many(self, filters, changes):
+        if self.feed is not None:
+            # The feed needs the ids; the filters may no longer match once changed
+            ids = [doc["_id"] async for doc in self.collection.find(self._query(filters), {"_id": 1})]
+            filters = {"id": {"$in": ids}}
+        result = await self.collection.update_many(self._query(filters), {"$set": changes})
+        if result.matched_count:
+            await self._changed(await self._updated(filters))
+        return result.matched_count
+
+    async def delete(self, id):
+        result = await self.collection.delete_one({"_id": id})
+        if result.deleted_count == 0:
+            return False
+        await self._changed([("delete", id, None)])
+        return True
+
+    async def _updated(self, filters) -> List:
+        # After-images of updated records, only fetched when there is a feed to give them to
+        if self.feed is None:
+            return []
+        return [("update", r.id, r) for r in await self.list(filters)]
+
+    async def _changed(self, changes: List = ()):
+        await get_database()[self.COUNTERS].update_one({"_id": f"{self.name}:version"}, {"$inc": {"seq": 1}}, upsert=True)
+        if self.feed is not None and changes:
+            await self.feed.append(self.name, changes)
+
+    async def version(self):
+        counter = await get_database()[self.COUNTERS].find_one({"_id": f"{self.name}:version"})
+        return counter["seq"] if counter else 0
+
+    async def ensure_indexes(self):
+        for key in self.index_keys():
+            await self.collection.create_index([(field, ASCENDING) for field in key],
+                                               name="_".join(f"{field}_1" for field in key))
+
+
+BACKENDS = {
+    "memory": InMemoryRepository,
+    "sqlite": SQLiteRepository,
+    "mongo": MongoRepository,
+}
+
+repositories: Dict[str, Repository] = {}
+
+
+def get_repository(name: str, model: Type, indexes: Iterable = (), backend: Optional[str] = None,
+                   partition_by: Optional[str] = None, compact: Optional[Iterable[str]] = None) -> Repository:
+    """Return the process-wide repository for `name`, creating it on first use.
+
+    With the memory backend, `compact` (the fields whose values are shared
+    between records, possibly none) stores the records as compact rows, see
+    CompactRepository, and `partition_by` (a date field) keeps only recent
+    months in memory, see app.partitions. Other backends ignore both.
+    """
+    if name not in repositories:
+        backend = backend or REPOSITORY_BACKEND
+        if partition_by and backend == "memory" and PARTITIONING_ENABLED:
+            from app.partitions import PARTITION_DIR, PartitionedRepository
+            repo = PartitionedRepository(name, model, indexes, compact or (), partition_by, PARTITION_DIR)
+        elif compact is not None and backend == "memory":
+            repo = CompactRepository(name, model, indexes, compact)
+        else:
+            repo = BACKENDS[backend](name, model, indexes)
+        repositories[name] = repo
+        if name in CHANGE_FEED_STORES:
+            repo.feed = get_change_feed(backend, getattr(repo, "_connection", None))
+    return repositories[name]
+
+
+async def ensure_repository_indexes():
+    for repo in repositories.values():
+        await repo.ensure_indexes()
@@ -0,0 +1,67 @@
+import json
+import os
+from datetime import date, datetime
+from typing import Dict, List, Optional, Type
+
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from pydantic import TypeAdapter
+except ImportError:
+    # pydantic 1, which fastapi 0.110 also accepts
+    TypeAdapter = None
+
+# Opt-in: list endpoints send the stored records as JSON without running them
+# through their response model again, and JSON responses are rendered by orjson
+FAST_SERIALIZATION = os.getenv("EMS_FAST_SERIALIZATION", "0").lower() in ("1", "true", "yes")
+
+_adapters: Dict[Type, "TypeAdapter"] = {}
+
+
+def _default(value):
+    # Records are already validated, so their fields can be emitted as they are
+    if isinstance(value, BaseModel):
+        return value.__dict__
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dump_records(records: List[BaseModel]) -> bytes:
+    """JSON array of trusted pydantic records, without validating them again."""
+    if orjson is not None:
+        return orjson.dumps([r.__dict__ for r in records], default=_default)
+    if not records:
+        return b"[]"
+    if TypeAdapter is None:
+        return dumps([r.__dict__ for r in records])
+    model = type(records[0])
+    adapter = _adapters.get(model)
+    if adapter is None:
+        adapter = _adapters[model] = TypeAdapter(List[model])
+    return adapter.dump_json(records)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+async def list_response(repo, filters: Optional[Dict] = None, **kwargs):
+    """Records for a list endpoint: model instances normally, or, in fast mode,
+    a response with the store's JSON that bypasses the route's response_model."""
+    if FAST_SERIALIZATION:
+        return Response(await repo.list_json(filters, **kwargs), media_type="application/json")
+    return await repo.list(filters, **kwargs)
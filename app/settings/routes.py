@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, status
 from pydantic import BaseModel
 from typing import List, Optional
+from app.repository import get_repository
 
 router = APIRouter(prefix="/departments", tags=["Departments"])
 
@@ -9,46 +10,43 @@ class Department(BaseModel):
     name: str
     description: Optional[str] = None
 
-# In-memory DB placeholder
-department_db = {}
+department_repo = get_repository("departments", Department)
 
 @router.get("", response_model=List[Department])
-def list_departments():
-    return list(department_db.values())
+async def list_departments():
+    return await department_repo.list()
 
 @router.post("", response_model=Department)
-def add_department(department: Department):
-    if department.id in department_db:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Department ID already exists")
-    department_db[department.id] = department
+async def add_department(department: Department):
+    async with department_repo.lock:
+        if await department_repo.exists(department.id):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Department ID already exists")
+        await department_repo.put(department)
     return department
 
 @router.get("/{id}", response_model=Department)
-def get_department(id: int):
-    record = department_db.get(id)
+async def get_department(id: int):
+    record = await department_repo.get(id)
     if not record:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Department {id} not found")
     return record
 
 @router.put("/{id}", response_model=Department)
-def update_department(id: int, department: Department):
-    if id not in department_db:
+async def update_department(id: int, department: Department):
+    if not await department_repo.exists(id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Department {id} not found")
-    department_db[id] = department
+    department = department.copy(update={"id": id})
+    await department_repo.put(department)
     return department
 
 @router.delete("/{id}")
-def delete_department(id: int):
-    if id not in department_db:
+async def delete_department(id: int):
+    if not await department_repo.delete(id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Department {id} not found")
-    del department_db[id]
     # Update employees whose department_id matches the deleted department
     try:
-        from app.employee.routes import employee_db
-        for emp in employee_db.values():
-            if getattr(emp, "department_id", None) == id:
-                emp.department_id = None
-                emp.department = None
+        from app.employee.routes import employee_repo
+        await employee_repo.update_many({"department_id": id}, {"department_id": None, "department": None})
     except ImportError:
         pass
     return {"message": f"Department {id} deleted successfully"}
\ No newline at end of file
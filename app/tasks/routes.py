@@ -1,16 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from typing import List, Optional
 from pydantic import BaseModel
+from app.repository import get_repository
+from app.bulk import chunks, get_many, parse_items
 
 router = APIRouter(prefix="/tasks", tags=["Tasks"])
 
 # Example role-based dependency
-def get_current_user_role():
+async def get_current_user_role():
     # Placeholder: Replace with actual authentication logic
     return "employee"
 
 def require_role(roles: List[str]):
-    def role_checker(role: str = Depends(get_current_user_role)):
+    async def role_checker(role: str = Depends(get_current_user_role)):
         if role not in roles:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient permissions")
     return role_checker
@@ -34,75 +36,147 @@ class TaskUpdate(BaseModel):
     due_date: Optional[str] = None
     status: Optional[str] = None
 
+class TaskBulkUpdate(TaskUpdate):
+    id: int
+
 class Task(TaskBase):
     id: int
 
-# In-memory DB placeholder
-task_db = {}
+task_repo = get_repository("tasks", Task, indexes=("assigned_to", "status"))
 
 @router.get("", response_model=List[Task])
-def list_tasks(role: str = Depends(get_current_user_role)):
-    return list(task_db.values())
+async def list_tasks(role: str = Depends(get_current_user_role)):
+    return await task_repo.list()
 
 @router.post("", response_model=Task, status_code=status.HTTP_201_CREATED, dependencies=[Depends(require_role(["admin", "manager"]))])
-def add_task(task: TaskCreate):
-    new_id = len(task_db) + 1
-    record = Task(id=new_id, **task.dict())
-    task_db[new_id] = record
-    # Synchronize with employee_db
+async def add_task(task: TaskCreate):
+    record = await task_repo.insert(task.dict())
+    # Synchronize with the employee's task list
     try:
-        from app.employee.routes import employee_db
-        emp = employee_db.get(record.assigned_to)
+        from app.employee.routes import employee_repo
+        from app.notifications.logic import create_notification
+        async with employee_repo.lock:
+            emp = await employee_repo.get(record.assigned_to)
+            if emp and record.id not in emp.tasks:
+                await employee_repo.update(emp.id, {"tasks": emp.tasks + [record.id]})
         if emp:
-            if record.id not in emp.tasks:
-                emp.tasks.append(record.id)
             # Notify employee of new task assignment
             create_notification(user_id=record.assigned_to, message=f"You have been assigned a new task: {record.title}", type_="task_assigned", related_task=record.id)
     except ImportError:
         pass
     return record
 
+@router.post("/bulk", dependencies=[Depends(require_role(["admin", "manager"]))])
+async def add_tasks_bulk(request: Request):
+    """Create many tasks: a JSON array of tasks, or NDJSON. Reports each task's id or errors."""
+    valid, result = await parse_items(request, TaskCreate)
+    for chunk in chunks(valid):
+        records = await task_repo.bulk_insert([task.dict() for _, task in chunk])
+        for (index, _), record in zip(chunk, records):
+            result.ok(index, "created", record.id)
+        # Synchronize the employees' task lists: one lookup and one write per chunk
+        try:
+            from app.employee.routes import employee_repo
+            from app.notifications.logic import create_notifications
+            async with employee_repo.lock:
+                employees = await get_many(employee_repo, {r.assigned_to for r in records})
+                tasks = {}
+                for record in records:
+                    emp = employees.get(record.assigned_to)
+                    if emp:
+                        tasks.setdefault(emp.id, list(emp.tasks))
+                        if record.id not in tasks[emp.id]:
+                            tasks[emp.id].append(record.id)
+                await employee_repo.bulk_update({id: {"tasks": t} for id, t in tasks.items()})
+            create_notifications([
+                dict(user_id=r.assigned_to, message=f"You have been assigned a new task: {r.title}", type_="task_assigned", related_task=r.id)
+                for r in records if r.assigned_to in employees
+            ])
+        except ImportError:
+            pass
+    return result.response()
+
+@router.put("/bulk", dependencies=[Depends(require_role(["admin", "manager"]))])
+async def update_tasks_bulk(request: Request):
+    """Update many tasks: each item has the task's id and the fields to change."""
+    valid, result = await parse_items(request, TaskBulkUpdate)
+    seen = set()
+    for chunk in chunks(valid):
+        current = await get_many(task_repo, {u.id for _, u in chunk})
+        changes = {}
+        for index, update in chunk:
+            if update.id in seen:
+                result.error(index, f"Task {update.id} appears more than once")
+            elif update.id not in current:
+                result.error(index, "Task not found")
+            else:
+                fields = update.dict(exclude_unset=True, exclude={"id"})
+                if fields:
+                    changes[update.id] = fields
+                result.ok(index, "updated", update.id)
+            seen.add(update.id)
+        await task_repo.bulk_update(changes)
+        moves = [(id, current[id].assigned_to, c["assigned_to"]) for id, c in changes.items()
+                 if c.get("assigned_to") is not None and c["assigned_to"] != current[id].assigned_to]
+        if not moves:
+            continue
+        # Synchronize employee task lists for reassigned tasks
+        try:
+            from app.employee.routes import employee_repo
+            async with employee_repo.lock:
+                employees = await get_many(employee_repo, {e for _, prev, new in moves for e in (prev, new)})
+                tasks = {id: list(emp.tasks) for id, emp in employees.items()}
+                for task_id, prev, new in moves:
+                    if prev in tasks and task_id in tasks[prev]:
+                        tasks[prev].remove(task_id)
+                    if new in tasks and task_id not in tasks[new]:
+                        tasks[new].append(task_id)
+                await employee_repo.bulk_update({id: {"tasks": t} for id, t in tasks.items() if t != employees[id].tasks})
+        except ImportError:
+            pass
+    return result.response()
+
 @router.get("/{task_id}", response_model=Task)
-def get_task(task_id: int):
-    record = task_db.get(task_id)
+async def get_task(task_id: int):
+    record = await task_repo.get(task_id)
     if not record:
         raise HTTPException(status_code=404, detail="Task not found")
     return record
 
 @router.put("/{task_id}", response_model=Task, dependencies=[Depends(require_role(["admin", "manager"]))])
-def update_task(task_id: int, update: TaskUpdate):
-    record = task_db.get(task_id)
+async def update_task(task_id: int, update: TaskUpdate):
+    record = await task_repo.get(task_id)
     if not record:
         raise HTTPException(status_code=404, detail="Task not found")
     prev_assigned = record.assigned_to
-    updated = record.copy(update=update.dict(exclude_unset=True))
-    task_db[task_id] = updated
-    # Synchronize with employee_db if assigned_to changed
+    updated = await task_repo.update(task_id, update.dict(exclude_unset=True))
+    # Synchronize employee task lists if assigned_to changed
     try:
-        from app.employee.routes import employee_db
+        from app.employee.routes import employee_repo
         if update.assigned_to is not None and update.assigned_to != prev_assigned:
-            prev_emp = employee_db.get(prev_assigned)
-            if prev_emp and task_id in prev_emp.tasks:
-                prev_emp.tasks.remove(task_id)
-            new_emp = employee_db.get(update.assigned_to)
-            if new_emp and task_id not in new_emp.tasks:
-                new_emp.tasks.append(task_id)
+            async with employee_repo.lock:
+                prev_emp = await employee_repo.get(prev_assigned)
+                if prev_emp and task_id in prev_emp.tasks:
+                    await employee_repo.update(prev_emp.id, {"tasks": [t for t in prev_emp.tasks if t != task_id]})
+                new_emp = await employee_repo.get(update.assigned_to)
+                if new_emp and task_id not in new_emp.tasks:
+                    await employee_repo.update(new_emp.id, {"tasks": new_emp.tasks + [task_id]})
     except ImportError:
         pass
     return updated
 
 @router.put("/{task_id}/complete", response_model=Task, dependencies=[Depends(require_role(["admin", "manager", "employee"]))])
-def complete_task(task_id: int):
-    record = task_db.get(task_id)
+async def complete_task(task_id: int):
+    record = await task_repo.get(task_id)
     if not record:
         raise HTTPException(status_code=404, detail="Task not found")
-    updated = record.copy(update={"status": "completed"})
-    task_db[task_id] = updated
-    # Synchronize with employee_db (optional: could track completed tasks)
+    updated = await task_repo.update(task_id, {"status": "completed"})
+    # Synchronize with employees (optional: could track completed tasks)
     # Notify manager and employee of completion
     try:
-        from app.employee.routes import employee_db
-        emp = employee_db.get(record.assigned_to)
+        from app.employee.routes import employee_repo
+        from app.notifications.logic import create_notification
+        emp = await employee_repo.get(record.assigned_to)
         if emp:
             create_notification(user_id=record.assigned_to, message=f"Your task '{record.title}' has been marked as completed.", type_="task_completed", related_task=record.id)
         # Optionally notify managers (assuming manager id is 1 for demo)
@@ -112,21 +186,26 @@ def complete_task(task_id: int):
     return updated
 
 @router.post("/{task_id}/performance", response_model=Task, dependencies=[Depends(require_role(["admin", "manager"]))])
-def review_task_performance(task_id: int, score: float, notes: Optional[str] = None):
-    record = task_db.get(task_id)
+async def review_task_performance(task_id: int, score: float, notes: Optional[str] = None):
+    record = await task_repo.get(task_id)
     if not record:
         raise HTTPException(status_code=404, detail="Task not found")
-    updated = record.copy(update={"performance_score": score, "review_notes": notes})
-    task_db[task_id] = updated
-    # Synchronize with employee_db
+    updated = await task_repo.update(task_id, {"performance_score": score, "review_notes": notes})
+    # Synchronize with the employee's performance history
     try:
-        from app.employee.routes import employee_db
-        emp = employee_db.get(record.assigned_to)
+        from app.employee.routes import employee_repo
+        from app.notifications.logic import create_notification
+        async with employee_repo.lock:
+            emp = await employee_repo.get(record.assigned_to)
+            if emp:
+                changes = {}
+                if score is not None:
+                    changes["performance_scores"] = emp.performance_scores + [score]
+                if notes:
+                    changes["performance_notes"] = emp.performance_notes + [notes]
+                if changes:
+                    await employee_repo.update(emp.id, changes)
         if emp:
-            if score is not None:
-                emp.performance_scores.append(score)
-            if notes:
-                emp.performance_notes.append(notes)
             # Notify employee of performance review
             create_notification(user_id=record.assigned_to, message=f"Your task '{record.title}' has been reviewed. Score: {score}. Notes: {notes or ''}", type_="task_reviewed", related_task=record.id)
     except ImportError:
@@ -134,16 +213,18 @@ def review_task_performance(task_id: int, score: float, notes: Optional[str] = N
     return updated
 
 @router.delete("/{task_id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(require_role(["admin"]))])
-def delete_task(task_id: int):
-    if task_id not in task_db:
+async def delete_task(task_id: int):
+    record = await task_repo.get(task_id)
+    if not record:
         raise HTTPException(status_code=404, detail="Task not found")
-    # Synchronize with employee_db
+    # Synchronize with employee task lists
     try:
-        from app.employee.routes import employee_db
-        for emp in employee_db.values():
-            if task_id in emp.tasks:
-                emp.tasks.remove(task_id)
+        from app.employee.routes import employee_repo
+        async with employee_repo.lock:
+            emp = await employee_repo.get(record.assigned_to)
+            if emp and task_id in emp.tasks:
+                await employee_repo.update(emp.id, {"tasks": [t for t in emp.tasks if t != task_id]})
     except ImportError:
         pass
-    del task_db[task_id]
+    await task_repo.delete(task_id)
     return None
\ No newline at end of file
@@ -1,19 +1,21 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Response
+from fastapi.responses import StreamingResponse
+from fastapi.security import OAuth2PasswordBearer
+from bson import ObjectId
 from pydantic import BaseModel, EmailStr
-from motor.motor_asyncio import AsyncIOMotorClient
 from typing import List, Optional
 from jose import JWTError, jwt
+import json
 import os
+from app.auth.user_cache import user_cache
+from app.database import get_database
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
-MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
 ALGORITHM = "HS256"
 
-client = AsyncIOMotorClient(MONGO_URL)
-db = client["ems"]
-users_collection = db["users"]
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
 class UserOut(BaseModel):
     id: str
@@ -25,11 +27,11 @@ class UserUpdate(BaseModel):
     email: Optional[EmailStr] = None
     roles: Optional[List[str]] = None
 
+async def get_user_by_username(db, username: str):
+    return await db["users"].find_one({"username": username})
+
 # Dependency to get current user from JWT
-async def get_current_user(token: str = Depends(lambda: None)):
-    from fastapi.security import OAuth2PasswordBearer
-    oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
-    token = token or (await oauth2_scheme())
+async def get_current_user(token: str = Depends(oauth2_scheme), db=Depends(get_database)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -43,7 +45,7 @@ async def get_current_user(token: str = Depends(lambda: None)):
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = await users_collection.find_one({"username": username})
+    user = await user_cache.get_or_load(username, lambda name: get_user_by_username(db, name))
     if user is None:
         raise credentials_exception
     user["roles"] = roles
@@ -56,23 +58,11 @@ def require_roles(required_roles: List[str]):
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient permissions")
     return role_checker
 
-@router.get("/", response_model=List[UserOut], dependencies=[Depends(require_roles(["admin"]))])
-async def list_users():
-    users = []
-    async for user in users_collection.find():
-        users.append({
-            "id": str(user["_id"]),
-            "username": user["username"],
-            "email": user["email"],
-            "roles": user.get("roles", [])
-        })
-    return users
+# Only the fields UserOut needs ever leave the database
+USER_LIST_PROJECTION = {"username": 1, "email": 1, "roles": 1}
+USER_LIST_BATCH_SIZE = int(os.getenv("USER_LIST_BATCH_SIZE", "500"))
 
-@router.get("/{id}", response_model=UserOut)
-async def get_user(id: str, current_user: dict = Depends(get_current_user)):
-    user = await users_collection.find_one({"_id": id})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+def user_out(user: dict) -> dict:
     return {
         "id": str(user["_id"]),
         "username": user["username"],
@@ -80,25 +70,56 @@ async def get_user(id: str, current_user: dict = Depends(get_current_user)):
         "roles": user.get("roles", [])
     }
 
+def parse_cursor(after: str):
+    # _id values are ObjectIds for registered users, but tolerate string ids
+    return ObjectId(after) if ObjectId.is_valid(after) else after
+
+@router.get("/", response_model=List[UserOut], dependencies=[Depends(require_roles(["admin"]))])
+async def list_users(
+    response: Response,
+    after: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    stream: bool = False,
+    db=Depends(get_database)
+):
+    # Keyset pagination on _id: pass the X-Next-Cursor header back as `after`
+    query = {"_id": {"$gt": parse_cursor(after)}} if after else {}
+    cursor = db["users"].find(query, USER_LIST_PROJECTION).sort("_id", 1)
+    if stream:
+        # NDJSON of every user from `after` onwards, emitted as batches arrive
+        cursor = cursor.batch_size(USER_LIST_BATCH_SIZE)
+        async def generate():
+            async for user in cursor:
+                yield json.dumps(user_out(user)) + "\n"
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+    users = [user_out(user) async for user in cursor.limit(limit).batch_size(limit)]
+    if len(users) == limit:
+        response.headers["X-Next-Cursor"] = users[-1]["id"]
+    return users
+
+@router.get("/{id}", response_model=UserOut)
+async def get_user(id: str, current_user: dict = Depends(get_current_user), db=Depends(get_database)):
+    user = await db["users"].find_one({"_id": id})
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user_out(user)
+
 @router.put("/{id}", response_model=UserOut)
-async def update_user(id: str, update: UserUpdate, current_user: dict = Depends(get_current_user)):
+async def update_user(id: str, update: UserUpdate, current_user: dict = Depends(get_current_user), db=Depends(get_database)):
     update_data = {k: v for k, v in update.dict().items() if v is not None}
     if not update_data:
         raise HTTPException(status_code=400, detail="No data to update")
-    result = await users_collection.update_one({"_id": id}, {"$set": update_data})
+    result = await db["users"].update_one({"_id": id}, {"$set": update_data})
+    await user_cache.invalidate_id(id)
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
-    user = await users_collection.find_one({"_id": id})
-    return {
-        "id": str(user["_id"]),
-        "username": user["username"],
-        "email": user["email"],
-        "roles": user.get("roles", [])
-    }
+    user = await db["users"].find_one({"_id": id})
+    return user_out(user)
 
 @router.delete("/{id}", status_code=204, dependencies=[Depends(require_roles(["admin"]))])
-async def delete_user(id: str):
-    result = await users_collection.delete_one({"_id": id})
+async def delete_user(id: str, db=Depends(get_database)):
+    result = await db["users"].delete_one({"_id": id})
+    await user_cache.invalidate_id(id)
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     return None
\ No newline at end of file
@@ -0,0 +1,78 @@
+"""Importing employees and tasks: bulk endpoints against one request per item.
+
+Posts `--rows` employees and then `--rows` tasks through POST /employees/bulk
+and POST /tasks/bulk (as a JSON array, or NDJSON with --ndjson), and times
+`--sample` of the same items through POST /employees and POST /tasks for a
+per-item rate. Requests go in-process through httpx's ASGI transport against
+the configured backend. Usage:
+
+    python -m benchmarks.bulk_import --rows 100000
+    EMS_REPOSITORY_BACKEND=sqlite python -m benchmarks.bulk_import --ndjson
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+
+def build_app():
+    import main
+    from app.tasks import routes as tasks
+
+    async def admin():
+        return "admin"
+
+    main.app.dependency_overrides[tasks.get_current_user_role] = admin
+    return main.app
+
+
+async def bulk(client, url, items, ndjson):
+    started = time.perf_counter()
+    if ndjson:
+        body = "\n".join(json.dumps(item) for item in items).encode()
+        response = await client.post(url, content=body, headers={"content-type": "application/x-ndjson"})
+    else:
+        response = await client.post(url, json=items)
+    response.raise_for_status()
+    elapsed = time.perf_counter() - started
+    errors = response.json().get("error", 0)
+    if errors:
+        raise RuntimeError(f"{url}: {errors} items failed")
+    return elapsed
+
+
+async def one_by_one(client, url, items):
+    started = time.perf_counter()
+    for item in items:
+        (await client.post(url, json=item)).raise_for_status()
+    return (time.perf_counter() - started) / len(items)
+
+
+async def run(args):
+    app = build_app()
+    rows = args.rows
+    employees = [{"id": i, "name": f"Employee {i}", "department": f"Dept {i % 20}"} for i in range(1, rows + 1)]
+    tasks = [{"title": f"Onboarding {i}", "assigned_to": 1 + i % rows, "due_date": "2024-07-01"} for i in range(rows)]
+    sample_employees = [{**e, "id": rows + e["id"]} for e in employees[:args.sample]]
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+        print(f"{rows} employees and {rows} tasks, {'NDJSON' if args.ndjson else 'JSON array'}")
+        for url, items, single, sample in (("/employees", employees, "/employees", sample_employees),
+                                           ("/tasks", tasks, "/tasks", tasks[:args.sample])):
+            elapsed = await bulk(client, url + "/bulk", items, args.ndjson)
+            per_item = await one_by_one(client, single, sample)
+            print(f"  POST {url + '/bulk':16s} {elapsed:8.2f} s  ({rows / elapsed:9.0f} items/s)   "
+                  f"POST {single} one by one: {per_item * 1e3:6.2f} ms/item, ~{per_item * rows:8.1f} s for {rows}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--sample", type=int, default=500, help="items posted one by one for comparison")
+    parser.add_argument("--ndjson", action="store_true")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
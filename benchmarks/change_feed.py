@@ -0,0 +1,93 @@
+"""Keeping a client copy of employees, tasks and leaves up to date.
+
+Populates the configured backend with benchmarks.datagen. Each round makes
+`--changes` random task and leave updates. A client then catches up in one
+of two ways:
+- re-fetching the three full lists, as the frontend does today;
+- reading GET /changes since its last cursor.
+
+Both are timed and their bytes counted. Requests go in-process through
+httpx's ASGI transport. Usage:
+
+    python -m benchmarks.change_feed --scale small --changes 50
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+
+from benchmarks import datagen
+from benchmarks.load import build_app
+
+LISTS = ("/employees?page_size=1000000", "/tasks", "/leave")
+
+
+async def timed(client, urls):
+    started = time.perf_counter()
+    size = 0
+    for url in urls:
+        response = await client.get(url)
+        response.raise_for_status()
+        size += len(response.content)
+    return time.perf_counter() - started, size
+
+
+async def run(args):
+    config = datagen.config_from_args(args)
+    print(f"populating scale {args.scale}: {config}")
+    await datagen.populate(config, args.seed, args.end, verbose=False)
+    from app.changes import routes as changes
+    from app.leave.routes import leave_repo
+    from app.tasks.routes import task_repo
+
+    app = build_app("admin")
+
+    async def admin():
+        return "admin"
+
+    app.dependency_overrides[changes.get_current_user_role] = admin
+    rng = random.Random(args.seed)
+    task_ids = [t.id for t in await task_repo.list()]
+    leave_ids = [l.id for l in await leave_repo.list()]
+    totals = {"full": [0.0, 0], "delta": [0.0, 0]}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        cursor = (await client.get("/changes")).json()["cursor"]
+        for _ in range(args.rounds):
+            for _ in range(args.changes):
+                if rng.random() < 0.5:
+                    await client.put(f"/tasks/{rng.choice(task_ids)}", json={"status": rng.choice(datagen.TASK_STATUSES)})
+                else:
+                    await client.put(f"/leave/{rng.choice(leave_ids)}", json={"reason": rng.choice(datagen.WORDS)})
+            seconds, size = await timed(client, LISTS)
+            totals["full"][0] += seconds
+            totals["full"][1] += size
+            started = time.perf_counter()
+            size = 0
+            more = True
+            while more:
+                response = await client.get(f"/changes?since={cursor}&stores=employees,tasks,leave")
+                body = response.json()
+                cursor, more = body["cursor"], body["more"]
+                size += len(response.content)
+            totals["delta"][0] += time.perf_counter() - started
+            totals["delta"][1] += size
+    full_s, full_b = totals["full"]
+    delta_s, delta_b = totals["delta"]
+    print(f"{args.rounds} rounds of {args.changes} changes")
+    print(f"  re-fetch lists  {full_s / args.rounds * 1000:9.1f} ms  {full_b / args.rounds / 1024:10.1f} KiB per round")
+    print(f"  /changes        {delta_s / args.rounds * 1000:9.1f} ms  {delta_b / args.rounds / 1024:10.1f} KiB per round"
+          f"  ({full_b / max(delta_b, 1):.0f}x fewer bytes, {full_s / max(delta_s, 1e-9):.0f}x faster)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    datagen.add_arguments(parser)
+    parser.add_argument("--changes", type=int, default=50, help="writes between two syncs")
+    parser.add_argument("--rounds", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Cold start time: fresh interpreters importing main, and uvicorn to first response.
+
+Each run starts a new process, so nothing is cached in memory (the OS file
+cache stays warm). MongoDB is pointed at a closed port to check that an
+unreachable database does not delay or break startup. Exits non-zero when the
+median time to first response is over `--budget-ms`. Usage:
+
+    python -m benchmarks.cold_start --runs 10 --budget-ms 1500
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_SCRIPT = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def env():
+    return dict(os.environ, MONGO_URL="mongodb://127.0.0.1:9", MONGO_SERVER_SELECTION_TIMEOUT_MS="2000")
+
+
+def time_import():
+    started = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], cwd=ROOT, env=env(),
+                         capture_output=True, text=True, check=True).stdout
+    return time.perf_counter() - started, float(out.strip().splitlines()[-1])
+
+
+def time_first_response():
+    port = free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = started + 60
+        while time.perf_counter() < deadline:
+            # A bare connect is cheap; polling with full requests would steal CPU from the server
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            except OSError:
+                time.sleep(0.01)
+                continue
+            if httpx.get(f"http://127.0.0.1:{port}/employees?page_size=1").status_code == 200:
+                return time.perf_counter() - started
+        raise RuntimeError("server did not answer within 60 s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=1500, help="median process start to first response")
+    args = parser.parse_args()
+
+    imports = [time_import() for _ in range(args.runs)]
+    process = statistics.median(p for p, _ in imports) * 1000
+    module = statistics.median(i for _, i in imports) * 1000
+    print(f"python -c 'import main'   {process:8.0f} ms process  {module:8.0f} ms importing main")
+    first = statistics.median(time_first_response() for _ in range(args.runs)) * 1000
+    verdict = "within" if first <= args.budget_ms else "OVER"
+    print(f"uvicorn to first response {first:8.0f} ms  ({verdict} the {args.budget_ms:.0f} ms budget, Mongo unreachable)")
+    sys.exit(0 if first <= args.budget_ms else 1)
+
+
+if __name__ == "__main__":
+    main()
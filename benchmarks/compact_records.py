@@ -0,0 +1,152 @@
+"""Memory per record of the compact attendance, payroll and notification stores.
+
+Loads the same datagen rows into an InMemoryRepository of pydantic models and
+into a CompactRepository (payroll and attendance), and into a list of dicts
+and a NotificationStore (notifications), measuring with tracemalloc what each
+holds per record, with and without the stores' indexes, and where the compact
+store's bytes go. Then times reads, which now build models, on both and checks
+they return the same records, and rewrites every record twice with new values
+to check the shared values do not grow without bound. Usage:
+
+    python -m benchmarks.compact_records --employees 2000 --days 365
+"""
+import argparse
+import asyncio
+import gc
+import random
+import sys
+import time
+import tracemalloc
+from datetime import date
+
+from app.attendance.routes import Attendance
+from app.notifications.logic import NotificationStore
+from app.payroll.routes import Payroll
+from app.repository import CompactRepository, InMemoryRepository
+from benchmarks import datagen
+
+STORES = {
+    # name -> (model, indexes, shared fields)
+    "attendance": (Attendance, ("employee_id", "date", "status", ("employee_id", "date", "status"), ("date", "status")),
+                   ("employee_id", "date", "status")),
+    "payroll": (Payroll, ("employee_id", "period", ("employee_id", "period")),
+                ("employee_id", "period", "base_salary", "bonus", "deductions", "net_pay", "status")),
+}
+
+
+def rows_for(store, config, seed, end):
+    employee_ids = list(range(1, config["employees"] + 1))
+    if store == "attendance":
+        return [row for batch in datagen.attendance_batches(config, seed, employee_ids, end) for row in batch]
+    if store == "payroll":
+        return datagen.payroll_rows(config, seed, employee_ids, end)
+    return datagen.notification_rows(config, seed, employee_ids, end)
+
+
+async def fill(make, rows):
+    # Returns the store and the bytes it holds per row
+    gc.collect()
+    tracemalloc.start()
+    store = make()
+    if isinstance(store, InMemoryRepository):
+        for i in range(0, len(rows), datagen.BATCH):
+            await store.bulk_insert(rows[i:i + datagen.BATCH])
+    else:
+        for row in rows:
+            # A message string of its own per notification, as create_notification makes
+            row = {**row, "message": (row["message"] + ".")[:-1]}
+            if isinstance(store, list):
+                row["id"] = len(store) + 1
+            store.append(row)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return store, size / len(rows)
+
+
+def breakdown(store: CompactRepository) -> dict:
+    # Bytes per row of each part of a compact store, from sys.getsizeof
+    n = len(store._records)
+    rows = sum(sys.getsizeof(row) for row in store._records.values())
+    ids = sum(sys.getsizeof(id) for id in store._records if id > 256)
+    indexes = sum(sys.getsizeof(index) + sum(sys.getsizeof(ids) for ids in index.values())
+                  for index in store._index.values())
+    shared = sum(sys.getsizeof(table) for table in store._shared.values())
+    parts = {"rows": rows, "dict": sys.getsizeof(store._records), "ids": ids, "indexes": indexes, "shared": shared}
+    return {part: size / n for part, size in parts.items()}
+
+
+async def churn(store: CompactRepository, field: str) -> int:
+    # Two rounds of new values for every record; returns the distinct values kept
+    ids = list(store._records)
+    for round in (1, 2):
+        for i in range(0, len(ids), datagen.BATCH):
+            await store.bulk_update({id: {field: round * 1_000_000 + id} for id in ids[i:i + datagen.BATCH]})
+    return len(store._shared[field])
+
+
+async def timed(call, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = call()
+        if asyncio.iscoroutine(result):
+            result = await result
+    return result, (time.perf_counter() - started) / repeat
+
+
+async def run(args):
+    config = datagen.scale_config("medium", employees=args.employees, days=args.days, notifications=args.notifications)
+    end = args.end or date.today()
+    rng = random.Random(args.seed)
+    for name, (model, indexes, shared) in STORES.items():
+        rows = rows_for(name, config, args.seed, end)
+        print(f"{name}: {len(rows)} rows")
+        for label, index in (("no indexes", ()), ("indexed", indexes)):
+            plain, before = await fill(lambda: InMemoryRepository(name, model, index), rows)
+            compact, after = await fill(lambda: CompactRepository(name, model, index, shared), rows)
+            print(f"  {label:12s} models {before:7.0f} B/row   compact rows {after:7.0f} B/row   x{before / after:5.1f}")
+        print("  compact, indexed: " + ", ".join(f"{part} {size:.0f}" for part, size in breakdown(compact).items()) + " B/row")
+        employee = rng.randrange(1, config["employees"] + 1)
+        for label, call in (
+            ("get by id", lambda repo: lambda: repo.get(rng.randrange(1, len(rows) + 1))),
+            ("list one employee", lambda repo: lambda: repo.list({"employee_id": employee})),
+            ("list page of 100", lambda repo: lambda: repo.list(sort="-id", limit=100)),
+            ("count by employee", lambda repo: lambda: repo.group_count({}, by=["employee_id"])),
+        ):
+            state = rng.getstate()
+            expected, slow = await timed(call(plain), args.repeat)
+            rng.setstate(state)
+            result, fast = await timed(call(compact), args.repeat)
+            assert expected == result, f"{name} {label}: results differ"
+            print(f"  {label:20s} models {slow * 1e3:9.3f} ms   compact {fast * 1e3:9.3f} ms")
+        field = "employee_id" if name == "attendance" else "net_pay"
+        kept = await churn(compact, field)
+        print(f"  after rewriting every {field} twice: {kept} distinct values kept for {len(rows)} rows,"
+              f" {compact.shared_rebuilds} rebuilds")
+        del plain, compact
+
+    rows = rows_for("notifications", config, args.seed, end)
+    print(f"notifications: {len(rows)} rows")
+    dicts, before = await fill(list, rows)
+    store, after = await fill(NotificationStore, rows)
+    print(f"  {'':12s} dicts  {before:7.0f} B/row   arrays       {after:7.0f} B/row   x{before / after:5.1f}")
+    user = rng.randrange(1, config["employees"] + 1)
+    expected, slow = await timed(lambda: [n for n in dicts if n["user_id"] == user], args.repeat)
+    result, fast = await timed(lambda: store.for_user(user), args.repeat)
+    assert expected == result, "notifications: results differ"
+    print(f"  {'for one user':20s} dicts  {slow * 1e3:9.3f} ms   arrays  {fast * 1e3:9.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--employees", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--notifications", type=int, default=50, help="per employee")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--end", type=date.fromisoformat, default=None)
+    parser.add_argument("--repeat", type=int, default=20)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
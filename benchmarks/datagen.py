@@ -0,0 +1,272 @@
+"""Deterministic synthetic data for the benchmarks.
+
+Populates departments, employees, attendance (one row per employee per
+weekday, so millions of rows at the larger scales), leaves, tasks, payroll,
+documents and notifications through the app's own repositories, i.e. into
+whichever backend EMS_REPOSITORY_BACKEND selects. The same seed, scale and end
+date always produce the same rows. Usage:
+
+    python -m benchmarks.datagen --scale medium
+    python -m benchmarks.datagen --scale small --employees 500 --days 730
+
+Populating the memory backend from the command line only makes sense with
+EMS_DATA_DIR set, so the data is snapshotted on exit.
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import date, datetime, timedelta
+
+# attendance rows ~= employees * days * 5 / 7
+SCALES = {
+    "small": dict(departments=5, employees=200, days=90, leaves=2, tasks=3, documents=1, notifications=5),
+    "medium": dict(departments=20, employees=2000, days=365, leaves=4, tasks=8, documents=2, notifications=10),
+    "large": dict(departments=50, employees=10000, days=730, leaves=6, tasks=10, documents=3, notifications=20),
+}
+
+BATCH = 10000
+STATUSES = ["present"] * 16 + ["late"] * 3 + ["absent"]
+WORDS = [
+    "reliable", "proactive", "mentor", "deadline", "quality", "customer", "initiative", "communication",
+    "leadership", "overtime", "training", "onboarding", "review", "escalation", "innovation", "teamwork",
+]
+LEAVE_TYPES = ["annual", "sick", "unpaid", "parental"]
+TASK_STATUSES = ["pending", "in_progress", "completed", "completed", "overdue"]
+CATEGORIES = ["ID", "Contract", "Certificate", "Other"]
+ACCESS_LEVELS = ["employee", "manager", "admin"]
+
+
+def scale_config(scale: str, **overrides) -> dict:
+    config = dict(SCALES[scale])
+    config.update({k: v for k, v in overrides.items() if v is not None})
+    return config
+
+
+def _rng(seed, store):
+    # One stream per store: changing one store's size leaves the others unchanged
+    return random.Random(f"{seed}:{store}")
+
+
+def department_rows(config, seed):
+    return [{"name": f"Dept {i}", "description": f"Department {i}"} for i in range(config["departments"])]
+
+
+def employee_rows(config, seed, departments):
+    rng = _rng(seed, "employees")
+    rows = []
+    for n in range(1, config["employees"] + 1):
+        dept = rng.choice(departments)
+        rows.append({
+            "name": f"Employee {n}",
+            "department_id": dept.id,
+            "department": dept.name,
+            "performance_scores": [round(rng.uniform(2, 5), 1) for _ in range(rng.randrange(4))],
+            "performance_notes": [" ".join(rng.sample(WORDS, 3)) for _ in range(rng.randrange(3))],
+        })
+    return rows
+
+
+def attendance_batches(config, seed, employee_ids, end: date):
+    rng = _rng(seed, "attendance")
+    batch = []
+    for offset in range(config["days"] - 1, -1, -1):
+        day = end - timedelta(days=offset)
+        if day.weekday() >= 5:
+            continue
+        iso = day.isoformat()
+        for employee_id in employee_ids:
+            batch.append({"employee_id": employee_id, "date": iso, "status": rng.choice(STATUSES), "notes": None})
+            if len(batch) >= BATCH:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def leave_rows(config, seed, employee_ids, end: date):
+    rng = _rng(seed, "leaves")
+    rows = []
+    for employee_id in employee_ids:
+        for _ in range(config["leaves"]):
+            start = end - timedelta(days=rng.randrange(config["days"]))
+            rows.append({
+                "employee_id": employee_id,
+                "start_date": start.isoformat(),
+                "end_date": (start + timedelta(days=rng.randrange(1, 10))).isoformat(),
+                "type": rng.choice(LEAVE_TYPES),
+                "reason": None,
+                "status": rng.choice(["pending", "approved", "approved", "rejected"]),
+            })
+    return rows
+
+
+def task_rows(config, seed, employee_ids, end: date):
+    rng = _rng(seed, "tasks")
+    rows = []
+    for employee_id in employee_ids:
+        for n in range(config["tasks"]):
+            status = rng.choice(TASK_STATUSES)
+            rows.append({
+                "title": f"Task {employee_id}-{n}",
+                "description": " ".join(rng.sample(WORDS, 4)),
+                "assigned_to": employee_id,
+                "due_date": (end + timedelta(days=rng.randrange(-60, 60))).isoformat(),
+                "status": status,
+                "performance_score": round(rng.uniform(1, 5), 1) if status == "completed" else None,
+            })
+    return rows
+
+
+def payroll_rows(config, seed, employee_ids, end: date):
+    rng = _rng(seed, "payroll")
+    periods = sorted({(end - timedelta(days=d)).isoformat()[:7] for d in range(config["days"])})
+    rows = []
+    for employee_id in employee_ids:
+        base = rng.randrange(2000, 9000, 50)
+        for period in periods:
+            bonus = rng.choice([0.0, 0.0, 0.0, 100.0, 250.0])
+            deductions = round(base * 0.2, 2)
+            rows.append({
+                "employee_id": employee_id, "period": period, "base_salary": float(base), "bonus": bonus,
+                "deductions": deductions, "net_pay": base + bonus - deductions, "status": "paid",
+            })
+    return rows
+
+
+def document_rows(config, seed, employee_ids, end: date):
+    rng = _rng(seed, "documents")
+    rows = []
+    for employee_id in employee_ids:
+        for n in range(config["documents"]):
+            category = rng.choice(CATEGORIES)
+            # Expiry spread over two years either side of the end date; some never expire
+            expiry = None if category == "Other" else (end + timedelta(days=rng.randrange(-730, 730))).isoformat()
+            rows.append({
+                "employee_id": employee_id, "category": category, "access_level": rng.choice(ACCESS_LEVELS),
+                "expiry_date": expiry, "notes": None, "filename": f"{employee_id}-{n}.pdf",
+                "content_type": "application/pdf", "uploaded_at": f"{end.isoformat()}T09:00:00",
+                "path": f"/tmp/ems_documents/bench-{employee_id}-{n}.pdf",
+            })
+    return rows
+
+
+def notification_rows(config, seed, employee_ids, end: date):
+    rng = _rng(seed, "notifications")
+    types = ["task_assigned", "leave_approved", "payroll_paid", "attendance_marked", "info"]
+    rows = []
+    for employee_id in employee_ids:
+        for _ in range(config["notifications"]):
+            kind = rng.choice(types)
+            rows.append({
+                "user_id": employee_id,
+                "message": f"Synthetic {kind} notification",
+                "type": kind,
+                "timestamp": datetime.combine(end, datetime.min.time()).isoformat(),
+                "related_task": None, "related_leave": None, "related_attendance": None,
+            })
+    # Interleaved, as they would be when created over time
+    rng.shuffle(rows)
+    return rows
+
+
+async def _insert(repo, rows):
+    for i in range(0, len(rows), BATCH):
+        await repo.bulk_insert(rows[i:i + BATCH])
+    return len(rows)
+
+
+async def populate(config: dict, seed: int = 1, end: date = None, verbose: bool = True) -> dict:
+    """Insert a dataset into the app's repositories; returns row counts per store."""
+    from app.attendance.routes import attendance_repo
+    from app.documents.routes import document_repo, load_expiry_index
+    from app.employee.routes import employee_repo
+    from app.leave.routes import leave_repo
+    from app.notifications.logic import notification_db
+    from app.payroll.routes import payroll_repo
+    from app.settings.routes import department_repo
+    from app.tasks.routes import task_repo
+
+    end = end or date.today()
+    counts = {}
+
+    async def step(name, fn):
+        started = time.perf_counter()
+        counts[name] = await fn()
+        if verbose:
+            print(f"  {name:14s} {counts[name]:10d} rows {time.perf_counter() - started:8.2f} s")
+
+    departments = await department_repo.bulk_insert(department_rows(config, seed))
+    counts["departments"] = len(departments)
+    employees = await employee_repo.bulk_insert(employee_rows(config, seed, departments))
+    counts["employees"] = len(employees)
+    employee_ids = [e.id for e in employees]
+
+    async def attendance():
+        n = 0
+        for batch in attendance_batches(config, seed, employee_ids, end):
+            await attendance_repo.bulk_insert(batch)
+            n += len(batch)
+        return n
+
+    async def notifications():
+        rows = notification_rows(config, seed, employee_ids, end)
+        for row in rows:
+            notification_db.append({"id": len(notification_db) + 1, **row})
+        return len(rows)
+
+    async def documents():
+        n = await _insert(document_repo, document_rows(config, seed, employee_ids, end))
+        await load_expiry_index()
+        return n
+
+    await step("attendance", attendance)
+    await step("leaves", lambda: _insert(leave_repo, leave_rows(config, seed, employee_ids, end)))
+    await step("tasks", lambda: _insert(task_repo, task_rows(config, seed, employee_ids, end)))
+    await step("payroll", lambda: _insert(payroll_repo, payroll_rows(config, seed, employee_ids, end)))
+    await step("documents", documents)
+    await step("notifications", notifications)
+    return counts
+
+
+def add_arguments(parser):
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--end", type=date.fromisoformat, default=None, help="last attendance day (default today)")
+    for name in SCALES["small"]:
+        parser.add_argument(f"--{name}", type=int, default=None, help=f"override the scale's {name}")
+
+
+def config_from_args(args) -> dict:
+    return scale_config(args.scale, **{name: getattr(args, name) for name in SCALES["small"]})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    from app.database import Database
+    from app.persistence import persistence
+    from app.repository import REPOSITORY_BACKEND, ensure_repository_indexes
+
+    async def run():
+        if REPOSITORY_BACKEND == "mongo":
+            await Database.connect_db()
+        await ensure_repository_indexes()
+        if persistence is not None:
+            persistence.start()
+        try:
+            config = config_from_args(args)
+            print(f"{REPOSITORY_BACKEND} backend, scale {args.scale}: {config}")
+            started = time.perf_counter()
+            counts = await populate(config, args.seed, args.end)
+            print(f"{sum(counts.values())} rows in {time.perf_counter() - started:.1f} s")
+        finally:
+            if persistence is not None:
+                persistence.stop()
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""In-process load test: drives the ASGI app through httpx without a server.
+
+Populates the configured backend with benchmarks.datagen, then keeps
+`--concurrency` requests in flight against a weighted mix of endpoints for
+`--duration` seconds and reports throughput and p50/p99 per endpoint. The app's
+startup hooks are not run, so no MongoDB is needed with the memory or sqlite
+backends. Usage:
+
+    python -m benchmarks.load --scale medium --duration 30 --out load.json
+    python -m benchmarks.load --scale medium --compare load-before.json
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import defaultdict
+
+import httpx
+
+from benchmarks import datagen
+from benchmarks.results import compare, load, print_table, save, summarize
+
+# name -> (weight, path factory)
+def endpoints(rng, config):
+    employee = lambda: rng.randrange(1, config["employees"] + 1)
+    department = lambda: f"Dept {rng.randrange(config['departments'])}"
+    return {
+        "GET /employees/{id}": (30, lambda: f"/employees/{employee()}"),
+        "GET /employees?department": (10, lambda: f"/employees?department={department()}&page_size=20"),
+        "GET /employees?search": (5, lambda: f"/employees?search={rng.choice(datagen.WORDS)}"),
+        "GET /attendance?employee_id": (10, lambda: f"/attendance?employee_id={employee()}"),
+        "GET /attendance/summary": (5, lambda: "/attendance/summary"),
+        "GET /attendance/summary?department": (5, lambda: f"/attendance/summary?department={department()}"),
+        "GET /attendance/trend?employee_id": (5, lambda: f"/attendance/trend?employee_id={employee()}&period=monthly"),
+        "GET /attendance/kpi/today": (5, lambda: "/attendance/kpi/today"),
+        "GET /leave": (5, lambda: "/leave"),
+        "GET /payroll?employee_id": (5, lambda: f"/payroll?employee_id={employee()}"),
+        "GET /dashboard?user_id": (15, lambda: f"/dashboard?user_id={employee()}"),
+    }
+
+
+def build_app(role):
+    import main
+    from app.attendance import routes as attendance
+    from app.dashboard import routes as dashboard
+    from app.leave import routes as leave
+    from app.payroll import routes as payroll
+    from app.reports import routes as reports
+    from app.tasks import routes as tasks
+
+    # The role dependency is still a placeholder that always says "employee"
+    async def current_role():
+        return role
+
+    for module in (attendance, dashboard, leave, payroll, reports, tasks):
+        main.app.dependency_overrides[module.get_current_user_role] = current_role
+    return main.app
+
+
+async def drive(app, mix, concurrency, duration, seed):
+    rng = random.Random(seed)
+    names = list(mix)
+    weights = [mix[n][0] for n in names]
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        stop = time.monotonic() + duration
+
+        async def worker():
+            while time.monotonic() < stop:
+                name = rng.choices(names, weights)[0]
+                started = time.perf_counter()
+                response = await client.get(mix[name][1]())
+                samples[name].append(time.perf_counter() - started)
+                if response.status_code >= 400:
+                    errors[name] += 1
+
+        started = time.monotonic()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+    results = {}
+    for name in names:
+        if samples[name]:
+            results[name] = {**summarize(samples[name], elapsed), "errors": errors[name]}
+    everything = [s for name in names for s in samples[name]]
+    results["total"] = {**summarize(everything, elapsed), "errors": sum(errors.values())}
+    return results
+
+
+async def run(args):
+    config = datagen.config_from_args(args)
+    print(f"populating scale {args.scale}: {config}")
+    await datagen.populate(config, args.seed, args.end)
+    app = build_app(args.role)
+    mix = endpoints(random.Random(args.seed), config)
+    if args.only:
+        mix = {n: e for n, e in mix.items() if any(o in n for o in args.only)}
+    if args.warmup:
+        await drive(app, mix, args.concurrency, args.warmup, args.seed + 1)
+    print(f"{args.concurrency} concurrent requests for {args.duration} s")
+    return config, await drive(app, mix, args.concurrency, args.duration, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    datagen.add_arguments(parser)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--warmup", type=float, default=2, help="seconds of load before measuring")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--role", default="admin")
+    parser.add_argument("--only", nargs="*", help="endpoints whose name contains any of these")
+    parser.add_argument("--out", help="write the results as JSON")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    config, results = asyncio.run(run(args))
+    print_table(results)
+    run_config = {**config, "seed": args.seed, "concurrency": args.concurrency, "duration": args.duration}
+    if args.out:
+        save(args.out, "load", run_config, results)
+    if args.compare:
+        before = load(args.compare)
+        compare(before, {"kind": "load", "config": run_config, "created": "now", "commit": "working tree", "results": results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Load test: /auth/health latency while a burst of concurrent logins runs.
+
+Requires a reachable MongoDB (MONGO_URL). Usage:
+
+    python -m benchmarks.login_storm --logins 200 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import uuid
+
+import httpx
+from fastapi import FastAPI
+
+from app.database import Database
+
+# Every login here comes from one user and one address; keep the throttle out of the way
+os.environ.setdefault("EMS_LOGIN_USER_BURST", "1000000")
+os.environ.setdefault("EMS_LOGIN_IP_BURST", "1000000")
+
+from app.auth.hashing import password_hasher  # noqa: E402
+from app.auth.routes import router as auth_router  # noqa: E402
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    k = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+async def probe_health(client, stop, samples):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get("/auth/health")
+        samples.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(0.005)
+
+
+async def login_worker(client, queue, username, password):
+    while True:
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        await client.post("/auth/login", data={"username": username, "password": password})
+
+
+async def run(logins, concurrency, baseline_seconds):
+    await Database.connect_db()
+    app = FastAPI()
+    app.include_router(auth_router)
+    username = f"bench-{uuid.uuid4().hex[:8]}"
+    password = "correct horse battery staple"
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post("/auth/register", json={"username": username, "email": f"{username}@example.com", "password": password})
+        try:
+            idle = []
+            stop = asyncio.Event()
+            probe = asyncio.create_task(probe_health(client, stop, idle))
+            await asyncio.sleep(baseline_seconds)
+            stop.set()
+            await probe
+
+            storm = []
+            stop = asyncio.Event()
+            probe = asyncio.create_task(probe_health(client, stop, storm))
+            queue = asyncio.Queue()
+            for _ in range(logins):
+                queue.put_nowait(None)
+            started = time.perf_counter()
+            await asyncio.gather(*(login_worker(client, queue, username, password) for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+            stop.set()
+            await probe
+        finally:
+            await Database.get_db()["users"].delete_one({"username": username})
+
+    for label, samples in (("idle", idle), ("login storm", storm)):
+        print(f"/auth/health {label:12s} n={len(samples):5d} "
+              f"p50={percentile(samples, 50):8.2f}ms p99={percentile(samples, 99):8.2f}ms "
+              f"max={max(samples, default=0):8.2f}ms mean={statistics.fmean(samples) if samples else 0:8.2f}ms")
+    print(f"logins: {logins} in {elapsed:.2f}s ({logins / elapsed:.1f}/s)")
+    print(f"hashing pool: {password_hasher.stats()}")
+    await Database.close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--baseline-seconds", type=float, default=2.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.logins, args.concurrency, args.baseline_seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Per-request cost of MetricsMiddleware on the hot path.
+
+Calls the same minimal FastAPI app in-process (no network, no client) with and
+without the middleware, so the difference is the instrumentation alone.
+Usage:
+
+    python -m benchmarks.metrics_overhead --requests 20000
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI
+
+from app.metrics import MetricsMiddleware
+
+
+def build_app(instrumented):
+    app = FastAPI()
+
+    @app.get("/employees/{employee_id}")
+    async def get_employee(employee_id: int):
+        return {"id": employee_id, "name": "Employee"}
+
+    if instrumented:
+        app.add_middleware(MetricsMiddleware, prefixes={"/employees"})
+    return app
+
+
+async def drive(app, requests):
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    def scope(n):
+        path = f"/employees/{n % 1000}"
+        return {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+            "query_string": b"", "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 1),
+            "server": ("bench", 80),
+        }
+
+    for n in range(200):
+        await app(scope(n), receive, send)
+    started = time.perf_counter()
+    for n in range(requests):
+        await app(scope(n), receive, send)
+    return (time.perf_counter() - started) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    plain, instrumented = build_app(False), build_app(True)
+    best = {"plain": float("inf"), "instrumented": float("inf")}
+    for _ in range(args.rounds):
+        # Alternate so drift (thermal, GC) affects both equally; keep the best round
+        best["plain"] = min(best["plain"], asyncio.run(drive(plain, args.requests)))
+        best["instrumented"] = min(best["instrumented"], asyncio.run(drive(instrumented, args.requests)))
+    overhead = best["instrumented"] - best["plain"]
+    print(f"without middleware {best['plain'] * 1e6:8.1f} us/request")
+    print(f"with middleware    {best['instrumented'] * 1e6:8.1f} us/request")
+    print(f"overhead           {overhead * 1e6:8.1f} us/request ({overhead / best['plain']:.1%})")
+
+
+if __name__ == "__main__":
+    main()
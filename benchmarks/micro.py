@@ -0,0 +1,88 @@
+"""Microbenchmarks of the hot request handlers, called directly (no HTTP).
+
+Populates the configured backend with benchmarks.datagen, then times each
+function repeatedly. Report handlers are timed both with the report cache
+cleared before every call (the real computation) and warm. Usage:
+
+    python -m benchmarks.micro --scale medium --repeat 50 --out micro.json
+    python -m benchmarks.results micro-before.json micro.json
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks import datagen
+from benchmarks.results import print_table, save, summarize
+
+
+def cases(rng, config):
+    from app.attendance.routes import attendance_summary, attendance_trend
+    from app.documents.routes import expiry_alerts
+    from app.employee.routes import list_employees
+    from app.notifications.logic import get_notifications_for_user
+
+    employees = config["employees"]
+    department = lambda: f"Dept {rng.randrange(config['departments'])}"
+    employee = lambda: rng.randrange(1, employees + 1)
+    # name -> (callable returning an awaitable or a value, clear the report cache first)
+    return {
+        "list_employees search (notes)": (lambda: list_employees(search=rng.choice(datagen.WORDS), page=1, page_size=10), False),
+        "list_employees search (no match)": (lambda: list_employees(search="zz-no-such-employee", page=1, page_size=10), False),
+        "list_employees department page": (lambda: list_employees(department=department(), search=None, page=2, page_size=20), False),
+        "attendance_summary all": (lambda: attendance_summary(), True),
+        "attendance_summary employee": (lambda: attendance_summary(employee_id=employee()), True),
+        "attendance_summary department": (lambda: attendance_summary(department=department()), True),
+        "attendance_summary cached": (lambda: attendance_summary(), False),
+        "attendance_trend weekly": (lambda: attendance_trend(period="weekly"), True),
+        "attendance_trend monthly department": (lambda: attendance_trend(department=department(), period="monthly"), True),
+        "attendance_trend weekly employee": (lambda: attendance_trend(employee_id=employee(), period="weekly"), True),
+        "attendance_trend cached": (lambda: attendance_trend(period="weekly"), False),
+        "expiry_alerts 30 days": (lambda: expiry_alerts(days=30), False),
+        "expiry_alerts employee": (lambda: expiry_alerts(days=365, employee_id=employee()), False),
+        "get_notifications_for_user": (lambda: get_notifications_for_user(employee()), False),
+    }
+
+
+async def run(args):
+    from app.reports.cache import report_cache
+
+    config = datagen.config_from_args(args)
+    print(f"populating scale {args.scale}: {config}")
+    await datagen.populate(config, args.seed, args.end)
+    rng = random.Random(args.seed)
+    results = {}
+    for name, (call, cold) in cases(rng, config).items():
+        if args.only and not any(o in name for o in args.only):
+            continue
+        samples = []
+        for i in range(args.warmup + args.repeat):
+            if cold:
+                report_cache.clear()
+            started = time.perf_counter()
+            result = call()
+            if asyncio.iscoroutine(result):
+                await result
+            if i >= args.warmup:
+                samples.append(time.perf_counter() - started)
+        results[name] = summarize(samples)
+    return config, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    datagen.add_arguments(parser)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--only", nargs="*", help="run benchmarks whose name contains any of these")
+    parser.add_argument("--out", help="write the results as JSON")
+    args = parser.parse_args()
+
+    config, results = asyncio.run(run(args))
+    print_table(results)
+    if args.out:
+        save(args.out, "micro", {**config, "seed": args.seed, "repeat": args.repeat}, results)
+
+
+if __name__ == "__main__":
+    main()
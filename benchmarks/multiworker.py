@@ -0,0 +1,150 @@
+"""Requests per second against `uvicorn --workers N` on the shared SQLite store.
+
+Seeds a SQLite file, then for each worker count starts uvicorn on it and drives
+GET /employees/{id} and GET /employees?department=... from several client
+processes. Before measuring, it writes through one request and checks every
+following read sees the write, whichever worker serves it. Usage:
+
+    python -m benchmarks.multiworker --workers 1 2 4 8 --duration 10
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEPARTMENTS = [f"Dept {i}" for i in range(20)]
+
+if os.getenv("EMS_MULTIWORKER_BENCH"):
+    # Loaded by each uvicorn worker: the employee routes only need the
+    # repository, so skip the MongoDB connection the full app waits for.
+    import main
+    main.app.router.on_startup.remove(main.startup_db_client)
+    app = main.app
+
+
+def seed(path, employees):
+    os.environ["EMS_SQLITE_PATH"] = path
+    from app.employee.routes import Employee
+    from app.repository import SQLiteRepository
+
+    async def run():
+        repo = SQLiteRepository("employees", Employee, indexes=("department", "department_id"), path=path)
+        rng = random.Random(3)
+        rows = []
+        for n in range(1, employees + 1):
+            dept = rng.randrange(len(DEPARTMENTS))
+            rows.append({"name": f"Employee {n}", "department_id": dept, "department": DEPARTMENTS[dept]})
+        await repo.bulk_insert(rows)
+    asyncio.run(run())
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(path, workers, port):
+    env = dict(os.environ, EMS_REPOSITORY_BACKEND="sqlite", EMS_SQLITE_PATH=path, EMS_MULTIWORKER_BENCH="1")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.multiworker:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=ROOT, env=env,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/employees/1").status_code == 200:
+                # Give the remaining workers a moment to finish importing
+                time.sleep(1 + workers * 0.5)
+                return proc
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("server did not start")
+
+
+def check_consistency(base, employees, reads):
+    id = employees + 1
+    created = httpx.post(f"{base}/employees", json={"id": id, "name": "Consistency probe"})
+    created.raise_for_status()
+    with httpx.Client() as client:
+        for _ in range(reads):
+            if client.get(f"{base}/employees/{id}", headers={"Connection": "close"}).status_code != 200:
+                return False
+    httpx.delete(f"{base}/employees/{id}").raise_for_status()
+    return True
+
+
+def client_process(base, employees, concurrency, duration, results):
+    async def run():
+        rng = random.Random(os.getpid())
+        done = 0
+        errors = 0
+        stop = time.monotonic() + duration
+        async with httpx.AsyncClient(base_url=base, limits=httpx.Limits(max_connections=concurrency)) as client:
+            async def worker():
+                nonlocal done, errors
+                while time.monotonic() < stop:
+                    if rng.random() < 0.8:
+                        url = f"/employees/{rng.randrange(1, employees + 1)}"
+                    else:
+                        url = f"/employees?department={rng.choice(DEPARTMENTS)}&page_size=20"
+                    response = await client.get(url)
+                    done += 1
+                    errors += response.status_code != 200
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        results.put((done, errors))
+    asyncio.run(run())
+
+
+def measure(base, employees, clients, concurrency, duration):
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=client_process, args=(base, employees, concurrency, duration, results))
+             for _ in range(clients)]
+    for p in procs:
+        p.start()
+    totals = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return sum(d for d, _ in totals) / duration, sum(e for _, e in totals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--employees", type=int, default=10000)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--clients", type=int, default=max(2, (os.cpu_count() or 2) // 2), help="load generator processes")
+    parser.add_argument("--concurrency", type=int, default=32, help="in-flight requests per client process")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="ems-sqlite-") as tmp:
+        path = os.path.join(tmp, "ems.sqlite3")
+        seed(path, args.employees)
+        print(f"{args.employees} employees, {args.clients} client processes x {args.concurrency}, {os.cpu_count()} CPUs")
+        for workers in args.workers:
+            port = free_port()
+            proc = start_server(path, workers, port)
+            try:
+                base = f"http://127.0.0.1:{port}"
+                consistent = check_consistency(base, args.employees, reads=workers * 20)
+                rps, errors = measure(base, args.employees, args.clients, args.concurrency, args.duration)
+                print(f"workers={workers:<2} {rps:10.0f} req/s  errors={errors}  read-your-writes={'ok' if consistent else 'FAILED'}")
+            finally:
+                proc.terminate()
+                proc.wait()
+
+
+if __name__ == "__main__":
+    main()
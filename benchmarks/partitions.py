@@ -0,0 +1,116 @@
+"""Resident memory and historical query latency with month-partitioned attendance.
+
+Generates --days of attendance for --employees (benchmarks.datagen) into a
+plain InMemoryRepository and into a PartitionedRepository, measuring the
+memory each holds afterwards with tracemalloc, then times the attendance
+queries that reach into history (all-time summary, monthly trend, a past
+quarter's export, lookups by id) on both and checks they agree. Usage:
+
+    python -m benchmarks.partitions --employees 2000 --days 730
+    EMS_PARTITION_HOT_MONTHS=1 python -m benchmarks.partitions
+"""
+import argparse
+import asyncio
+import gc
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from app.attendance.routes import Attendance
+from app.partitions import PartitionedRepository
+from app.repository import InMemoryRepository
+from benchmarks import datagen
+
+INDEXES = ("employee_id", "date", "status", ("employee_id", "date", "status"), ("date", "status"))
+SHARED = ("employee_id", "date", "status")
+
+
+def queries(config, end, rng):
+    quarter = end - timedelta(days=365)
+    return {
+        "summary (all time)": lambda repo: repo.group_count({}, by=["status"]),
+        "trend monthly, one employee": lambda repo: repo.group_count(
+            {"employee_id": rng.randrange(1, config["employees"] + 1)}, by=["status"], period=("date", "monthly")),
+        "export, a quarter last year": lambda repo: repo.list(
+            {"date": {"$gte": quarter.isoformat(), "$lte": (quarter + timedelta(days=90)).isoformat()}}),
+        "list, one employee this month": lambda repo: repo.list(
+            {"employee_id": rng.randrange(1, config["employees"] + 1), "date": {"$gte": end.replace(day=1).isoformat()}}),
+        "get by id (random)": lambda repo: repo.get(rng.randrange(1, 1000) * rng.randrange(1, 100)),
+    }
+
+
+async def load(repo, config, seed, end):
+    employee_ids = list(range(1, config["employees"] + 1))
+    n = 0
+    for batch in datagen.attendance_batches(config, seed, employee_ids, end):
+        await repo.bulk_insert(batch)
+        n += len(batch)
+    return n
+
+
+async def measure(name, make, config, args, end):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    repo = make()
+    rows = await load(repo, config, args.seed, end)
+    if isinstance(repo, PartitionedRepository):
+        # Whatever the background compactions have not moved yet
+        while repo.compact():
+            pass
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    resident = tracemalloc.get_traced_memory()[0]
+    print(f"{name:12s} {rows} rows loaded in {elapsed:6.2f} s, resident {resident / 2**20:8.1f} MiB")
+    tracemalloc.stop()
+    return repo
+
+
+async def run(args):
+    config = datagen.scale_config("small", employees=args.employees, days=args.days)
+    end = args.end or date.today()
+    directory = tempfile.mkdtemp(prefix="ems-partitions-")
+    try:
+        plain = await measure("in memory", lambda: InMemoryRepository("attendance", Attendance, INDEXES), config, args, end)
+        partitioned = await measure(
+            "partitioned", lambda: PartitionedRepository("attendance", Attendance, INDEXES, SHARED, "date", directory), config, args, end)
+        stats = partitioned.stats()
+        print(f"  {stats['hot_records']} rows in memory, {stats['cold_records']} in {stats['cold_partitions']} "
+              f"partitions ({stats['cold_bytes'] / 2**20:.1f} MiB on disk)")
+
+        times = {}
+        for name, repo in (("in memory", plain), ("partitioned", partitioned)):
+            # Same seed, so both repositories get the same queries
+            for label, query in queries(config, end, random.Random(args.seed)).items():
+                started = time.perf_counter()
+                for _ in range(args.repeat):
+                    await query(repo)
+                times.setdefault(label, {})[name] = (time.perf_counter() - started) / args.repeat
+        for label, by_repo in times.items():
+            print(f"  {label:32s} in memory {by_repo['in memory'] * 1000:9.2f} ms  "
+                  f"partitioned {by_repo['partitioned'] * 1000:9.2f} ms")
+
+        expected = queries(config, end, random.Random(args.seed + 1))
+        for label, query in queries(config, end, random.Random(args.seed + 1)).items():
+            assert await expected[label](plain) == await query(partitioned), label
+        print(f"same results; {partitioned.stats()['column_reads']} column reads, "
+              f"{partitioned.stats()['cached_values']} values cached")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--employees", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--end", type=date.fromisoformat, default=None)
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
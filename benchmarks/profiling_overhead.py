@@ -0,0 +1,84 @@
+"""Per-request cost of ProfilingMiddleware when no request is profiled.
+
+Like benchmarks.metrics_overhead: the same minimal FastAPI app is called
+in-process without the middleware, with it installed but not triggered, and
+with every request profiled, to show what enabling profiling costs requests
+that do not ask for it. Usage:
+
+    python -m benchmarks.profiling_overhead --requests 20000
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+
+from fastapi import FastAPI
+
+from app.profiling.profiler import ProfileStore, ProfilingMiddleware, RequestProfiler
+
+
+def build_app(profiler):
+    app = FastAPI()
+
+    @app.get("/employees/{employee_id}")
+    async def get_employee(employee_id: int):
+        return {"id": employee_id, "name": "Employee"}
+
+    if profiler is not None:
+        app.add_middleware(ProfilingMiddleware, profiler=profiler)
+    return app
+
+
+async def drive(app, requests):
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    def scope(n):
+        path = f"/employees/{n % 1000}"
+        return {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+            "query_string": b"page=1", "headers": [(b"host", b"bench"), (b"accept", b"*/*")],
+            "client": ("127.0.0.1", 1), "server": ("bench", 80),
+        }
+
+    for n in range(200):
+        await app(scope(n), receive, send)
+    started = time.perf_counter()
+    for n in range(requests):
+        await app(scope(n), receive, send)
+    return (time.perf_counter() - started) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = ProfileStore(directory, max_files=20, max_bytes=50 * 1024 * 1024)
+        apps = {
+            "without middleware": build_app(None),
+            "installed, untriggered": build_app(RequestProfiler(store, token="secret")),
+        }
+        sampled = build_app(RequestProfiler(store, sample_every=1))
+        best = dict.fromkeys(apps, float("inf"))
+        for _ in range(args.rounds):
+            # Alternate so drift (thermal, GC) affects all equally; keep the best round
+            for name, app in apps.items():
+                best[name] = min(best[name], asyncio.run(drive(app, args.requests)))
+        # Profiling every request writes a file per request; a few hundred are enough
+        every = asyncio.run(drive(sampled, min(args.requests, 300)))
+
+    plain = best["without middleware"]
+    for name, seconds in best.items():
+        print(f"{name:24s} {seconds * 1e6:8.1f} us/request  (+{(seconds - plain) * 1e6:.1f} us)")
+    print(f"{'every request profiled':24s} {every * 1e6:8.1f} us/request  (cProfile, saved to disk)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Benchmark the repository backends against the same interface.
+
+Runs the in-memory backend always, and the Mongo backend when MongoDB is
+reachable (MONGO_URL). Usage:
+
+    python -m benchmarks.repository_backends --rows 100000
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from app.attendance.routes import Attendance
+from app.database import Database, MONGO_DB_NAME
+from app.repository import BACKENDS
+
+
+async def timed(label, fn, repeat=1):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = await fn()
+    elapsed = (time.perf_counter() - started) / repeat
+    print(f"  {label:40s} {elapsed * 1000:10.2f} ms")
+    return result
+
+
+def make_rows(n, employees, seed=7):
+    rng = random.Random(seed)
+    statuses = ["present", "present", "present", "late", "absent"]
+    return [
+        {
+            "employee_id": rng.randrange(1, employees + 1),
+            "date": f"2024-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}",
+            "status": rng.choice(statuses),
+            "notes": None,
+        }
+        for _ in range(n)
+    ]
+
+
+async def bench(backend, rows, employees, batch):
+    print(f"{backend} backend, {len(rows)} rows")
+    repo = BACKENDS[backend]("bench_attendance", Attendance, indexes=("employee_id", "date", "status"))
+    if backend == "mongo":
+        await repo.collection.drop()
+        await Database.get_db()[repo.COUNTERS].delete_one({"_id": repo.name})
+        await repo.ensure_indexes()
+
+    async def insert_all():
+        for i in range(0, len(rows), batch):
+            await repo.bulk_insert(rows[i:i + batch])
+    await timed(f"bulk_insert (batches of {batch})", insert_all)
+
+    ids = [random.randrange(1, len(rows) + 1) for _ in range(200)]
+
+    async def gets():
+        for id in ids:
+            await repo.get(id)
+    await timed("200 x get", gets)
+    await timed("list employee_id == x", lambda: repo.list({"employee_id": 7}), repeat=5)
+    await timed("list employee_id in (10 ids)", lambda: repo.list({"employee_id": {"$in": list(range(1, 11))}}), repeat=5)
+    await timed("list date in one month", lambda: repo.list({"date": {"$gte": "2024-06-01", "$lte": "2024-06-30"}}), repeat=3)
+    await timed("count status == late", lambda: repo.count({"status": "late"}), repeat=3)
+
+    async def updates():
+        for id in ids:
+            await repo.update(id, {"status": "late"})
+    await timed("200 x update", updates)
+    await timed("bulk_update 200 ids", lambda: repo.bulk_update({id: {"status": "present"} for id in ids}))
+    if backend == "mongo":
+        await repo.collection.drop()
+
+
+async def run(n, employees, batch, skip_mongo):
+    rows = make_rows(n, employees)
+    await bench("memory", rows, employees, batch)
+    if skip_mongo:
+        return
+    try:
+        await Database.connect_db()
+    except Exception as e:
+        print(f"mongo backend skipped: {e}")
+        return
+    print(f"(database {MONGO_DB_NAME})")
+    try:
+        await bench("mongo", rows, employees, batch)
+    finally:
+        await Database.close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--employees", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=5000)
+    parser.add_argument("--skip-mongo", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.employees, args.batch, args.skip_mongo))
+
+
+if __name__ == "__main__":
+    main()
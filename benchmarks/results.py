@@ -0,0 +1,121 @@
+"""Benchmark result files: summarising samples, saving runs and comparing them.
+
+Both benchmarks.micro and benchmarks.load write the same JSON layout, so any
+two runs of the same kind can be compared:
+
+    python -m benchmarks.results before.json after.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+
+def percentile(sorted_samples: List[float], q: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    # Nearest rank
+    rank = max(0, min(len(sorted_samples) - 1, round(q * len(sorted_samples) + 0.5) - 1))
+    return sorted_samples[rank]
+
+
+def summarize(samples: List[float], seconds: float = None) -> dict:
+    """Latency summary in milliseconds for a list of durations in seconds."""
+    ordered = sorted(samples)
+    summary = {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 4) if ordered else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 4),
+        "p90_ms": round(percentile(ordered, 0.90) * 1000, 4),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 4),
+        "max_ms": round(ordered[-1] * 1000, 4) if ordered else 0.0,
+    }
+    if seconds:
+        summary["throughput_rps"] = round(len(ordered) / seconds, 1)
+    return summary
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def save(path: str, kind: str, config: dict, results: Dict[str, dict]):
+    run = {
+        "kind": kind,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "backend": os.getenv("EMS_REPOSITORY_BACKEND", "memory"),
+        "config": config,
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(run, f, indent=2, sort_keys=True)
+    print(f"results written to {path}")
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def print_table(results: Dict[str, dict]):
+    throughput = any("throughput_rps" in r for r in results.values())
+    print(f"{'':38s} {'count':>7s} {'p50 ms':>9s} {'p99 ms':>9s} {'mean ms':>9s}" + ("  req/s" if throughput else ""))
+    for name, r in results.items():
+        line = f"{name:38s} {r['count']:7d} {r['p50_ms']:9.3f} {r['p99_ms']:9.3f} {r['mean_ms']:9.3f}"
+        if "throughput_rps" in r:
+            line += f" {r['throughput_rps']:7.0f}"
+        if r.get("errors"):
+            line += f"  errors={r['errors']}"
+        print(line)
+
+
+def compare(before: dict, after: dict, threshold: float = 0.10) -> int:
+    """Print per-benchmark p50/p99 changes; returns how many got slower than `threshold`."""
+    if before.get("kind") != after.get("kind"):
+        print(f"warning: comparing a {before.get('kind')} run with a {after.get('kind')} run")
+    if before.get("config") != after.get("config"):
+        print("warning: the runs used different configurations")
+    regressions = 0
+    print(f"{before.get('commit')} ({before['created']}) -> {after.get('commit')} ({after['created']})")
+    print(f"{'':38s} {'p50 before':>11s} {'after':>9s} {'change':>8s} {'p99 change':>11s}")
+    for name in sorted(set(before["results"]) | set(after["results"])):
+        a, b = before["results"].get(name), after["results"].get(name)
+        if a is None or b is None:
+            print(f"{name:38s} {'only in ' + ('after' if a is None else 'before'):>31s}")
+            continue
+        p50 = b["p50_ms"] / a["p50_ms"] - 1 if a["p50_ms"] else 0.0
+        p99 = b["p99_ms"] / a["p99_ms"] - 1 if a["p99_ms"] else 0.0
+        flag = ""
+        if p50 > threshold:
+            flag = "  SLOWER"
+            regressions += 1
+        elif p50 < -threshold:
+            flag = "  faster"
+        print(f"{name:38s} {a['p50_ms']:11.3f} {b['p50_ms']:9.3f} {p50:+8.1%} {p99:+11.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=0.10, help="p50 change reported as a regression")
+    args = parser.parse_args()
+    regressions = compare(load(args.before), load(args.after), args.threshold)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Large list endpoints with and without EMS_FAST_SERIALIZATION.
+
+Seeds attendance and payroll rows into the configured backend, then requests
+GET /attendance and GET /payroll in-process (httpx ASGI transport) in both
+modes, checking the two produce the same records. Usage:
+
+    python -m benchmarks.serialization --rows 20000
+    EMS_REPOSITORY_BACKEND=sqlite python -m benchmarks.serialization
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+
+from app import serialization
+
+
+async def seed(rows, employees):
+    from app.attendance.routes import attendance_repo
+    from app.payroll.routes import payroll_repo
+
+    rng = random.Random(5)
+    attendance = [
+        {"employee_id": rng.randrange(1, employees + 1), "date": f"2024-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}",
+         "status": rng.choice(["present", "late", "absent"]), "notes": None}
+        for _ in range(rows)
+    ]
+    payroll = [
+        {"employee_id": rng.randrange(1, employees + 1), "period": f"2024-{rng.randrange(1, 13):02d}",
+         "base_salary": 4000.0, "bonus": 0.0, "deductions": 800.0, "net_pay": 3200.0, "status": "paid"}
+        for _ in range(rows)
+    ]
+    for i in range(0, rows, 10000):
+        await attendance_repo.bulk_insert(attendance[i:i + 10000])
+        await payroll_repo.bulk_insert(payroll[i:i + 10000])
+
+
+async def bench(client, url, fast, repeat):
+    serialization.FAST_SERIALIZATION = fast
+    body = None
+    started = time.perf_counter()
+    for _ in range(repeat):
+        response = await client.get(url)
+        response.raise_for_status()
+        body = response.content
+    return (time.perf_counter() - started) / repeat, body
+
+
+async def run(args):
+    import main
+    from app.payroll import routes as payroll
+
+    async def admin():
+        return "admin"
+
+    main.app.dependency_overrides[payroll.get_current_user_role] = admin
+    await seed(args.rows, args.employees)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as client:
+        print(f"{args.rows} rows per store, orjson {'available' if serialization.orjson else 'not installed'}")
+        for url in ("/attendance", "/attendance?status=late", "/payroll"):
+            slow, expected = await bench(client, url, False, args.repeat)
+            fast, body = await bench(client, url, True, args.repeat)
+            same = json.loads(expected) == json.loads(body)
+            print(f"  {url:28s} default {slow * 1000:9.1f} ms  fast {fast * 1000:9.1f} ms  "
+                  f"x{slow / fast:5.1f}  {'same records' if same else 'RESPONSES DIFFER'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--employees", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
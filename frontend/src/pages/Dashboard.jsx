@@ -1,18 +1,100 @@
-import React from "react";
+import React, { useEffect, useState } from "react";
 import Typography from "@mui/material/Typography";
 import Box from "@mui/material/Box";
+import { Alert, Grid, Paper } from "@mui/material";
+
+function Section({ title, children }) {
+  return (
+    <Grid item xs={12} md={6}>
+      <Paper sx={{ p: 2, height: "100%" }}>
+        <Typography variant="h6" gutterBottom>
+          {title}
+        </Typography>
+        {children}
+      </Paper>
+    </Grid>
+  );
+}
 
 function Dashboard() {
+  const [data, setData] = useState(null);
+  const [error, setError] = useState("");
+
+  useEffect(() => {
+    // One request for every panel; the server assembles and caches the payload
+    // (all but the notifications, which it picks by the token's user)
+    const token = localStorage.getItem("access_token") || sessionStorage.getItem("access_token");
+    fetch("/dashboard", { headers: token ? { Authorization: `Bearer ${token}` } : {} })
+      .then((res) => (res.ok ? res.json() : Promise.reject(res.status)))
+      .then(setData)
+      .catch(() => setError("Failed to load dashboard."));
+  }, []);
+
   return (
     <Box>
       <Typography variant="h4" gutterBottom>
         Welcome to the Employee Management System
       </Typography>
-      <Typography variant="body1">
-        Select a module from the sidebar to get started.
-      </Typography>
+      {error && <Alert severity="error" sx={{ mb: 2 }}>{error}</Alert>}
+      {!data ? (
+        <Typography variant="body1">
+          Select a module from the sidebar to get started.
+        </Typography>
+      ) : (
+        <Grid container spacing={2}>
+          {data.attendance && (
+            <Section title={`Attendance today (${data.attendance.date})`}>
+              <Typography>
+                Present: {data.attendance.present} · Late: {data.attendance.late} · Absent: {data.attendance.absent}
+              </Typography>
+            </Section>
+          )}
+          {data.leaves && (
+            <Section title="Pending leave requests">
+              <Typography>{data.leaves.pending} pending</Typography>
+              {data.leaves.recent.map((l) => (
+                <Typography key={l.id} variant="body2">
+                  Employee {l.employee_id}: {l.type}, {l.start_date} to {l.end_date}
+                </Typography>
+              ))}
+            </Section>
+          )}
+          {data.tasks && (
+            <Section title="Open tasks">
+              <Typography>{data.tasks.open} open</Typography>
+              {Object.entries(data.tasks.by_status).map(([status, count]) => (
+                <Typography key={status} variant="body2">
+                  {status}: {count}
+                </Typography>
+              ))}
+            </Section>
+          )}
+          {data.documents && (
+            <Section title="Documents">
+              <Typography>
+                {data.documents.expired} expired · {data.documents.expiring} expiring within {data.documents.expiring_within_days} days
+              </Typography>
+              {data.documents.soonest.map((d) => (
+                <Typography key={d.id} variant="body2">
+                  {d.category} (employee {d.employee_id}): {d.expiry_date}
+                </Typography>
+              ))}
+            </Section>
+          )}
+          {data.notifications && (
+            <Section title="Notifications">
+              <Typography>{data.notifications.count} notifications</Typography>
+              {data.notifications.recent.map((n) => (
+                <Typography key={n.id} variant="body2">
+                  {new Date(n.timestamp + "Z").toLocaleString()}: {n.message}
+                </Typography>
+              ))}
+            </Section>
+          )}
+        </Grid>
+      )}
     </Box>
   );
 }
 
-export default Dashboard;
\ No newline at end of file
+export default Dashboard;
@@ -50,11 +50,8 @@ function LoginPage() {
       await new Promise((res) => setTimeout(res, 1000));
       // Simulate successful login and token
       const mockToken = "mock_token_123";
-      if (rememberMe) {
-        localStorage.setItem("access_token", mockToken);
-      } else {
-        sessionStorage.setItem("access_token", mockToken);
-      }
+      const storage = rememberMe ? localStorage : sessionStorage;
+      storage.setItem("access_token", mockToken);
       setEmail("");
       setPassword("");
       setFieldErrors({});
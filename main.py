@@ -1,24 +1,69 @@
+# First, so the import cost of everything below is measured
+from app.importtime import startup_timer
 from fastapi import FastAPI, HTTPException
 from app.auth.routes import router as auth_router
 from app.employee.routes import router as employee_router
+from app.users.routes import router as users_router
 from app.attendance.routes import router as attendance_router
 from app.leave.routes import router as leave_router
 from app.payroll.routes import router as payroll_router
 from app.tasks.routes import router as tasks_router
+from app.reports.routes import router as reports_router
+from app.reports.jobs import report_jobs
+from app.dashboard.routes import router as dashboard_router
+from app.changes.routes import router as changes_router
+from app.documents.routes import router as documents_router, load_expiry_index
+from app.metrics import MetricsMiddleware, register_gauge, render as render_metrics
+from app.notifications.logic import notification_db
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import Database
-from fastapi.responses import JSONResponse
+from app.database import MONGO_RECONNECT_ATTEMPTS, Database
+from app.auth.hashing import password_hasher
+from app.repository import REPOSITORY_BACKEND, ensure_repository_indexes
+from app.persistence import persistence
+from app.serialization import FAST_SERIALIZATION, FastJSONResponse
+from app.profiling.profiler import PROFILING_ENABLED, ProfilingMiddleware, request_profiler
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.requests import Request
 
-app = FastAPI(title="Human-Centered Employee Management System", version="1.0.0")
+startup_timer.imports_done()
+
+app = FastAPI(
+    title="Human-Centered Employee Management System",
+    version="1.0.0",
+    default_response_class=FastJSONResponse if FAST_SERIALIZATION else JSONResponse,
+)
+
+async def prepare_repositories():
+    await ensure_repository_indexes()
+    if persistence is not None:
+        persistence.start()
+    await load_expiry_index()
 
 @app.on_event("startup")
 async def startup_db_client():
-    await Database.connect_db()
+    report_jobs.start()
+    if REPOSITORY_BACKEND == "mongo":
+        # Records live in Mongo, so wait for it; if it is unreachable, start
+        # anyway (requests needing it get 503) and finish setup once it is back
+        try:
+            await Database.connect_db()
+        except Exception:
+            Database.connect_in_background(on_connect=prepare_repositories)
+        else:
+            await prepare_repositories()
+    else:
+        # Only authentication needs Mongo: do not hold up startup for it
+        Database.connect_in_background(give_up_after=MONGO_RECONNECT_ATTEMPTS)
+        await prepare_repositories()
+    startup_timer.startup_done()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
     await Database.close_db()
+    password_hasher.shutdown()
+    report_jobs.shutdown()
+    if persistence is not None:
+        persistence.stop()
 
 @app.middleware("http")
 async def db_session_middleware(request: Request, call_next):
@@ -41,11 +86,40 @@ app.add_middleware(
 
 app.include_router(auth_router)
 app.include_router(employee_router)
+app.include_router(users_router)
 app.include_router(attendance_router)
 app.include_router(leave_router)
 app.include_router(payroll_router)
 app.include_router(tasks_router)
+app.include_router(reports_router)
+app.include_router(dashboard_router)
+app.include_router(changes_router)
+app.include_router(documents_router)
+
+# Off by default; when off nothing is installed, so it costs nothing
+if PROFILING_ENABLED:
+    from app.profiling.routes import router as profiling_router
+    app.include_router(profiling_router)
+    app.add_middleware(ProfilingMiddleware, profiler=request_profiler)
+
+# Outermost, so the latency covers every other middleware
+app.add_middleware(MetricsMiddleware, prefixes={r.prefix for r in (
+    auth_router, employee_router, users_router, attendance_router, leave_router, payroll_router,
+    tasks_router, reports_router, dashboard_router, changes_router, documents_router,
+)})
+
+register_gauge("ems_notifications_stored", "Notifications held in memory.", lambda: len(notification_db))
+register_gauge("ems_password_hash_pending", "Password hash/verify calls queued or running.", lambda: password_hasher.stats()["pending"])
+register_gauge("ems_report_jobs_queued", "Export jobs waiting for a worker process.", lambda: report_jobs.stats()["queued"])
+register_gauge("ems_report_jobs_running", "Export jobs being rendered.", lambda: report_jobs.stats()["running"])
+register_gauge("ems_mongo_pool_checked_out", "Mongo connections in use.", lambda: Database.pool_stats()["checked_out"])
+register_gauge("ems_startup_seconds", "Time from importing main to the end of startup.", lambda: startup_timer.startup_seconds or 0)
+register_gauge("ems_mongo_pool_open_connections", "Open Mongo connections.", lambda: Database.pool_stats()["open_connections"])
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Welcome to the Human-Centered Employee Management System API"}
\ No newline at end of file